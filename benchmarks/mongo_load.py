@@ -0,0 +1,217 @@
+"""Load test for the MongoDB CRUD page's query paths on a seeded ``users`` collection.
+
+Seeds synthetic users through the page's own import path (validation, search and geo
+fields, ``insert_many`` batches), then times the calls each tab makes - browse pages,
+ranked search, manage selector, metrics, map and compare-and-set updates - and reports
+per-path p50/p95 latency as JSON.  Runs against a real server or the in-process
+mongomock stand-in (see ``mongo_client.backend_name``).  mongomock scans instead of using
+indexes, so its numbers only track query-pattern regressions; size the pool and indexes
+against a real server.
+
+    python -m benchmarks.mongo_load --users 100000 --output mongo.json
+    python -m benchmarks.mongo_load --backend mongodb --host localhost --users 1000000 --compare mongo.json
+"""
+
+import argparse
+import json
+import random
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from benchmarks.rag_bench import git_revision, percentiles
+from gazetteer import PROVINCES
+from mongo_client import backend_name, client_options, create_client
+from mongo_users import (
+    COUNT_LIMIT,
+    PAGE_SIZE,
+    UserConflict,
+    build_filter,
+    city_summary,
+    count_users,
+    ensure_indexes,
+    ensure_schema,
+    fetch_page,
+    find_choices,
+    geo_points,
+    get_user,
+    import_users,
+    search_tiers,
+    summary_stats,
+    update_user,
+)
+
+FIRST_NAMES = ["Somchai", "Somsak", "Suda", "Malee", "Anan", "Kanya", "Niran", "Pim", "Arthit", "Ploy",
+               "สมชาย", "สมศักดิ์", "สุดา", "มาลี", "อนันต์", "กันยา", "นิรันดร์", "พิม", "อาทิตย์", "พลอย"]
+LAST_NAMES = ["Srisuk", "Boonmee", "Chaiyaporn", "Wongsa", "Rattana", "Saetang", "Kaewmanee", "Thongdee",
+              "ศรีสุข", "บุญมี", "ชัยพร", "วงศา", "รัตนา", "แซ่ตั้ง", "แก้วมณี", "ทองดี"]
+# how cities are typed in practice: English, Thai, aliases, a few the gazetteer cannot place
+CITY_SPELLINGS = [city for name, name_th, _lat, _lon, aliases in PROVINCES for city in (name, name_th, *aliases)]
+UNKNOWN_CITIES = ["Vientiane", "Singapore", "-"]
+
+
+def synthetic_users(count: int, seed: int) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """(row number, record) in the shape ``import_users`` takes from an upload."""
+    rng = random.Random(seed)
+    for row_no in range(1, count + 1):
+        city = rng.choice(UNKNOWN_CITIES) if rng.random() < 0.02 else rng.choice(CITY_SPELLINGS)
+        yield row_no, {
+            "name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {row_no}",
+            "age": rng.randint(0, 120),
+            "city": city,
+        }
+
+
+def search_terms(rng: random.Random, n: int) -> List[Tuple[str, Optional[str]]]:
+    """(term, province filter) pairs like the browse tab sends: names, prefixes, cities, Thai, misses."""
+    terms: List[Tuple[str, Optional[str]]] = []
+    for _ in range(n):
+        kind = rng.randrange(5)
+        if kind == 0:
+            terms.append((rng.choice(FIRST_NAMES), None))
+        elif kind == 1:
+            terms.append((rng.choice(FIRST_NAMES)[:3], None))
+        elif kind == 2:
+            terms.append((f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)[:2]}", None))
+        elif kind == 3:
+            terms.append(("", rng.choice(PROVINCES)[0]))
+        else:
+            terms.append(("zzz-no-match", None))
+    return terms
+
+
+def timed(timings: Dict[str, List[float]], path: str, fn, *args, **kwargs):
+    t0 = time.perf_counter()
+    result = fn(*args, **kwargs)
+    timings.setdefault(path, []).append((time.perf_counter() - t0) * 1000)
+    return result
+
+
+def seed_users(collection, users: int, seed: int, batch_size: int) -> Dict[str, Any]:
+    collection.drop()
+    schema = ensure_schema(collection)
+    ensure_indexes(collection)
+    t0 = time.perf_counter()
+    report = import_users(collection, synthetic_users(users, seed), batch_size=batch_size)
+    seconds = time.perf_counter() - t0
+    return {
+        "users": report["inserted"],
+        "rejected": len(report["errors"]),
+        "seconds": round(seconds, 3),
+        "docs_per_s": round(report["inserted"] / seconds, 1) if seconds else None,
+        "schema_validator": schema,
+    }
+
+
+def run_benchmark(collection, repeats: int = 50, browse_pages: int = 20, seed: int = 0) -> Dict[str, Any]:
+    rng = random.Random(seed)
+    timings: Dict[str, List[float]] = {}
+
+    # browse tab: first page + count, then walk forward with the keyset cursor
+    for _ in range(max(1, repeats // browse_pages)):
+        cursor = None
+        for page_no in range(browse_pages):
+            docs, cursor = timed(timings, "browse_page", fetch_page, collection, search_tiers(), after=cursor, limit=PAGE_SIZE)
+            if page_no == 0:
+                timed(timings, "browse_count", count_users, collection, {})
+            if cursor is None:
+                break
+
+    # search box (+ the filtered count under the table) and the manage selector
+    for term, province in search_terms(rng, repeats):
+        timed(timings, "search_page", fetch_page, collection, search_tiers(term, province), limit=PAGE_SIZE)
+        timed(timings, "search_count", count_users, collection, build_filter(term, province), limit=COUNT_LIMIT)
+        timed(timings, "manage_choices", find_choices, collection, term)
+
+    # metrics and map: the $group snapshot LiveSummary takes, then the page-side folds
+    for _ in range(max(1, repeats // 5)):
+        summary = timed(timings, "summary_pipeline", city_summary, collection)
+        timed(timings, "stats", summary_stats, summary)
+        timed(timings, "map_points", geo_points, summary)
+
+    # manage tab: load one user, save it with compare-and-set; every 10th save races a stale version
+    sample = [doc["_id"] for doc in collection.aggregate([{"$sample": {"size": repeats}}, {"$project": {"_id": 1}}])]
+    conflicts = 0
+    for i, user_id in enumerate(sample):
+        doc = timed(timings, "get_user", get_user, collection, user_id)
+        if doc is None:
+            continue
+        version = doc.get("version", 0) - (1 if i % 10 == 9 else 0)
+        try:
+            timed(timings, "update_cas", update_user, collection, user_id, version, doc["name"], doc["age"], doc["city"])
+        except UserConflict:
+            conflicts += 1
+
+    return {
+        "revision": git_revision(),
+        "users": count_users(collection, {}),
+        "repeats": repeats,
+        "conflicts": conflicts,
+        "latency": {path: percentiles(samples) for path, samples in timings.items()},
+    }
+
+
+def compare(current: Dict[str, Any], previous: Dict[str, Any]) -> List[str]:
+    lines = [f"Compare {previous.get('revision') or '?'} -> {current.get('revision') or '?'}"]
+    for path, stats in current["latency"].items():
+        before = previous.get("latency", {}).get(path)
+        if before:
+            lines.append(
+                f"  {path:<16} p50 {before['p50_ms']:.3f} -> {stats['p50_ms']:.3f} ms | "
+                f"p95 {before['p95_ms']:.3f} -> {stats['p95_ms']:.3f} ms"
+            )
+    return lines
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backend", choices=["mongodb", "mongomock"], default="mongomock")
+    parser.add_argument("--host", default="localhost", help="MongoDB host or mongodb:// URI (mongodb backend)")
+    parser.add_argument("--port", type=int, default=27017)
+    parser.add_argument("--db", default="test_db")
+    parser.add_argument("--collection", default="users_load", help="dropped and re-seeded unless --no-seed")
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--no-seed", action="store_true", help="reuse the collection as it is")
+    parser.add_argument("--repeats", type=int, default=50)
+    parser.add_argument("--browse-pages", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, help="write JSON results here")
+    parser.add_argument("--compare", type=Path, help="previous JSON results to diff against")
+    args = parser.parse_args(argv)
+
+    options = client_options({"backend": args.backend, "host": args.host, "port": args.port})
+    backend = backend_name(options)
+    collection = create_client(options)[args.db][args.collection]
+    if backend == "mongomock" and args.no_seed:
+        parser.error("--no-seed needs a real server: the mongomock collection starts empty")
+
+    seeding = None
+    if not args.no_seed:
+        print(f"seeding {args.users:,} users into {args.db}.{args.collection} ({backend}) ...")
+        seeding = seed_users(collection, args.users, args.seed, args.batch_size)
+    else:
+        ensure_indexes(collection)
+
+    result = run_benchmark(collection, repeats=args.repeats, browse_pages=args.browse_pages, seed=args.seed)
+    result["backend"] = backend
+    result["seeding"] = seeding
+
+    print(f"revision: {result['revision'] or '-'}  backend: {backend}  users: {result['users']:,}")
+    if seeding:
+        print(f"  seeded in {seeding['seconds']:.1f} s ({seeding['docs_per_s']:,.0f} docs/s, {seeding['rejected']} rejected)")
+    print(f"  update conflicts (expected every 10th): {result['conflicts']}")
+    for path, stats in result["latency"].items():
+        print(f"  {path:<16} p50 {stats['p50_ms']:>9.3f} ms   p95 {stats['p95_ms']:>9.3f} ms")
+
+    if args.compare:
+        previous = json.loads(args.compare.read_text(encoding="utf-8"))
+        print("\n".join(compare(result, previous)))
+    if args.output:
+        args.output.write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"wrote {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
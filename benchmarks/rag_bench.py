@@ -0,0 +1,214 @@
+"""Offline quality + latency benchmark for the AI assistant retrieval pipeline.
+
+Replays a fixed question set through the same stages the page runs
+(build_corpus -> HybridIndex -> search -> build_messages -> LLM) with a stub model, then
+reports recall@k, MRR and per-stage p50/p95 latency as JSON.
+
+    python -m benchmarks.rag_bench --output bench.json
+    python -m benchmarks.rag_bench --compare bench.json
+"""
+
+import argparse
+import json
+import subprocess
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from ollama_pool import OllamaPool
+from rag_pipeline import (
+    HybridIndex,
+    add_snippets,
+    build_corpus,
+    build_messages,
+    chunk_text,
+    clean_invoice,
+    clean_project,
+)
+
+ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_WORKBOOK = ROOT / "BI Project status_Prototype-2.xlsx"
+DEFAULT_QUESTIONS = Path(__file__).resolve().parent / "rag_questions.json"
+
+
+class StubChatClient:
+    """Stands in for ``ollama.Client``: streams the user prompt back word by word."""
+
+    def chat(self, model: str, messages: List[Dict[str, str]], stream: bool = True, **_: Any):
+        for word in messages[-1]["content"].split()[:200]:
+            yield {"message": {"content": word + " "}}
+
+    def generate(self, **_: Any) -> None:
+        return None
+
+
+def doc_key(doc: Dict[str, Any]) -> Tuple[str, Optional[int]]:
+    row = doc.get("row")
+    return doc["source"], None if row is None else int(row)
+
+
+def recall_at_k(ranked: List[Dict[str, Any]], expected: Iterable[Tuple[str, Optional[int]]], k: int) -> float:
+    expected = set(expected)
+    if not expected:
+        return 1.0
+    hits = {doc_key(d) for d in ranked[:k]} & expected
+    return len(hits) / len(expected)
+
+
+def reciprocal_rank(ranked: List[Dict[str, Any]], expected: Iterable[Tuple[str, Optional[int]]]) -> float:
+    expected = set(expected)
+    for pos, doc in enumerate(ranked, 1):
+        if doc_key(doc) in expected:
+            return 1.0 / pos
+    return 0.0
+
+
+def percentiles(samples_ms: List[float]) -> Dict[str, float]:
+    arr = np.asarray(samples_ms, dtype=float)
+    return {
+        "p50_ms": round(float(np.percentile(arr, 50)), 3),
+        "p95_ms": round(float(np.percentile(arr, 95)), 3),
+        "n": int(arr.size),
+    }
+
+
+def git_revision() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True)
+        return out.stdout.strip() or None
+    except Exception:  # noqa: BLE001
+        return None
+
+
+def load_frames(workbook: Path) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    book = pd.ExcelFile(workbook)
+    project_df = add_snippets(clean_project(book.parse("Project")), "project")
+    invoice_df = add_snippets(clean_invoice(book.parse("Invoice")), "invoice")
+    return project_df, invoice_df
+
+
+def run_benchmark(
+    questions: List[Dict[str, Any]],
+    project_df: pd.DataFrame,
+    invoice_df: pd.DataFrame,
+    pmbok_chunks: List[str],
+    top_k: int = 8,
+    repeats: int = 5,
+) -> Dict[str, Any]:
+    pool = OllamaPool(client=StubChatClient(), max_concurrent=1)
+    timings: Dict[str, List[float]] = {"corpus": [], "index": [], "rank": [], "prompt": [], "llm": [], "total": []}
+    per_question = []
+
+    for q in questions:
+        expected = [(e["source"], e.get("row")) for e in q.get("expected", [])]
+        ranked: List[Dict[str, Any]] = []
+        for _ in range(max(1, repeats)):
+            t0 = time.perf_counter()
+            corpus = build_corpus(project_df, invoice_df, q.get("domain", "both"), bool(pmbok_chunks), pmbok_chunks)
+            t1 = time.perf_counter()
+            index = HybridIndex(corpus)
+            t_index = time.perf_counter()
+            ranked = index.search(q["question"], top_k=top_k)
+            t2 = time.perf_counter()
+            messages = build_messages(q["question"], ranked)
+            t3 = time.perf_counter()
+            "".join(pool.stream_chat(messages))
+            t4 = time.perf_counter()
+            timings["corpus"].append((t1 - t0) * 1000)
+            timings["index"].append((t_index - t1) * 1000)
+            timings["rank"].append((t2 - t_index) * 1000)
+            timings["prompt"].append((t3 - t2) * 1000)
+            timings["llm"].append((t4 - t3) * 1000)
+            timings["total"].append((t4 - t0) * 1000)
+        per_question.append(
+            {
+                "id": q["id"],
+                "lang": q.get("lang"),
+                f"recall@{top_k}": round(recall_at_k(ranked, expected, top_k), 4),
+                "rr": round(reciprocal_rank(ranked, expected), 4),
+                "retrieved": [list(doc_key(d)) for d in ranked],
+            }
+        )
+
+    def mean_of(key: str, rows: List[Dict[str, Any]]) -> float:
+        return round(float(np.mean([r[key] for r in rows])) if rows else 0.0, 4)
+
+    quality = {f"recall@{top_k}": mean_of(f"recall@{top_k}", per_question), "mrr": mean_of("rr", per_question)}
+    for lang in sorted({r["lang"] for r in per_question if r["lang"]}):
+        rows = [r for r in per_question if r["lang"] == lang]
+        quality[lang] = {f"recall@{top_k}": mean_of(f"recall@{top_k}", rows), "mrr": mean_of("rr", rows)}
+
+    return {
+        "revision": git_revision(),
+        "top_k": top_k,
+        "repeats": repeats,
+        "rows": {"project": int(len(project_df)), "invoice": int(len(invoice_df)), "pmbok_chunks": len(pmbok_chunks)},
+        "quality": quality,
+        "latency": {stage: percentiles(samples) for stage, samples in timings.items()},
+        "questions": per_question,
+    }
+
+
+def compare(current: Dict[str, Any], previous: Dict[str, Any]) -> List[str]:
+    lines = [f"Compare {previous.get('revision') or '?'} -> {current.get('revision') or '?'}"]
+    for key, value in current["quality"].items():
+        if isinstance(value, dict):
+            continue
+        before = previous.get("quality", {}).get(key)
+        if before is not None:
+            lines.append(f"  {key:<12} {before:.4f} -> {value:.4f} ({value - before:+.4f})")
+    for stage, stats in current["latency"].items():
+        before = previous.get("latency", {}).get(stage)
+        if before:
+            lines.append(
+                f"  {stage:<12} p50 {before['p50_ms']:.3f} -> {stats['p50_ms']:.3f} ms | "
+                f"p95 {before['p95_ms']:.3f} -> {stats['p95_ms']:.3f} ms"
+            )
+    return lines
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--questions", type=Path, default=DEFAULT_QUESTIONS)
+    parser.add_argument("--workbook", type=Path, default=DEFAULT_WORKBOOK)
+    parser.add_argument("--pmbok-text", type=Path, help="plain-text dump of the PMBOK PDF to include as chunks")
+    parser.add_argument("--top-k", type=int, default=8)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--output", type=Path, help="write JSON results here")
+    parser.add_argument("--compare", type=Path, help="previous JSON results to diff against")
+    args = parser.parse_args(argv)
+
+    questions = json.loads(args.questions.read_text(encoding="utf-8"))
+    project_df, invoice_df = load_frames(args.workbook)
+
+    pmbok_chunks: List[str] = []
+    chunk_ms = None
+    if args.pmbok_text:
+        t0 = time.perf_counter()
+        pmbok_chunks = chunk_text(args.pmbok_text.read_text(encoding="utf-8"))
+        chunk_ms = round((time.perf_counter() - t0) * 1000, 3)
+
+    result = run_benchmark(questions, project_df, invoice_df, pmbok_chunks, top_k=args.top_k, repeats=args.repeats)
+    if chunk_ms is not None:
+        result["latency"]["chunking_once"] = {"p50_ms": chunk_ms, "p95_ms": chunk_ms, "n": 1}
+
+    print(f"revision: {result['revision'] or '-'}  questions: {len(questions)}  top_k: {args.top_k}")
+    for key, value in result["quality"].items():
+        print(f"  {key}: {value}")
+    for stage, stats in result["latency"].items():
+        print(f"  {stage:<14} p50 {stats['p50_ms']:>9.3f} ms   p95 {stats['p95_ms']:>9.3f} ms")
+
+    if args.compare:
+        previous = json.loads(args.compare.read_text(encoding="utf-8"))
+        print("\n".join(compare(result, previous)))
+    if args.output:
+        args.output.write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"wrote {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,388 @@
+"""CSV loading shared by the Analytics page and the headless rule runner.
+
+Separator and encoding are sniffed from a few blocks spread over the file (UTF-8,
+Thai cp874/TIS-620, BOMs), then files are parsed with pyarrow's multithreaded reader
+and only the columns a rule-set references are materialised.  Inputs above ``CHUNKED_THRESHOLD_BYTES`` (or when pyarrow
+is missing / cannot parse the file) are streamed through pandas in ``CHUNK_ROWS`` pieces,
+so peak memory is the raw bytes plus the selected columns rather than the full frame.
+
+``load_typed`` is the loader for whole-file views (the CSV visualizer): explicit text and
+category dtypes, and datetime parsing only for columns whose sample looks like dates.
+"""
+
+import codecs
+import csv
+import re
+import warnings
+from collections import Counter
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import pandas as pd
+
+SEPARATOR_CHOICES = [",", ";", "\t", "|", ":"]
+# Thai Excel/ERP exports are usually cp874 (a superset of TIS-620) rather than UTF-8
+ENCODING_CHOICES = ["utf-8", "utf-8-sig", "cp874", "utf-16", "latin-1"]
+
+SNIFF_BLOCK_BYTES = 16 * 1024
+SNIFF_BLOCKS = 4
+
+CHUNKED_THRESHOLD_BYTES = 256 * 1024 * 1024
+CHUNK_ROWS = 250_000
+
+# pandas' default NA markers, so the arrow reader yields the same NaNs as read_csv
+NA_VALUES = [
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+    "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+]
+
+DATETIME_SAMPLE_ROWS = 200
+DATETIME_MIN_VALID = 0.85
+# 2017-02-01, 01/02/2017, 1.2.17, Feb 1, 2017, 1 Feb 2017 - cheap screen before any parsing
+_DATE_LIKE = re.compile(
+    r"^\s*(?:\d{1,4}[-/.]\d{1,2}[-/.]\d{1,4}|[A-Za-z]{3,9}\.? \d{1,2},? \d{2,4}|\d{1,2} [A-Za-z]{3,9}\.? \d{2,4})(?:[ T]\d|\s*$)"
+)
+
+Source = Union[bytes, str, Path]
+
+
+def _head_bytes(source: Source, size: int = 65536) -> bytes:
+    if isinstance(source, bytes):
+        return source[:size]
+    with open(source, "rb") as fh:
+        return fh.read(size)
+
+
+def sample_blocks(source: Source, block_size: int = SNIFF_BLOCK_BYTES, blocks: int = SNIFF_BLOCKS) -> List[bytes]:
+    """Head, evenly spaced middle blocks and tail of the file, cut to whole lines.
+
+    A wide header or a few odd first rows then can't decide the delimiter/encoding alone,
+    and only ``blocks * block_size`` bytes are read however large the file is.
+    """
+    size = _source_size(source)
+    if size <= block_size * blocks:
+        return [_head_bytes(source, size)]
+    out = []
+    with BytesIO(source) if isinstance(source, bytes) else open(source, "rb") as fh:
+        for i in range(blocks):
+            start = i * (size - block_size) // (blocks - 1)
+            fh.seek(start)
+            block = fh.read(block_size)
+            if start > 0:
+                block = block[block.find(b"\n") + 1 :]  # drop the partial first line
+            if start + block_size < size:
+                block = block[: block.rfind(b"\n") + 1]  # and the partial last one
+            if block:
+                out.append(block)
+    return out or [_head_bytes(source, block_size)]
+
+
+def detect_encoding(blocks: List[bytes]) -> str:
+    """BOM, else strict UTF-8 over every block, else cp874 (Thai), else latin-1 (never fails)."""
+    head = blocks[0] if blocks else b""
+    if head.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return "utf-16"
+    for encoding in ("utf-8", "cp874"):
+        try:
+            for block in blocks:
+                # not final: an uncut block (no newline in it) may end inside a multi-byte char
+                codecs.getincrementaldecoder(encoding)().decode(block, final=False)
+        except UnicodeDecodeError:
+            continue
+        return encoding
+    return "latin-1"
+
+
+def _field_counts(text: str, sep: str) -> Counter:
+    lines = [line for line in text.splitlines() if line.strip()]
+    return Counter(len(row) for row in csv.reader(lines, delimiter=sep))
+
+
+def _separator_score(texts: List[str], sep: str) -> Tuple[float, int]:
+    """(share of lines with the most common field count, that count); needs the same count in every block."""
+    modes = []
+    agree = total = 0
+    for text in texts:
+        counts = _field_counts(text, sep)
+        if not counts:
+            continue
+        width, n = counts.most_common(1)[0]
+        modes.append(width)
+        agree += n
+        total += sum(counts.values())
+    if not modes or len(set(modes)) > 1 or modes[0] < 2:
+        return 0.0, 0
+    return agree / total, modes[0]
+
+
+def detect_separator(file_bytes: bytes, encoding: Optional[str] = None) -> str:
+    """ลองเดา delimiter จากหลายช่วงของไฟล์ (ต้นไฟล์ กลางไฟล์ ท้ายไฟล์)"""
+    return sniff_format(file_bytes, encoding)[0]
+
+
+def sniff_format(source: Source, encoding: Optional[str] = None) -> Tuple[str, str]:
+    """(separator, encoding) of a CSV from a few sampled blocks.
+
+    Every candidate delimiter is parsed with ``csv`` (so quoted delimiters don't count);
+    the winner gives the same field count on most lines of every block, ties going to
+    the ``SEPARATOR_CHOICES`` order.  Falls back to "," like before.
+    """
+    blocks = sample_blocks(source)
+    encoding = encoding or detect_encoding(blocks)
+    if encoding.startswith("utf-16"):
+        # newline cuts are byte-based, so only the head block is aligned for UTF-16
+        blocks = [blocks[0][: len(blocks[0]) // 2 * 2]]
+    texts = [block.decode(encoding, errors="replace").lstrip("\ufeff") for block in blocks]
+    best, best_score = ",", (0.0, 0)
+    for sep in SEPARATOR_CHOICES:
+        if not any(sep in text for text in texts):
+            continue
+        score = _separator_score(texts, sep)
+        if score > best_score:
+            best, best_score = sep, score
+    return best, encoding
+
+
+def _source_size(source: Source) -> int:
+    return len(source) if isinstance(source, bytes) else Path(source).stat().st_size
+
+
+def _open(source: Source):
+    return BytesIO(source) if isinstance(source, bytes) else source
+
+
+def referenced_columns(steps: Iterable[dict], file_label: str) -> List[Any]:
+    """Columns of ``file_label`` that any step reads (keyword column(s) + value column), in first-use order."""
+    cols: List[Any] = []
+    for step in steps:
+        for side in ("source", "target"):
+            cfg = step[side]
+            if cfg["file_label"] != file_label:
+                continue
+            keys = cfg["filter"].get("keyword_column")
+            keys = list(keys) if isinstance(keys, (list, tuple)) else [keys]
+            for col in (*keys, cfg.get("value_column")):
+                if col is not None and col not in cols:
+                    cols.append(col)
+    return cols
+
+
+def _whole_lines(head: bytes, encoding: str) -> bytes:
+    """``head`` cut after its last line end (UTF-16 line ends are two bytes)."""
+    if encoding.startswith("utf-16"):
+        newline = b"\x00\n" if head.startswith(codecs.BOM_UTF16_BE) else b"\n\x00"
+        end = head.rfind(newline)
+        return head[: end + 2] if end >= 0 and end % 2 == 0 else head[: len(head) // 2 * 2]
+    return head[: head.rfind(b"\n") + 1] or head
+
+
+def _resolve(source: Source, sep: Optional[str], encoding: Optional[str]) -> Tuple[str, str]:
+    if sep and encoding:
+        return sep, encoding
+    sniffed_sep, sniffed_encoding = sniff_format(source, encoding)
+    return sep or sniffed_sep, encoding or sniffed_encoding
+
+
+def read_columns(source: Source, sep: Optional[str] = None, header: bool = True, encoding: Optional[str] = None) -> List[Any]:
+    """Column names only (header row, or 0..n-1 without one); reads just the first block."""
+    sep, encoding = _resolve(source, sep, encoding)
+    head = _whole_lines(_head_bytes(source), encoding)
+    df = pd.read_csv(BytesIO(head), sep=sep, header=0 if header else None, nrows=1, encoding=encoding)
+    return list(df.columns)
+
+
+def preview_frame(
+    source: Source, sep: Optional[str] = None, header: bool = True, rows: int = 5, encoding: Optional[str] = None
+) -> pd.DataFrame:
+    sep, encoding = _resolve(source, sep, encoding)
+    return pd.read_csv(_open(source), sep=sep, header=0 if header else None, nrows=rows, encoding=encoding)
+
+
+def _read_arrow(source: Source, sep: str, header: bool, usecols: Optional[Sequence[Any]], encoding: str) -> pd.DataFrame:
+    import pyarrow as pa
+    from pyarrow import csv as pa_csv
+
+    names = None
+    if not header:
+        # pyarrow names headerless columns f0, f1, ...; map back to pandas' 0, 1, ...
+        names = [f"f{c}" for c in usecols] if usecols is not None else None
+    # arrow skips a UTF-8 BOM itself and transcodes anything else while reading
+    read_opts = pa_csv.ReadOptions(
+        autogenerate_column_names=not header,
+        encoding="utf8" if encoding in ("utf-8", "utf-8-sig") else encoding,
+    )
+    parse_opts = pa_csv.ParseOptions(delimiter=sep)
+    include = names if not header else (list(usecols) if usecols is not None else None)
+
+    # arrow turns ISO-looking text into timestamps; the C engine keeps it as text, and the
+    # rule engine matches keys on that text.  Spot such columns on a head sample first.
+    head = _whole_lines(_head_bytes(source), encoding)
+    sample = pa_csv.read_csv(
+        BytesIO(head),
+        read_options=read_opts,
+        parse_options=parse_opts,
+        convert_options=pa_csv.ConvertOptions(include_columns=include, null_values=NA_VALUES, strings_can_be_null=True),
+    )
+    as_text = {
+        field.name: pa.string()
+        for field in sample.schema
+        if pa.types.is_temporal(field.type) or pa.types.is_null(field.type)
+    }
+    table = pa_csv.read_csv(
+        _open(source),
+        read_options=read_opts,
+        parse_options=parse_opts,
+        convert_options=pa_csv.ConvertOptions(
+            include_columns=include,
+            column_types=as_text,
+            null_values=NA_VALUES,
+            strings_can_be_null=True,
+        ),
+    )
+    df = table.to_pandas()
+    if not header:
+        df.columns = [int(str(c)[1:]) for c in df.columns]
+    return df
+
+
+def _read_chunked(source: Source, sep: str, header: bool, usecols: Optional[Sequence[Any]], encoding: str) -> pd.DataFrame:
+    chunks = pd.read_csv(
+        _open(source),
+        sep=sep,
+        encoding=encoding,
+        header=0 if header else None,
+        usecols=list(usecols) if usecols is not None else None,
+        chunksize=CHUNK_ROWS,
+    )
+    parts = list(chunks)
+    return pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=list(usecols or []))
+
+
+def load_frame(
+    source: Source,
+    sep: Optional[str] = None,
+    header: bool = True,
+    usecols: Optional[Sequence[Any]] = None,
+    index_col: Any = None,
+    chunked_threshold: int = CHUNKED_THRESHOLD_BYTES,
+    encoding: Optional[str] = None,
+) -> pd.DataFrame:
+    """Load ``source`` (raw bytes or a path) keeping only ``usecols`` (all columns when None).
+
+    Column order follows the file, like ``pd.read_csv(usecols=...)``.  ``index_col`` is
+    added to the selection and set as index with the column kept, as the page does.
+    Separator / encoding are sniffed when not given (see ``sniff_format``).
+    """
+    sep, encoding = _resolve(source, sep, encoding)
+    if usecols is not None:
+        wanted = list(dict.fromkeys([*usecols, *([index_col] if index_col is not None else [])]))
+        present = read_columns(source, sep, header, encoding)
+        usecols = [c for c in present if c in wanted]
+
+    df = None
+    if _source_size(source) <= chunked_threshold:
+        try:
+            df = _read_arrow(source, sep, header, usecols, encoding)
+        except Exception:  # noqa: BLE001 - no pyarrow / quoting arrow rejects: the C engine copes
+            df = None
+    if df is None:
+        df = _read_chunked(source, sep, header, usecols, encoding)
+    if usecols is not None:
+        df = df[usecols]
+    if index_col is not None:
+        df = df.set_index(index_col, drop=False)
+    return df
+
+
+def read_csv_bytes(
+    file_bytes: bytes, sep: Optional[str] = None, header: bool = True, index_col: Any = None, encoding: Optional[str] = None
+) -> pd.DataFrame:
+    """Read like the page does: detected/explicit separator and encoding, optional header, index kept as a column."""
+    return load_frame(file_bytes, sep=sep, header=header, index_col=index_col, encoding=encoding)
+
+
+def read_csv_path(
+    path: Union[str, Path],
+    sep: Optional[str] = None,
+    header: bool = True,
+    index_col: Any = None,
+    usecols: Optional[Sequence[Any]] = None,
+    encoding: Optional[str] = None,
+) -> pd.DataFrame:
+    return load_frame(Path(path), sep=sep, header=header, usecols=usecols, index_col=index_col, encoding=encoding)
+
+
+# -----------------------------
+# Typed loading
+# -----------------------------
+def _datetime_format(sample: pd.Series) -> Optional[str]:
+    """Most common strftime format pandas guesses for the sample values (None if it can't)."""
+    from pandas.tseries.api import guess_datetime_format
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")  # "parsing in %d/%m/%Y format when dayfirst=False"
+        guesses = Counter(guess_datetime_format(str(v)) for v in sample)
+    guesses.pop(None, None)
+    return guesses.most_common(1)[0][0] if guesses else None
+
+
+def datetime_columns(df: pd.DataFrame, sample_rows: int = DATETIME_SAMPLE_ROWS) -> Dict[Any, Optional[str]]:
+    """``{column: format}`` for text columns whose non-null sample mostly looks like dates.
+
+    Only the sample is examined, so names, addresses and phone numbers cost a regex over
+    ``sample_rows`` values instead of a full ``to_datetime`` attempt each.
+    """
+    found: Dict[Any, Optional[str]] = {}
+    for col in df.columns:
+        if not (pd.api.types.is_object_dtype(df[col]) or pd.api.types.is_string_dtype(df[col])):
+            continue
+        values = df[col].dropna()
+        sample = values.sample(min(sample_rows, len(values)), random_state=0) if len(values) else values
+        if sample.empty or sample.astype(str).str.match(_DATE_LIKE).mean() <= DATETIME_MIN_VALID:
+            continue
+        found[col] = _datetime_format(sample)
+    return found
+
+
+def parse_datetimes(df: pd.DataFrame, columns: Dict[Any, Optional[str]]) -> pd.DataFrame:
+    """Parse the candidate columns in full (with the sampled format); keep those mostly valid."""
+    for col, fmt in columns.items():
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            try:
+                parsed = pd.to_datetime(df[col], errors="coerce", format=fmt or "mixed")
+            except (ValueError, TypeError):  # mixed time zones and the like: leave as text
+                continue
+        if parsed.notna().sum() > DATETIME_MIN_VALID * df[col].notna().sum():
+            df[col] = parsed
+    return df
+
+
+def load_typed(
+    source: Source,
+    text_columns: Sequence[Any] = (),
+    category_columns: Sequence[Any] = (),
+    infer_datetime: bool = True,
+    sep: Optional[str] = None,
+    encoding: Optional[str] = None,
+) -> pd.DataFrame:
+    """Whole-file load with explicit dtypes: ``text_columns`` stay strings (ids, phone numbers,
+    postcodes keep their leading zeros), ``category_columns`` become categoricals, and
+    datetimes are parsed only where ``datetime_columns`` finds them.  Columns missing from
+    the file are ignored, so the hints can name a known layout while any CSV still loads.
+    """
+    sep, encoding = _resolve(source, sep, encoding)
+    present = set(read_columns(source, sep, True, encoding))
+    dtype: Dict[Any, Any] = {c: str for c in text_columns if c in present}
+    dtype.update({c: "category" for c in category_columns if c in present})
+    try:
+        df = pd.read_csv(_open(source), sep=sep, encoding=encoding, dtype=dtype, engine="pyarrow")
+    except Exception:  # noqa: BLE001 - no pyarrow / quoting arrow rejects: the C engine copes
+        df = pd.read_csv(_open(source), sep=sep, encoding=encoding, dtype=dtype)
+    if infer_datetime:
+        candidates = datetime_columns(df.drop(columns=list(dtype)))
+        df = parse_datetimes(df, candidates)
+    return df
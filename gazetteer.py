@@ -0,0 +1,161 @@
+"""Thai province gazetteer: resolve free-typed city names to a province and its coordinates.
+
+Names are matched after folding (case, spacing, punctuation, "จังหวัด"/"province"
+prefixes), against English names, Thai names and common aliases ("Korat", "กทม",
+"Ayutthaya", ...), then fuzzily (difflib) for spelling variants.  Lookups are cached per
+distinct value, and ``resolve_many`` resolves a batch by its distinct values only.
+"""
+
+import difflib
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional
+
+MIN_FUZZY_SCORE = 0.88
+FUZZY_TIE_MARGIN = 0.03
+
+# (English name, Thai name, lat, lon, aliases) - coordinates of the provincial capital
+PROVINCES = [
+    ("Bangkok", "กรุงเทพมหานคร", 13.7563, 100.5018, ["Krung Thep", "Krung Thep Maha Nakhon", "BKK", "กรุงเทพ", "กรุงเทพฯ", "กทม"]),
+    ("Krabi", "กระบี่", 8.0863, 98.9063, []),
+    ("Kanchanaburi", "กาญจนบุรี", 14.0228, 99.5328, ["Kanchana Buri"]),
+    ("Kalasin", "กาฬสินธุ์", 16.4380, 103.5060, []),
+    ("Kamphaeng Phet", "กำแพงเพชร", 16.4827, 99.5228, []),
+    ("Khon Kaen", "ขอนแก่น", 16.4419, 102.8350, []),
+    ("Chanthaburi", "จันทบุรี", 12.6114, 102.1038, ["Chantaburi", "Chanthaburee"]),
+    ("Chachoengsao", "ฉะเชิงเทรา", 13.6904, 101.0779, ["Paet Rio", "แปดริ้ว"]),
+    ("Chai Nat", "ชัยนาท", 15.1859, 100.1250, ["Chainat"]),
+    ("Chaiyaphum", "ชัยภูมิ", 15.8106, 102.0280, []),
+    ("Chumphon", "ชุมพร", 10.4930, 99.1800, []),
+    ("Chiang Rai", "เชียงราย", 19.9105, 99.8406, []),
+    ("Chiang Mai", "เชียงใหม่", 18.7883, 98.9853, ["Chiengmai", "CNX"]),
+    ("Chon Buri", "ชลบุรี", 13.3611, 100.9847, ["Chonburi", "Pattaya", "พัทยา"]),
+    ("Trang", "ตรัง", 7.5590, 99.6110, []),
+    ("Trat", "ตราด", 12.2420, 102.5170, []),
+    ("Tak", "ตาก", 16.8840, 99.1250, ["Mae Sot", "แม่สอด"]),
+    ("Nakhon Nayok", "นครนายก", 14.2030, 101.2130, []),
+    ("Nakhon Pathom", "นครปฐม", 13.8196, 100.0622, []),
+    ("Nakhon Phanom", "นครพนม", 17.4100, 104.7830, []),
+    ("Nakhon Ratchasima", "นครราชสีมา", 14.9799, 102.0977, ["Korat", "Khorat", "โคราช"]),
+    ("Nakhon Sawan", "นครสวรรค์", 15.7047, 100.1372, []),
+    ("Nakhon Si Thammarat", "นครศรีธรรมราช", 8.4304, 99.9631, ["Nakhon Si", "Nakorn Sri Thammarat"]),
+    ("Nan", "น่าน", 18.7750, 100.7730, []),
+    ("Narathiwat", "นราธิวาส", 6.4255, 101.8253, []),
+    ("Nonthaburi", "นนทบุรี", 13.8621, 100.5144, ["Nonthaburee"]),
+    ("Bueng Kan", "บึงกาฬ", 18.3609, 103.6466, ["Bungkan", "Bueng Kal"]),
+    ("Buriram", "บุรีรัมย์", 14.9940, 103.1039, ["Buri Ram"]),
+    ("Pathum Thani", "ปทุมธานี", 14.0208, 100.5250, ["Pathumthani", "Rangsit", "รังสิต"]),
+    ("Prachuap Khiri Khan", "ประจวบคีรีขันธ์", 11.8110, 99.7970, ["Hua Hin", "หัวหิน"]),
+    ("Prachin Buri", "ปราจีนบุรี", 14.0490, 101.3700, ["Prachinburi"]),
+    ("Pattani", "ปัตตานี", 6.8697, 101.2510, []),
+    ("Phra Nakhon Si Ayutthaya", "พระนครศรีอยุธยา", 14.3692, 100.5877, ["Ayutthaya", "Ayudhya", "อยุธยา"]),
+    ("Phayao", "พะเยา", 19.1666, 99.9019, []),
+    ("Phang Nga", "พังงา", 8.4510, 98.5252, ["Phangnga"]),
+    ("Phatthalung", "พัทลุง", 7.6167, 100.0734, ["Phattalung"]),
+    ("Phichit", "พิจิตร", 16.4419, 100.3488, []),
+    ("Phitsanulok", "พิษณุโลก", 16.8210, 100.2627, ["Pitsanulok"]),
+    ("Phetchaburi", "เพชรบุรี", 13.1110, 99.9380, ["Phetburi", "Petchaburi"]),
+    ("Phetchabun", "เพชรบูรณ์", 16.4180, 101.1540, ["Petchabun"]),
+    ("Phrae", "แพร่", 18.1446, 100.1403, []),
+    ("Phuket", "ภูเก็ต", 7.8804, 98.3923, ["Puket", "HKT"]),
+    ("Maha Sarakham", "มหาสารคาม", 16.1846, 103.3007, ["Mahasarakham"]),
+    ("Mukdahan", "มุกดาหาร", 16.5453, 104.7236, []),
+    ("Mae Hong Son", "แม่ฮ่องสอน", 19.3013, 97.9654, ["Maehongson"]),
+    ("Yasothon", "ยโสธร", 15.7927, 104.1453, []),
+    ("Yala", "ยะลา", 6.5410, 101.2800, []),
+    ("Roi Et", "ร้อยเอ็ด", 16.0538, 103.6520, ["Roiet"]),
+    ("Ranong", "ระนอง", 9.9529, 98.6085, []),
+    ("Rayong", "ระยอง", 12.6814, 101.2780, []),
+    ("Ratchaburi", "ราชบุรี", 13.5283, 99.8134, ["Rajaburi"]),
+    ("Lopburi", "ลพบุรี", 14.7995, 100.6534, ["Lop Buri"]),
+    ("Lampang", "ลำปาง", 18.2888, 99.4928, []),
+    ("Lamphun", "ลำพูน", 18.5745, 99.0087, ["Lampoon"]),
+    ("Loei", "เลย", 17.4860, 101.7223, []),
+    ("Si Sa Ket", "ศรีสะเกษ", 15.1143, 104.3290, ["Sisaket", "Srisaket"]),
+    ("Sakon Nakhon", "สกลนคร", 17.1546, 104.1476, []),
+    ("Songkhla", "สงขลา", 7.1898, 100.5951, ["Hat Yai", "Hatyai", "หาดใหญ่"]),
+    ("Satun", "สตูล", 6.6238, 100.0674, []),
+    ("Samut Prakan", "สมุทรปราการ", 13.5991, 100.5990, ["Samutprakarn", "Pak Nam", "ปากน้ำ"]),
+    ("Samut Songkhram", "สมุทรสงคราม", 13.4094, 100.0020, ["Mae Klong", "แม่กลอง"]),
+    ("Samut Sakhon", "สมุทรสาคร", 13.5475, 100.2744, ["Mahachai", "มหาชัย"]),
+    ("Sa Kaeo", "สระแก้ว", 13.8176, 102.0680, ["Sakaeo"]),
+    ("Saraburi", "สระบุรี", 14.5289, 100.9106, []),
+    ("Sing Buri", "สิงห์บุรี", 14.8920, 100.3960, ["Singburi"]),
+    ("Sukhothai", "สุโขทัย", 17.0050, 99.8260, []),
+    ("Suphan Buri", "สุพรรณบุรี", 14.4730, 100.1220, ["Suphanburi"]),
+    ("Surat Thani", "สุราษฎร์ธานี", 9.1382, 99.3215, ["Suratthani", "Samui", "Koh Samui", "เกาะสมุย"]),
+    ("Surin", "สุรินทร์", 14.8818, 103.4937, []),
+    ("Nong Khai", "หนองคาย", 17.8783, 102.7413, ["Nongkhai"]),
+    ("Nong Bua Lamphu", "หนองบัวลำภู", 17.2040, 102.4390, []),
+    ("Ang Thong", "อ่างทอง", 14.5913, 100.4550, ["Angthong"]),
+    ("Udon Thani", "อุดรธานี", 17.3647, 102.8150, ["Udon", "Udonthani", "อุดร"]),
+    ("Uttaradit", "อุตรดิตถ์", 17.6233, 100.0993, []),
+    ("Uthai Thani", "อุทัยธานี", 15.3794, 100.0245, []),
+    ("Ubon Ratchathani", "อุบลราชธานี", 15.2287, 104.8560, ["Ubon", "อุบล"]),
+    ("Amnat Charoen", "อำนาจเจริญ", 15.8581, 104.6288, []),
+]
+
+_PREFIXES = re.compile(r"^(?:จังหวัด|จ\.|changwat|province of)\s*|\s*(?:province|จังหวัด)$")
+
+
+def fold_place(text: Any) -> str:
+    """Comparison key: first comma part, no admin prefix, no case / spaces / punctuation."""
+    text = unicodedata.normalize("NFKC", str(text or "")).casefold().split(",")[0].strip()
+    text = _PREFIXES.sub("", text).strip()
+    # keep Thai vowel/tone marks (category Mn), they tell provinces apart
+    return "".join(ch for ch in text if ch.isalnum() or unicodedata.category(ch) == "Mn")
+
+
+def _build_index() -> Dict[str, int]:
+    index: Dict[str, int] = {}
+    for i, (name, name_th, _lat, _lon, aliases) in enumerate(PROVINCES):
+        for key in (name, name_th, *aliases):
+            folded = fold_place(key)
+            if index.setdefault(folded, i) != i:
+                raise ValueError(f"gazetteer alias {key!r} is ambiguous")
+    return index
+
+
+_INDEX = _build_index()
+_KEYS = list(_INDEX)
+
+
+def _place(i: int, how: str, score: float = 1.0) -> Dict[str, Any]:
+    name, name_th, lat, lon, _aliases = PROVINCES[i]
+    return {"province": name, "province_th": name_th, "lat": lat, "lon": lon, "match": how, "score": round(score, 3)}
+
+
+@lru_cache(maxsize=8192)
+def resolve(text: str) -> Optional[Dict[str, Any]]:
+    """Province for one city string, or None.  The cached dict is shared: do not mutate it."""
+    key = fold_place(text)
+    if not key:
+        return None
+    if key in _INDEX:
+        return _place(_INDEX[key], "exact")
+    scored = sorted(
+        ((difflib.SequenceMatcher(None, key, k).ratio(), k) for k in difflib.get_close_matches(key, _KEYS, n=5, cutoff=MIN_FUZZY_SCORE)),
+        reverse=True,
+    )
+    if not scored:
+        return None
+    best_score, best_key = scored[0]
+    rivals = {_INDEX[k] for s, k in scored if s >= best_score - FUZZY_TIE_MARGIN}
+    if len(rivals) > 1:
+        return None  # two provinces about equally close: don't guess
+    return _place(_INDEX[best_key], "fuzzy", best_score)
+
+
+def resolve_many(values: Iterable[Any]) -> Dict[Any, Optional[Dict[str, Any]]]:
+    """``{value: place}`` for every distinct value (each resolved once)."""
+    return {value: resolve(str(value)) for value in set(values) if value is not None}
+
+
+def province_names() -> List[str]:
+    """English names in Thai alphabetical order (as the province list is kept)."""
+    return [name for name, *_ in PROVINCES]
+
+
+def coordinates() -> Dict[str, tuple]:
+    return {name: (lat, lon) for name, _th, lat, lon, _aliases in PROVINCES}
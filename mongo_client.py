@@ -0,0 +1,200 @@
+"""Managed ``MongoClient`` for the Streamlit pages: pool settings plus live diagnostics.
+
+Every session shares one cached client, so the pool is the place where load shows up
+first.  ``create_client`` applies tuned defaults (overridable from ``st.secrets["mongo"]``)
+and registers pymongo monitoring listeners that record per-command latency, pool
+checkout wait and error counts for the page's diagnostics panel.
+
+The backend is pluggable: ``backend = "mongomock"`` in the secrets section, or the
+``MONGO_BACKEND`` environment variable, swaps in an in-process ``mongomock`` client
+(optional dependency) so the page and ``benchmarks/mongo_load.py`` run without a server.
+"""
+
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict, List, Mapping, Optional
+
+import pymongo
+from pymongo import monitoring
+
+# sessions x concurrent queries per rerun; waitQueueTimeoutMS turns saturation into a
+# visible error instead of a hung rerun
+DEFAULT_CLIENT_OPTIONS: Dict[str, Any] = {
+    "maxPoolSize": 50,
+    "minPoolSize": 2,
+    "maxIdleTimeMS": 300_000,
+    "waitQueueTimeoutMS": 2_000,
+    "serverSelectionTimeoutMS": 5_000,
+    "connectTimeoutMS": 5_000,
+    "socketTimeoutMS": 30_000,
+    "retryWrites": True,
+    "retryReads": True,
+    "readPreference": "primaryPreferred",
+    "appname": "streamlit-mongotest",
+}
+
+LATENCY_SAMPLES = 2_000
+BACKENDS = ("mongodb", "mongomock")
+
+
+def client_options(secrets: Optional[Mapping[str, Any]] = None) -> Dict[str, Any]:
+    """Defaults overridden by whatever the secrets section sets (host, credentials, pool knobs)."""
+    return {**DEFAULT_CLIENT_OPTIONS, **dict(secrets or {})}
+
+
+def _percentile(samples: List[float], pct: float) -> Optional[float]:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))], 2)
+
+
+class ClientDiagnostics(monitoring.CommandListener, monitoring.ConnectionPoolListener):
+    """Thread-safe counters fed by pymongo monitoring events (listeners run on the calling thread)."""
+
+    def __init__(self, samples: int = LATENCY_SAMPLES):
+        self._lock = threading.Lock()
+        self._latency: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=samples))
+        self._calls: Dict[str, int] = defaultdict(int)
+        self._errors: Dict[str, int] = defaultdict(int)
+        self._waits: Deque[float] = deque(maxlen=samples)
+        self._local = threading.local()
+        self.checked_out = 0
+        self.peak_checked_out = 0
+        self.checkout_failures: Dict[str, int] = defaultdict(int)
+        self.connections_created = 0
+        self.connections_closed = 0
+        self.pool_clears = 0
+        self.started_at = time.time()
+
+    # --- commands ---
+    def started(self, event) -> None:
+        pass
+
+    def succeeded(self, event) -> None:
+        with self._lock:
+            self._calls[event.command_name] += 1
+            self._latency[event.command_name].append(event.duration_micros / 1000)
+
+    def failed(self, event) -> None:
+        with self._lock:
+            self._calls[event.command_name] += 1
+            self._errors[event.command_name] += 1
+            self._latency[event.command_name].append(event.duration_micros / 1000)
+
+    # --- pool ---
+    def pool_created(self, event) -> None:
+        pass
+
+    def pool_ready(self, event) -> None:
+        pass
+
+    def pool_cleared(self, event) -> None:
+        with self._lock:
+            self.pool_clears += 1
+
+    def pool_closed(self, event) -> None:
+        pass
+
+    def connection_created(self, event) -> None:
+        with self._lock:
+            self.connections_created += 1
+
+    def connection_ready(self, event) -> None:
+        pass
+
+    def connection_closed(self, event) -> None:
+        with self._lock:
+            self.connections_closed += 1
+
+    def connection_check_out_started(self, event) -> None:
+        self._local.wait_started = time.perf_counter()
+
+    def connection_check_out_failed(self, event) -> None:
+        with self._lock:
+            self.checkout_failures[str(event.reason)] += 1
+
+    def connection_checked_out(self, event) -> None:
+        started = getattr(self._local, "wait_started", None)
+        with self._lock:
+            if started is not None:
+                self._waits.append((time.perf_counter() - started) * 1000)
+            self.checked_out += 1
+            self.peak_checked_out = max(self.peak_checked_out, self.checked_out)
+
+    def connection_checked_in(self, event) -> None:
+        with self._lock:
+            self.checked_out = max(0, self.checked_out - 1)
+
+    # --- reporting ---
+    def operations(self) -> List[Dict[str, Any]]:
+        """One row per command name: calls, errors, p50/p95/max latency (ms)."""
+        with self._lock:
+            rows = []
+            for name, calls in sorted(self._calls.items(), key=lambda kv: -kv[1]):
+                samples = list(self._latency[name])
+                rows.append(
+                    {
+                        "command": name,
+                        "calls": calls,
+                        "errors": self._errors.get(name, 0),
+                        "p50_ms": _percentile(samples, 50),
+                        "p95_ms": _percentile(samples, 95),
+                        "max_ms": round(max(samples), 2) if samples else None,
+                    }
+                )
+            return rows
+
+    def pool(self) -> Dict[str, Any]:
+        with self._lock:
+            waits = list(self._waits)
+            return {
+                "checked_out": self.checked_out,
+                "peak_checked_out": self.peak_checked_out,
+                "wait_p50_ms": _percentile(waits, 50),
+                "wait_p95_ms": _percentile(waits, 95),
+                "wait_max_ms": round(max(waits), 2) if waits else None,
+                "checkout_failures": dict(self.checkout_failures),
+                "connections_created": self.connections_created,
+                "connections_closed": self.connections_closed,
+                "pool_clears": self.pool_clears,
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._latency.clear()
+            self._calls.clear()
+            self._errors.clear()
+            self._waits.clear()
+            self.checkout_failures.clear()
+            self.peak_checked_out = self.checked_out
+            self.started_at = time.time()
+
+
+def backend_name(options: Mapping[str, Any]) -> str:
+    """``MONGO_BACKEND`` if set, else the ``backend`` option, else a real MongoDB."""
+    name = (os.environ.get("MONGO_BACKEND") or options.get("backend") or "mongodb").strip().lower()
+    if name not in BACKENDS:
+        raise ValueError(f"unknown Mongo backend {name!r}; expected one of {', '.join(BACKENDS)}")
+    return name
+
+
+def create_client(options: Mapping[str, Any], diagnostics: Optional[ClientDiagnostics] = None):
+    """Client for the configured backend; ``diagnostics`` (if given) receives command and pool events.
+
+    The mongomock stand-in keeps everything in this process's memory and emits no
+    monitoring events, so the diagnostics panel stays empty there.
+    """
+    options = dict(options)
+    backend = backend_name(options)
+    options.pop("backend", None)
+    if backend == "mongomock":
+        try:
+            import mongomock
+        except ImportError as exc:
+            raise RuntimeError("the mongomock backend needs `pip install mongomock`") from exc
+        return mongomock.MongoClient()
+    listeners = [diagnostics] if diagnostics is not None else []
+    return pymongo.MongoClient(**options, event_listeners=listeners)
@@ -0,0 +1,460 @@
+"""Server-side queries behind the MongoDB CRUD page (``pages/mongotest.py``).
+
+The page never loads the whole ``users`` collection: the browse table is paged with a
+keyset cursor, every query projects only the fields it shows, the manage selector
+fetches a handful of matches on demand, and metrics / map counts come from one
+``$group`` pipeline.
+
+Edits are compare-and-set: every document carries a ``version`` that each update bumps,
+and an update only applies when the version the editor loaded is still current, so two
+operators editing the same user get a ``UserConflict`` instead of a silent overwrite.
+The collection also gets a ``$jsonSchema`` validator with the form's rules.
+
+Search is an index seek: every write stores ``name_key`` (folded name) and
+``search_keys`` (folded name/city words plus the whole folded name and city), and a
+term matches by anchored prefix on those fields.  A MongoDB text index is not used
+because it neither does prefixes nor splits Thai, which is written without spaces.
+"""
+
+import csv
+import io
+import json
+import logging
+import re
+import tempfile
+import unicodedata
+from datetime import datetime, timezone
+from typing import IO, Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import pymongo
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, CollectionInvalid, PyMongoError
+
+from gazetteer import resolve
+
+log = logging.getLogger(__name__)
+
+USER_FIELDS = {"name": 1, "age": 1, "city": 1, "version": 1}
+PAGE_SIZE = 50
+SELECTOR_LIMIT = 20
+COUNT_LIMIT = 1000
+BACKFILL_BATCH = 1000
+IMPORT_BATCH = 1000
+EXPORT_BATCH = 5000
+EXPORT_FIELDS = ["name", "age", "city"]
+
+# the form's rules, enforced by the server for every insert and for updates of valid documents
+USER_SCHEMA = {
+    "$jsonSchema": {
+        "bsonType": "object",
+        "required": ["name", "age", "city", "version"],
+        "properties": {
+            "name": {"bsonType": "string", "minLength": 1},
+            "age": {"bsonType": ["int", "long"], "minimum": 0, "maximum": 120},
+            "city": {"bsonType": "string", "minLength": 1},
+            "version": {"bsonType": ["int", "long"], "minimum": 1},
+        },
+    }
+}
+
+# (tier, last _id) of the previous page; tiers rank exact name > name prefix > other words
+PageCursor = Tuple[int, ObjectId]
+
+
+class UserConflict(RuntimeError):
+    """Raised when a user changed (or was deleted) after the editor loaded it.
+
+    ``current`` is the document as it is now (``USER_FIELDS``), or None when it is gone.
+    """
+
+    def __init__(self, user_id: ObjectId, current: Optional[dict]):
+        super().__init__(f"user {user_id} was {'changed' if current else 'deleted'} by someone else")
+        self.user_id = user_id
+        self.current = current
+
+
+def fold(text: Any) -> str:
+    """Lower-cased, NFKC-normalized text with single spaces (matches "ำ" typed either way)."""
+    return " ".join(unicodedata.normalize("NFKC", str(text or "")).casefold().split())
+
+
+def search_fields(name: Any, city: Any) -> Dict[str, Any]:
+    name_key, city_key = fold(name), fold(city)
+    keys = {name_key, city_key, *name_key.split(), *city_key.split()} - {""}
+    return {"name_key": name_key, "search_keys": sorted(keys)}
+
+
+def geo_fields(city: Any) -> Dict[str, Any]:
+    """``province`` + GeoJSON ``location`` resolved once at write time (None when unknown)."""
+    place = resolve(str(city or ""))
+    if place is None:
+        return {"province": None, "location": None}
+    return {"province": place["province"], "location": {"type": "Point", "coordinates": [place["lon"], place["lat"]]}}
+
+
+def user_doc(name: str, age: int, city: str) -> Dict[str, Any]:
+    """A user document as the page inserts it: search, geo, ``updated_at`` and the first ``version``."""
+    return {
+        "name": name,
+        "age": age,
+        "city": city,
+        **search_fields(name, city),
+        **geo_fields(city),
+        "updated_at": datetime.now(timezone.utc),
+        "version": 1,
+    }
+
+
+def ensure_indexes(collection) -> None:
+    """Indexes the page's filters and sorts rely on (idempotent, cheap when they exist)."""
+    collection.create_index([("city", pymongo.ASCENDING), ("_id", pymongo.ASCENDING)], name="city_id")
+    collection.create_index([("province", pymongo.ASCENDING), ("_id", pymongo.ASCENDING)], name="province_id")
+    collection.create_index([("name_key", pymongo.ASCENDING), ("_id", pymongo.ASCENDING)], name="name_key_id")
+    collection.create_index([("search_keys", pymongo.ASCENDING)], name="search_keys")
+    collection.create_index([("age", pymongo.ASCENDING)], name="age")
+    collection.create_index([("updated_at", pymongo.DESCENDING)], name="updated_at")
+
+
+def ensure_schema(collection) -> bool:
+    """Attach ``USER_SCHEMA`` (creating the collection if needed); False when the server refuses.
+
+    ``validationLevel: moderate`` leaves documents that predate the rules editable as they
+    are, while inserts and updates of valid documents are checked.
+    """
+    options = {"validator": USER_SCHEMA, "validationLevel": "moderate", "validationAction": "error"}
+    try:
+        if collection.name not in collection.database.list_collection_names(filter={"name": collection.name}):
+            try:
+                collection.database.create_collection(collection.name, **options)
+                return True
+            except CollectionInvalid:  # created concurrently
+                pass
+        collection.database.command({"collMod": collection.name, **options})
+        return True
+    except (PyMongoError, NotImplementedError, TypeError) as exc:  # no privilege, stand-in such as mongomock
+        log.info("users schema validator not installed: %s", exc)
+        return False
+
+
+def _version_filter(user_id: ObjectId, version: int) -> Dict[str, Any]:
+    # documents from before versioning have no field: they count as version 0
+    return {"_id": user_id, "version": version if version else {"$in": [None, 0]}}
+
+
+def update_user(collection, user_id: ObjectId, version: int, name: str, age: int, city: str) -> dict:
+    """Compare-and-set update: applies only if the stored ``version`` is still ``version``.
+
+    Returns the updated document (``USER_FIELDS``); raises ``UserConflict`` with the
+    current document otherwise.  Validation failures surface as ``WriteError``.
+    """
+    fields = user_doc(name, age, city)
+    del fields["version"]
+    updated = collection.find_one_and_update(
+        _version_filter(user_id, version),
+        {"$set": fields, "$inc": {"version": 1}},
+        projection=USER_FIELDS,
+        return_document=ReturnDocument.AFTER,
+    )
+    if updated is None:
+        raise UserConflict(user_id, get_user(collection, user_id))
+    return updated
+
+
+def delete_user(collection, user_id: ObjectId, version: int) -> None:
+    """Delete only the version the operator looked at; ``UserConflict`` if it changed meanwhile."""
+    if collection.delete_one(_version_filter(user_id, version)).deleted_count == 0:
+        current = get_user(collection, user_id)
+        if current is not None:
+            raise UserConflict(user_id, current)
+
+
+def backfill_search_fields(collection, batch_size: int = BACKFILL_BATCH) -> int:
+    """Add search fields to documents written before they existed; returns how many were updated."""
+    updated = 0
+    batch: List[UpdateOne] = []
+    for doc in collection.find({"search_keys": {"$exists": False}}, {"name": 1, "city": 1}):
+        batch.append(UpdateOne({"_id": doc["_id"]}, {"$set": search_fields(doc.get("name"), doc.get("city"))}))
+        if len(batch) >= batch_size:
+            updated += collection.bulk_write(batch, ordered=False).modified_count
+            batch = []
+    if batch:
+        updated += collection.bulk_write(batch, ordered=False).modified_count
+    return updated
+
+
+def backfill_geo(collection) -> int:
+    """Geocode documents written before ``province`` existed: one lookup and one update per distinct city."""
+    updated = 0
+    pending = collection.aggregate([{"$match": {"province": {"$exists": False}}}, {"$group": {"_id": "$city"}}])
+    for row in pending:
+        result = collection.update_many({"city": row["_id"], "province": {"$exists": False}}, {"$set": geo_fields(row["_id"])})
+        updated += result.modified_count
+    return updated
+
+
+def _prefix(text: str) -> Dict[str, str]:
+    return {"$regex": "^" + re.escape(text)}
+
+
+def build_filter(search: str = "", province: Optional[str] = None, age_range: Optional[Tuple[int, int]] = None) -> Dict[str, Any]:
+    """Mongo filter for the browse/manage views.
+
+    ``province`` and ``age_range`` are equality/range predicates on indexed fields; the
+    province is the one resolved at write time, so "Korat" and "โคราช" both match
+    "Nakhon Ratchasima".  Every word of ``search`` must prefix-match one of the
+    document's ``search_keys``.
+    """
+    clauses: List[Dict[str, Any]] = []
+    if province:
+        clauses.append({"province": province})
+    if age_range is not None:
+        clauses.append({"age": {"$gte": int(age_range[0]), "$lte": int(age_range[1])}})
+    clauses.extend({"search_keys": _prefix(word)} for word in fold(search).split())
+    if not clauses:
+        return {}
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def search_tiers(search: str = "", province: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Disjoint filters in rank order: exact name, name prefix, then any other word match."""
+    base = build_filter(search, province)
+    term = fold(search)
+    if not term:
+        return [base]
+    name_prefix = re.compile("^" + re.escape(term))
+    return [
+        {"$and": [base, {"name_key": term}]},
+        {"$and": [base, {"name_key": {"$regex": name_prefix.pattern, "$ne": term}}]},
+        {"$and": [base, {"name_key": {"$not": name_prefix}}]},
+    ]
+
+
+def fetch_page(
+    collection,
+    tiers: List[Dict[str, Any]],
+    after: Optional[PageCursor] = None,
+    limit: int = PAGE_SIZE,
+) -> Tuple[List[dict], Optional[PageCursor]]:
+    """One page of users in tier then ``_id`` order plus the cursor of the next page (None on the last).
+
+    Keyset pagination (``_id > last _id`` within a tier) costs the same on page 1 and
+    page 10,000, unlike ``skip``.
+    """
+    docs: List[dict] = []
+    start_tier, after_id = after if after is not None else (0, None)
+    for tier in range(start_tier, len(tiers)):
+        query = tiers[tier]
+        if after_id is not None and tier == start_tier:
+            query = {"$and": [query, {"_id": {"$gt": after_id}}]} if query else {"_id": {"$gt": after_id}}
+        want = limit + 1 - len(docs)
+        docs.extend({**doc, "_tier": tier} for doc in collection.find(query, USER_FIELDS).sort("_id", pymongo.ASCENDING).limit(want))
+        if len(docs) > limit:
+            break
+    last = docs[limit - 1] if len(docs) > limit else None
+    return docs[:limit], (last["_tier"], last["_id"]) if last else None
+
+
+def count_users(collection, query: Optional[Dict[str, Any]] = None, limit: int = 0) -> int:
+    """Count for a filter, stopping at ``limit`` when given; the collection metadata estimate when there is none.
+
+    Callers show a count that reached ``limit`` as "limit+": a search filter is a regex
+    scan over ``search_keys``, and counting every match on each rerun costs more than the page.
+    """
+    if not query:
+        return collection.estimated_document_count()
+    return collection.count_documents(query, limit=limit) if limit else collection.count_documents(query)
+
+
+def find_choices(collection, search: str = "", limit: int = SELECTOR_LIMIT) -> List[dict]:
+    """A few users for the manage selector (name, city, ``_id`` only), best matches first."""
+    docs, _ = fetch_page(collection, search_tiers(search), limit=limit)
+    return docs
+
+
+def get_user(collection, user_id: ObjectId) -> Optional[dict]:
+    return collection.find_one({"_id": user_id}, USER_FIELDS)
+
+
+_IS_NUMBER = {"$isNumber": "$age"}
+
+# one row per distinct (city, province); metrics and the map are derived from these few rows
+CITY_SUMMARY_PIPELINE = [
+    {
+        "$group": {
+            "_id": {"city": "$city", "province": "$province"},
+            "count": {"$sum": 1},
+            "age_sum": {"$sum": {"$cond": [_IS_NUMBER, "$age", 0]}},
+            "age_n": {"$sum": {"$cond": [_IS_NUMBER, 1, 0]}},
+            "coordinates": {"$first": "$location.coordinates"},
+        }
+    },
+    {
+        "$project": {
+            "_id": 0,
+            "city": "$_id.city",
+            "province": "$_id.province",
+            "coordinates": 1,
+            "count": 1,
+            "age_sum": 1,
+            "age_n": 1,
+        }
+    },
+]
+
+
+def city_summary(collection) -> List[dict]:
+    """Users per raw ``city`` value (with its stored province / coordinates) and the sum/count of numeric ages."""
+    return list(collection.aggregate(CITY_SUMMARY_PIPELINE, allowDiskUse=True))
+
+
+def summary_stats(summary: List[dict]) -> Tuple[int, float, int]:
+    """(users, average age, distinct cities) from ``city_summary`` rows."""
+    total = sum(row["count"] for row in summary)
+    age_n = sum(row["age_n"] for row in summary)
+    avg_age = round(sum(row["age_sum"] for row in summary) / age_n, 1) if age_n else 0
+    unique_cities = len({str(row["city"]).strip().lower() for row in summary if row.get("city")})
+    return total, avg_age, unique_cities
+
+
+def geo_points(summary: List[dict]) -> List[dict]:
+    """Map points per province from ``city_summary`` rows; coordinates were stored at write time."""
+    by_province: Dict[str, dict] = {}
+    for row in summary:
+        province, coords = row.get("province"), row.get("coordinates")
+        if not province or not coords:
+            continue
+        entry = by_province.setdefault(province, {"city": province, "lat": coords[1], "lon": coords[0], "count": 0})
+        entry["count"] += row["count"]
+    return list(by_province.values())
+
+
+def choice_label(doc: dict) -> str:
+    return f"{doc.get('name', 'Unknown')} ({doc.get('city', '-')}) - {doc['_id']}"
+
+
+def table_rows(docs: List[dict]) -> List[dict]:
+    return [{"id": str(d["_id"]), "name": d.get("name"), "age": d.get("age"), "city": d.get("city")} for d in docs]
+
+
+# -----------------------------
+# Bulk import / export
+# -----------------------------
+def parse_import(data: bytes, filename: str) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """(row number, raw record) from a CSV (header row), JSON array or JSON-lines upload."""
+    text = data.decode("utf-8-sig")
+    if filename.lower().endswith((".json", ".jsonl", ".ndjson")):
+        stripped = text.lstrip()
+        if stripped.startswith("["):
+            records = json.loads(stripped)
+        else:
+            records = [json.loads(line) for line in stripped.splitlines() if line.strip()]
+        for row_no, record in enumerate(records, 1):
+            yield row_no, record if isinstance(record, dict) else {"_raw": record}
+        return
+    for row_no, record in enumerate(csv.DictReader(io.StringIO(text)), 2):  # row 1 is the header
+        yield row_no, record
+
+
+def validate_user(record: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """(document, None) for a valid record, (None, reason) otherwise - same rules as the form."""
+    name = str(record.get("name") or "").strip()
+    city = str(record.get("city") or "").strip()
+    if not name:
+        return None, "name ว่าง"
+    if not city:
+        return None, "city ว่าง"
+    try:
+        age = int(float(str(record.get("age")).strip()))
+    except (TypeError, ValueError, OverflowError):  # "abc", None, "inf", "1e400"
+        return None, f"age ไม่ใช่ตัวเลข: {record.get('age')!r}"
+    if not 0 <= age <= 120:
+        return None, f"age ต้องอยู่ระหว่าง 0-120: {age}"
+    return user_doc(name, age, city), None
+
+
+def import_users(
+    collection,
+    records: Iterable[Tuple[int, Dict[str, Any]]],
+    batch_size: int = IMPORT_BATCH,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+) -> Dict[str, Any]:
+    """Validate and insert records with unordered ``insert_many`` batches.
+
+    A bad row never stops the import: validation failures and per-document write errors
+    (e.g. duplicate keys) are collected as ``{"row", "error"}``.  ``on_progress(done,
+    inserted)`` is called after every batch.
+    """
+    inserted, done = 0, 0
+    errors: List[Dict[str, Any]] = []
+    batch: List[Dict[str, Any]] = []
+    batch_rows: List[int] = []
+
+    def flush() -> None:
+        nonlocal inserted
+        if not batch:
+            return
+        try:
+            inserted += len(collection.insert_many(batch, ordered=False).inserted_ids)
+        except BulkWriteError as exc:
+            details = exc.details
+            inserted += details.get("nInserted", 0)
+            for err in details.get("writeErrors", []):
+                errors.append({"row": batch_rows[err["index"]], "error": err.get("errmsg", "write error")})
+        batch.clear()
+        batch_rows.clear()
+        if on_progress:
+            on_progress(done, inserted)
+
+    for row_no, record in records:
+        done += 1
+        doc, error = validate_user(record)
+        if error:
+            errors.append({"row": row_no, "error": error})
+            continue
+        batch.append(doc)
+        batch_rows.append(row_no)
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+    if on_progress:
+        on_progress(done, inserted)
+    return {"rows": done, "inserted": inserted, "errors": errors}
+
+
+def errors_csv(errors: List[Dict[str, Any]]) -> bytes:
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=["row", "error"])
+    writer.writeheader()
+    writer.writerows(errors)
+    return out.getvalue().encode("utf-8-sig")  # BOM so Excel shows Thai reasons
+
+
+def export_users(collection, out: IO[bytes], fmt: str = "csv", batch_size: int = EXPORT_BATCH) -> int:
+    """Stream every user to ``out`` as CSV or JSON lines straight from a cursor; returns the row count."""
+    cursor = collection.find({}, {"_id": 0, **{f: 1 for f in EXPORT_FIELDS}}).batch_size(batch_size)
+    text = io.TextIOWrapper(out, encoding="utf-8", newline="", write_through=True)
+    count = 0
+    try:
+        if fmt == "csv":
+            writer = csv.DictWriter(text, fieldnames=EXPORT_FIELDS, extrasaction="ignore")
+            writer.writeheader()
+            for count, doc in enumerate(cursor, 1):
+                writer.writerow(doc)
+        else:
+            for count, doc in enumerate(cursor, 1):
+                text.write(json.dumps(doc, ensure_ascii=False, default=str) + "\n")
+    finally:
+        text.detach()  # leave ``out`` open for the caller
+    return count
+
+
+def export_to_file(collection, fmt: str = "csv") -> Tuple[str, int]:
+    """``export_users`` into a named temp file; returns (path, rows).  The caller removes the file.
+
+    Hand the page ``open(path, "rb")``: ``st.download_button`` takes a ``BufferedReader``
+    but not a ``SpooledTemporaryFile``.
+    """
+    with tempfile.NamedTemporaryFile(prefix="users-", suffix=f".{fmt}", delete=False) as tmp:
+        count = export_users(collection, tmp.file, fmt)
+    return tmp.name, count
@@ -0,0 +1,147 @@
+"""Shared Ollama client with keep-alive, bounded concurrency and cancellation.
+
+Streamlit pages keep one ``OllamaPool`` per server process (via ``st.cache_resource``)
+so every session reuses the same HTTP connection pool and the model stays loaded.
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Generator, List, Optional
+
+
+class OllamaBusyError(RuntimeError):
+    """Raised when the request queue is full or waiting for a slot took too long."""
+
+
+class OllamaCancelled(RuntimeError):
+    """Raised when a queued request is cancelled before it gets a slot."""
+
+
+class OllamaPool:
+    """Wrap one ``ollama.Client`` and limit how many generations run at once.
+
+    ``client`` can be any object with an ``ollama``-compatible ``chat``/``generate``
+    API, which makes the pool easy to drive with a fake streaming server.
+    """
+
+    def __init__(
+        self,
+        model: str = "gemma3",
+        host: Optional[str] = None,
+        max_concurrent: int = 2,
+        max_queue: int = 8,
+        timeout: float = 120.0,
+        queue_timeout: float = 300.0,
+        keep_alive: str = "30m",
+        client: Any = None,
+    ):
+        if client is None:
+            from ollama import Client
+
+            client = Client(host=host, timeout=timeout)
+        self.model = model
+        self.max_concurrent = max(1, int(max_concurrent))
+        self.max_queue = max(0, int(max_queue))
+        self.queue_timeout = queue_timeout
+        self.keep_alive = keep_alive
+        self._client = client
+        self._cond = threading.Condition()
+        self._waiting: deque = deque()
+        self._active = 0
+
+    # -----------------------------
+    # Queue bookkeeping
+    # -----------------------------
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return {"active": self._active, "waiting": len(self._waiting), "max_concurrent": self.max_concurrent}
+
+    def _acquire(
+        self,
+        cancel: Optional[threading.Event],
+        on_wait: Optional[Callable[[int], None]],
+    ) -> None:
+        ticket = object()
+        deadline = time.monotonic() + self.queue_timeout
+        with self._cond:
+            if self._active >= self.max_concurrent and len(self._waiting) >= self.max_queue:
+                raise OllamaBusyError("Ollama queue is full, please try again shortly.")
+            self._waiting.append(ticket)
+            last_position = None
+            try:
+                while not (self._waiting[0] is ticket and self._active < self.max_concurrent):
+                    if cancel is not None and cancel.is_set():
+                        raise OllamaCancelled("Request cancelled while waiting in queue.")
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise OllamaBusyError("Timed out waiting for a free Ollama slot.")
+                    position = self._waiting.index(ticket) + 1
+                    if on_wait is not None and position != last_position:
+                        last_position = position
+                        on_wait(position)
+                    self._cond.wait(timeout=min(remaining, 0.5))
+            except BaseException:
+                self._waiting.remove(ticket)
+                self._cond.notify_all()
+                raise
+            self._waiting.popleft()
+            self._active += 1
+            self._cond.notify_all()
+
+    def _release(self) -> None:
+        with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+
+    # -----------------------------
+    # Model calls
+    # -----------------------------
+    def warm(self) -> bool:
+        """Load the model into memory ahead of the first question (empty prompt = load only).
+
+        Takes a slot like any other call, so warming never exceeds ``max_concurrent``;
+        returns False when the pool is full or the call fails.
+        """
+        try:
+            self._acquire(None, None)
+        except OllamaBusyError:
+            return False
+        try:
+            self._client.generate(model=self.model, prompt="", keep_alive=self.keep_alive)
+            return True
+        except Exception:  # noqa: BLE001
+            return False
+        finally:
+            self._release()
+
+    def stream_chat(
+        self,
+        messages: List[Dict[str, str]],
+        cancel: Optional[threading.Event] = None,
+        on_wait: Optional[Callable[[int], None]] = None,
+        options: Optional[Dict[str, Any]] = None,
+    ) -> Generator[str, None, None]:
+        """Yield content chunks; the slot is released when the stream ends, fails or is closed."""
+        self._acquire(cancel, on_wait)
+        stream = None
+        try:
+            stream = self._client.chat(
+                model=self.model,
+                messages=messages,
+                stream=True,
+                keep_alive=self.keep_alive,
+                options=options,
+            )
+            for chunk in stream:
+                if cancel is not None and cancel.is_set():
+                    break
+                yield chunk["message"]["content"]
+        finally:
+            close = getattr(stream, "close", None)
+            if close is not None:
+                try:
+                    close()
+                except Exception:  # noqa: BLE001
+                    pass
+            self._release()
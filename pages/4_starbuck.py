@@ -1,10 +1,15 @@
 
+import hashlib
+from pathlib import Path
+
 import streamlit as st
 import pandas as pd
 import numpy as np
 import plotly.express as px
 from io import StringIO
 
+from csv_ingest import load_typed
+
 st.set_page_config(page_title="Starbuck", page_icon="☕️")
 # Minimal ISO 3166-1 alpha-2 to country name map for nicer labels
 ISO2_COUNTRY = {
@@ -77,25 +82,22 @@ def with_country_names(df: pd.DataFrame):
 
 st.set_page_config(page_title="CSV Visualizer", layout="wide")
 
+# directory.csv layout: ids / phone numbers / postcodes stay text (leading zeros, no float
+# coercion), repeated labels become categoricals; other CSVs simply lack these columns
+TEXT_COLUMNS = ["Store Number", "Postcode", "Phone Number"]
+CATEGORY_COLUMNS = ["Brand", "Country", "State/Province", "Ownership Type", "Timezone"]
+
 @st.cache_data(show_spinner=False)
-def load_csv(file_like, infer_datetime=True):
-    df = pd.read_csv(file_like)
-    if infer_datetime:
-        for col in df.columns:
-            if df[col].dtype == "object":
-                try:
-                    parsed = pd.to_datetime(df[col], errors="coerce", utc=False, infer_datetime_format=True)
-                    valid_ratio = parsed.notna().mean()
-                    # Treat as datetime if mostly valid timestamps
-                    if valid_ratio > 0.85:
-                        df[col] = parsed
-                except Exception:
-                    pass
-    return df
+def load_csv(file_hash, _data: bytes, infer_datetime=True):
+    # cached by content hash: same file (path or upload) -> typed frame reused; edited file -> reload
+    return load_typed(_data, TEXT_COLUMNS, CATEGORY_COLUMNS, infer_datetime=infer_datetime)
+
+def read_source(data: bytes):
+    return load_csv(hashlib.sha1(data).hexdigest(), data)
 
 def detect_roles(df: pd.DataFrame):
     num_cols = df.select_dtypes(include=["number"]).columns.tolist()
-    dt_cols = df.select_dtypes(include=["datetime64[ns]", "datetimetz"]).columns.tolist()
+    dt_cols = df.select_dtypes(include=["datetime", "datetimetz"]).columns.tolist()
     cat_cols = df.select_dtypes(include=["object", "category", "bool"]).columns.tolist()
     # Drop overly-unique object columns from categories to avoid huge multiselects
     pruned = []
@@ -155,7 +157,7 @@ def agg_df(df: pd.DataFrame, groupby_cols, y_col, agg_fn):
         return df
     if y_col is None:
         return df
-    grouped = df.groupby(groupby_cols, dropna=False, as_index=False).agg({y_col: agg_fn})
+    grouped = df.groupby(groupby_cols, dropna=False, observed=True, as_index=False).agg({y_col: agg_fn})
     grouped.columns = groupby_cols + [f"{y_col} ({agg_fn})"]
     return grouped
 
@@ -306,14 +308,14 @@ def main():
     df = None
     if use_default:
         try:
-            df = load_csv(default_path)
+            df = read_source(Path(default_path).read_bytes())
             st.success(f"Loaded default CSV: {default_path}")
         except Exception as e:
             st.warning(f"Could not load default path. Error: {e}. Please upload a file below.")
     if df is None:
         up = st.sidebar.file_uploader("Upload a CSV", type=["csv"])
         if up:
-            df = load_csv(up)
+            df = read_source(up.getvalue())
 
     if df is None or df.empty:
         st.info("Upload a CSV or enable the default path to begin.")
@@ -354,7 +356,7 @@ def main():
         if "CountryName" in summary.columns:
             st.markdown("**Top Countries by Locations**")
             top_c = (
-                summary.groupby("CountryName", dropna=False)
+                summary.groupby("CountryName", dropna=False, observed=True)
                 .size()
                 .reset_index(name="count").sort_values("count", ascending=False).head(15)
             )
@@ -1,10 +1,24 @@
+import threading
 from pathlib import Path
-from typing import Any, Dict, Generator, List, Tuple
+from typing import Any, Callable, Dict, Generator, List, Optional, Tuple
 
 import pandas as pd
 import streamlit as st
-from ollama import chat
 from streamlit_gsheets import GSheetsConnection
+
+from ollama_pool import OllamaBusyError, OllamaCancelled, OllamaPool
+from rag_pipeline import (
+    HybridIndex,
+    add_snippets,
+    build_corpus,
+    build_messages,
+    chunk_text,
+    clean_invoice,
+    clean_project,
+    compact_history,
+    context_covers,
+    merge_context,
+)
 try:
     from pypdf import PdfReader
 except Exception:
@@ -12,13 +26,6 @@ except Exception:
 
 st.set_page_config(page_title="AI Assistant (Project & Invoice)", page_icon="🤖", layout="wide")
 
-PROJECT_WORKFLOW = (
-    "Project workflow sequence: "
-    "1) Prepare document Focus, 2) Procurement Focus, 3) Fabrication Focus, "
-    "4) Final inspection, 5) Shipping, 6) Final Document (no delay considered), "
-    "7) Completed (no delay considered)."
-)
-
 
 # -----------------------------
 # Data loading (same sources as dashboards)
@@ -68,78 +75,7 @@ def load_project_invoice() -> Tuple[pd.DataFrame, pd.DataFrame, Dict[str, str]]:
     meta["invoice_source"] = "excel"
     meta["excel_path"] = str(excel_path)
 
-    return project_df, invoice_df, meta
-
-
-def clean_project(df: pd.DataFrame) -> pd.DataFrame:
-    df = df.copy()
-    df.columns = [str(c).strip() for c in df.columns]
-    df.rename(columns={"Q'ty": "Qty"}, inplace=True)
-    df = df.dropna(how="all")
-
-    date_cols = [
-        "PO Date",
-        "Original Delivery Date",
-        "Estimated shipdate",
-        "Actual shipdate",
-        "Waranty end",
-    ]
-    numeric_cols = [
-        "Project year",
-        "Order number",
-        "Project Value",
-        "Balance",
-        "Progress",
-        "Number of Status",
-        "Max LD",
-        "Max LD Amount",
-        "Extra cost",
-        "Change order amount",
-        "Storage fee amount",
-        "Days late",
-        "Qty",
-    ]
-    for col in date_cols:
-        if col in df.columns:
-            df[col] = pd.to_datetime(df[col], errors="coerce")
-    for col in numeric_cols:
-        if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors="coerce")
-    if "Progress" in df.columns:
-        df["Progress"] = df["Progress"].clip(lower=0, upper=1)
-    return df
-
-
-def clean_invoice(df: pd.DataFrame) -> pd.DataFrame:
-    df = df.copy()
-    df.columns = [str(c).strip() for c in df.columns]
-    df.rename(columns={"Currency unit ": "Currency unit"}, inplace=True)
-    df = df.dropna(how="all")
-    numeric_cols = [
-        "Project year",
-        "SEQ",
-        "Total amount",
-        "Percentage of amount",
-        "Invoice value",
-        "Plan Delayed",
-        "Actual Delayed",
-        "Claim Plan 2025",
-    ]
-    for col in numeric_cols:
-        if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors="coerce")
-    date_cols = [
-        "Invoice plan date",
-        "Issued Date",
-        "Invoice due date",
-        "Plan payment date",
-        "Expected Payment date",
-        "Actual Payment received date",
-    ]
-    for col in date_cols:
-        if col in df.columns:
-            df[col] = pd.to_datetime(df[col], errors="coerce")
-    return df
+    return add_snippets(project_df, "project"), add_snippets(invoice_df, "invoice"), meta
 
 
 @st.cache_data(ttl=1800, show_spinner=False)
@@ -155,109 +91,64 @@ def load_pmbok_chunks() -> List[str]:
             text = page.extract_text() or ""
             if text:
                 pages_text.append(text)
-        full_text = "\n".join(pages_text)
-        chunks: List[str] = []
-        chunk_size = 1200
-        for i in range(0, len(full_text), chunk_size):
-            chunk = full_text[i : i + chunk_size].strip()
-            if chunk:
-                chunks.append(chunk)
-        return chunks
+        return chunk_text("\n".join(pages_text))
     except Exception:
         return []
 
 
-# -----------------------------
-# Simple RAG helpers
-# -----------------------------
-def row_to_snippet(row: pd.Series, kind: str) -> str:
-    if kind == "project":
-        parts = [
-            f"Project: {row.get('Project', '')}",
-            f"Customer: {row.get('Customer', '')}",
-            f"Engineer: {row.get('Project Engineer', '')}",
-            f"Order: {row.get('Order number', '')}",
-            f"Status: {row.get('Status', '')}",
-            f"Progress: {row.get('Progress', 0):.0%}" if pd.notna(row.get("Progress")) else "Progress: n/a",
-            f"Value: {row.get('Project Value', '')}",
-            f"Balance: {row.get('Balance', '')}",
-            f"Phrase: {row.get('Project Phrase', '')}",
-        ]
-    else:
-        parts = [
-            f"Customer: {row.get('Customer', '')}",
-            f"Engineer: {row.get('Project Engineer', '')}",
-            f"Order: {row.get('Sale order No.', '')}",
-            f"Invoice value: {row.get('Invoice value', '')}",
-            f"Payment status: {row.get('Payment Status', '')}",
-            f"Plan date: {row.get('Invoice plan date', '')}",
-            f"Issued: {row.get('Issued Date', '')}",
-        ]
-    return " | ".join(str(p) for p in parts if p)
-
-
-def build_corpus(
-    project_df: pd.DataFrame,
-    invoice_df: pd.DataFrame,
-    domain: str,
-    include_pmbok: bool,
-    pmbok_chunks: List[str],
-    include_workflow: bool = True,
-    limit: int = 200,
-):
-    docs = []
-    if domain in {"project", "both"}:
-        sample = project_df.head(limit)
-        for _, row in sample.iterrows():
-            docs.append({"source": "project", "text": row_to_snippet(row, "project")})
-    if domain in {"invoice", "both"}:
-        sample = invoice_df.head(limit)
-        for _, row in sample.iterrows():
-            docs.append({"source": "invoice", "text": row_to_snippet(row, "invoice")})
-    if include_pmbok and pmbok_chunks:
-        for chunk in pmbok_chunks[:50]:  # cap chunks for efficiency
-            docs.append({"source": "pmbok", "text": chunk})
-    if include_workflow:
-        docs.append({"source": "workflow", "text": PROJECT_WORKFLOW})
-    return docs
-
-
-def rank_docs(query: str, docs: List[Dict[str, str]], top_k: int = 10):
-    # Simple keyword overlap score
-    tokens = set(query.lower().split())
-    scored = []
-    for doc in docs:
-        words = set(doc["text"].lower().split())
-        score = len(tokens & words)
-        scored.append((score, doc))
-    scored.sort(key=lambda x: x[0], reverse=True)
-    # Always keep at least one PMBOK chunk if available and nothing matches
-    top = [doc for score, doc in scored[:top_k] if score > 0]
-    if not top:
-        top = [doc for _, doc in scored[: max(1, top_k // 3)]]  # fallback few docs
-    return top
-
-
-def call_ollama_stream(question: str, context: List[Dict[str, str]]) -> Generator[str, None, None]:
-    ctx_block = "\n".join([f"- ({d['source']}) {d['text']}" for d in context])
-    system_prompt = (
-        "You are an expert in project management (PMP/PMBOK) and an assistant for project/invoice data. "
-        "Ground answers in the provided context and PMBOK best practices: prioritize project value, timelines, risk, and invoice status. "
-        f"Always consider this project workflow: {PROJECT_WORKFLOW} "
-        "Answer with enough detail (3-5 sentences) using only the provided context; include key numbers/status when available. "
-        "If unsure, say you do not have that information. "
-        "ตอบเป็นภาษาไทยถ้าคำถามเป็นภาษาไทย และตอบเป็นอังกฤษถ้าคำถามเป็นอังกฤษ."
+@st.cache_resource(ttl=300, show_spinner=False)
+def get_retrieval_index(domain: str, include_pmbok: bool) -> HybridIndex:
+    """Build the hybrid index once per data snapshot and retrieval setting."""
+    project_df, invoice_df, _ = load_project_invoice()
+    corpus = build_corpus(project_df, invoice_df, domain, include_pmbok, load_pmbok_chunks(), include_workflow=True)
+    return HybridIndex(corpus)
+
+
+@st.cache_resource(show_spinner=False)
+def get_ollama_pool() -> OllamaPool:
+    """One pooled, pre-warmed Ollama client shared by every session of this server."""
+    try:
+        cfg = dict(st.secrets.get("ollama", {}))
+    except Exception:  # noqa: BLE001
+        cfg = {}
+    pool = OllamaPool(**cfg)
+    pool.warm()
+    return pool
+
+
+def call_ollama_stream(
+    question: str,
+    context: List[Dict[str, str]],
+    cancel: Optional[threading.Event] = None,
+    on_wait: Optional[Callable[[int], None]] = None,
+    history: Optional[List[Dict[str, str]]] = None,
+    summary: str = "",
+) -> Generator[str, None, None]:
+    yield from get_ollama_pool().stream_chat(
+        build_messages(question, context, history=history, summary=summary),
+        cancel=cancel,
+        on_wait=on_wait,
     )
-    user_prompt = f"Context:\n{ctx_block}\n\nQuestion: {question}"
-    for chunk in chat(
-        model="gemma3",
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt},
-        ],
-        stream=True,
-    ):
-        yield chunk["message"]["content"]
+
+
+def new_cancel_event() -> threading.Event:
+    """Cancel a generation still running from this session's previous run."""
+    previous_cancel = st.session_state.get("ai_cancel_event")
+    if previous_cancel is not None:
+        previous_cancel.set()
+    cancel_event = threading.Event()
+    st.session_state["ai_cancel_event"] = cancel_event
+    return cancel_event
+
+
+def render_context(context: List[Dict[str, Any]]) -> None:
+    with st.expander("ดูบริบทที่ใช้ตอบ (context)"):
+        for idx, doc in enumerate(context, 1):
+            scores = doc.get("scores", {})
+            st.markdown(
+                f"{idx}. **{doc['source']}** `score {doc.get('score', 0):.2f} · "
+                f"bm25 {scores.get('bm25', 0):.2f} · dense {scores.get('dense', 0):.2f}` — {doc['text']}"
+            )
 
 
 # -----------------------------
@@ -288,6 +179,64 @@ except Exception as exc:  # noqa: BLE001
 domain = st.radio("แหล่งข้อมูลที่ใช้ประกอบคำตอบ", ["both", "project", "invoice"], horizontal=True, index=0,
                   format_func=lambda x: {"both": "Project + Invoice", "project": "Project only", "invoice": "Invoice only"}[x])
 pmbok_use = st.checkbox("ใช้ความรู้จาก PMBOK (PDF) ประกอบ", value=True if 'pmbok_chunks' in locals() and pmbok_chunks else False)
+chat_mode = st.toggle("💬 โหมดสนทนา (ถามต่อเนื่องได้)", value=False)
+
+if chat_mode:
+    chat = st.session_state.setdefault("ai_chat", {"history": [], "summary": "", "context": [], "turns": []})
+    if chat.get("scope") != (domain, pmbok_use):
+        # retrieval settings changed: earlier context no longer matches the sources
+        chat["scope"] = (domain, pmbok_use)
+        chat["context"] = []
+    if st.button("เริ่มบทสนทนาใหม่", disabled=not chat["turns"]):
+        chat.update(history=[], summary="", context=[], turns=[])
+
+    for turn in chat["turns"]:
+        st.chat_message("user").write(turn["question"])
+        st.chat_message("assistant").write(turn["answer"])
+
+    chat_question = st.chat_input("ถามต่อได้เลย เช่น แล้วใบแจ้งหนี้ของออเดอร์นี้ล่ะ?")
+    if chat_question:
+        st.chat_message("user").write(chat_question)
+        index = get_retrieval_index(domain, pmbok_use)
+        reused = context_covers(chat_question, chat["context"], index)
+        if not reused:
+            chat["context"] = merge_context(chat["context"], index.search(chat_question, top_k=8))
+        cancel_event = new_cancel_event()
+        with st.chat_message("assistant"):
+            queue_note = st.empty()
+            try:
+                answer = st.write_stream(
+                    call_ollama_stream(
+                        chat_question,
+                        chat["context"],
+                        cancel=cancel_event,
+                        on_wait=lambda pos: queue_note.info(f"รอคิวโมเดล: ลำดับที่ {pos}", icon="⏳"),
+                        history=chat["history"],
+                        summary=chat["summary"],
+                    )
+                )
+                queue_note.empty()
+            except OllamaBusyError as exc:
+                queue_note.warning(f"มีผู้ใช้งานโมเดลพร้อมกันมากเกินไป: {exc}", icon="⏳")
+                st.stop()
+            except OllamaCancelled:
+                # ยกเลิกกลางคัน: หยุดเงียบๆ ไม่บันทึกเป็น turn
+                queue_note.empty()
+                st.info("ยกเลิกคำถามก่อนหน้าแล้ว")
+                st.stop()
+            except Exception as exc:  # noqa: BLE001
+                queue_note.error(f"เรียก Ollama ไม่สำเร็จ: {exc}")
+                st.stop()
+            answer = answer if isinstance(answer, str) else "".join(map(str, answer))
+            st.caption("ใช้บริบทเดิมจากรอบก่อน (ไม่ค้นหาใหม่)" if reused else f"ค้นหาบริบทใหม่ ({len(chat['context'])} รายการ)")
+            render_context(chat["context"])
+        chat["turns"].append({"question": chat_question, "answer": answer})
+        chat["history"], chat["summary"] = compact_history(
+            chat["history"] + [{"role": "user", "content": chat_question}, {"role": "assistant", "content": answer}],
+            chat["summary"],
+        )
+    st.stop()
+
 question = st.text_area("ถามคำถาม", value=st.session_state.get("ai_question_prefill", ""), placeholder="เช่น สถานะออเดอร์ 182xxxx เป็นอย่างไร? หรือ Invoice ของ Customer X อยู่ที่สถานะอะไร?", height=120)
 
 st.markdown("**Quick prompts**")
@@ -308,15 +257,26 @@ if "ai_question_prefill" in st.session_state and not question.strip():
     question = st.session_state["ai_question_prefill"]
 if st.button("Ask AI", type="primary", disabled=not question.strip()):
     with st.spinner("กำลังค้นหาและตอบ..."):
-        corpus = build_corpus(project_df, invoice_df, domain, pmbok_use, pmbok_chunks, include_workflow=True)
-        context = rank_docs(question, corpus, top_k=8)
+        context = get_retrieval_index(domain, pmbok_use).search(question, top_k=8)
+        cancel_event = new_cancel_event()
+        queue_note = st.empty()
         try:
-            stream = call_ollama_stream(question, context)
+            stream = call_ollama_stream(
+                question,
+                context,
+                cancel=cancel_event,
+                on_wait=lambda pos: queue_note.info(f"รอคิวโมเดล: ลำดับที่ {pos}", icon="⏳"),
+            )
             st.subheader("Answer:")
             st.write_stream(stream)
-            with st.expander("ดูบริบทที่ใช้ตอบ (context)"):
-                for idx, doc in enumerate(context, 1):
-                    st.markdown(f"{idx}. **{doc['source']}** — {doc['text']}")
+            queue_note.empty()
+            render_context(context)
+        except OllamaBusyError as exc:
+            queue_note.empty()
+            st.warning(f"มีผู้ใช้งานโมเดลพร้อมกันมากเกินไป: {exc}", icon="⏳")
+        except OllamaCancelled:
+            queue_note.empty()
+            st.info("ยกเลิกคำถามก่อนหน้าแล้ว")
         except Exception as exc:  # noqa: BLE001
             st.error(f"เรียก Ollama ไม่สำเร็จ: {exc}")
 elif not question.strip():
@@ -1,10 +1,36 @@
-import csv
+import hashlib
 import json
-from io import BytesIO
+import os
+import threading
+import time
 
 import pandas as pd
 import streamlit as st
 
+from csv_ingest import (
+    ENCODING_CHOICES,
+    SEPARATOR_CHOICES,
+    load_frame,
+    preview_frame,
+    read_columns,
+    referenced_columns,
+    sniff_format,
+)
+from rule_engine import (
+    BULK_STEP_TYPE,
+    DEFAULT_MIN_SIMILARITY,
+    MATCH_MODES,
+    KeyIndexCache,
+    compile_plan,
+    iter_plan_results,
+    key_columns,
+    key_label,
+    key_values,
+    partition_steps,
+    run_plan,
+)
+from run_history import RunHistory, rule_set_hash, step_key
+
 try:
     from streamlit_sortables import sort_items
 
@@ -16,14 +42,27 @@ except Exception:
 
 def format_step_label(step: dict, index: int) -> str:
     """สร้างข้อความสั้นๆ ไว้แสดง/ลากเรียงลำดับ"""
-    src_filter = step["source"]["filter"]
-    tgt_filter = step["target"]["filter"]
-    src_kw = src_filter.get("keyword_value") or src_filter.get("keyword_column")
-    tgt_kw = tgt_filter.get("keyword_value") or tgt_filter.get("keyword_column")
+    src_kw = key_label(step["source"]["filter"])
+    tgt_kw = key_label(step["target"]["filter"])
     op = step["operator_block"]["operator_type"]
     return f"{index}. {step['source']['file_label']}[{src_kw}] -> {step['target']['file_label']}[{tgt_kw}] | {op}"
 
 
+def single_or_list(values: list):
+    """เก็บเป็นค่าเดียวเมื่อเลือกคอลัมน์เดียว เพื่อให้ rule-set JSON เดิมยังเหมือนเดิม"""
+    return values[0] if len(values) == 1 else list(values)
+
+
+def keyword_value_inputs(side: str, name: str, columns: list, example: str):
+    """ช่องกรอก keyword value หนึ่งช่องต่อ keyword column"""
+    if len(columns) <= 1:
+        return st.text_input(f"{name} keyword value (e.g. {example})", key=f"{side}_keyword_val")
+    return [
+        st.text_input(f"{name} keyword value: {col}", key=f"{side}_keyword_val_{col}")
+        for col in columns
+    ]
+
+
 def build_flow_chart(steps: list[dict]) -> str:
     """สร้าง Graphviz DOT สำหรับภาพรวม flow ของ steps"""
     lines = [
@@ -32,12 +71,10 @@ def build_flow_chart(steps: list[dict]) -> str:
         'node [shape=box style="rounded,filled" color="#3b82f6" fillcolor="#eef2ff" fontname="Arial"];',
     ]
     for idx, step in enumerate(steps, 1):
-        src_filter = step["source"]["filter"]
-        tgt_filter = step["target"]["filter"]
         label_parts = [
             f"Step {idx}",
-            f"{step['source']['file_label']} ({src_filter.get('keyword_value') or src_filter.get('keyword_column')})",
-            f"{step['target']['file_label']} ({tgt_filter.get('keyword_value') or tgt_filter.get('keyword_column')})",
+            f"{step['source']['file_label']} ({key_label(step['source']['filter'])})",
+            f"{step['target']['file_label']} ({key_label(step['target']['filter'])})",
             f"operator: {step['operator_block']['operator_type']}",
         ]
         label = "\\n".join(part for part in label_parts if part)
@@ -49,16 +86,23 @@ def build_flow_chart(steps: list[dict]) -> str:
     return "\n".join(lines)
 
 
-def detect_separator(file_bytes: bytes) -> str:
-    """ลองเดา delimiter จาก sample ของไฟล์"""
-    sample = file_bytes[:2048].decode("utf-8", errors="ignore")
-    common_delims = [",", ";", "\t", "|", ":"]
-    try:
-        sniff = csv.Sniffer().sniff(sample, delimiters=",".join(common_delims))
-        delim = sniff.delimiter
-    except Exception:
-        delim = ","
-    return delim if delim in common_delims else ","
+def result_rows(steps: list[dict], results: list[dict]) -> list[dict]:
+    """แปลงผลลัพธ์เป็นแถวสำหรับตารางสรุป"""
+    rows = []
+    for step, res in zip(steps, results):
+        rows.append(
+            {
+                "Step": step["step_id"],
+                "Status": res["status"],
+                "Reason": res.get("reason", ""),
+                "Source value": res.get("source_value"),
+                "Target value": res.get("target_value"),
+                "Source rows": res.get("source_rows"),  # bulk step เท่านั้น
+                "Target rows": res.get("target_rows"),
+                "Operator": step["operator_block"]["operator_type"],
+            }
+        )
+    return rows
 
 
 def describe_separator(sep: str) -> str:
@@ -66,84 +110,34 @@ def describe_separator(sep: str) -> str:
     return names.get(sep, sep)
 
 
-def get_value_from_df(dfs: dict, file_label: str, filter_cfg: dict, value_column: str):
-    """ดึงค่าจาก df ตาม filter (ถ้า value ว่างจะใช้ทั้งตาราง)"""
-    if file_label not in dfs:
-        return None, f"File '{file_label}' ยังไม่ถูกอัปโหลด"
-    df = dfs[file_label]
-    key_col = filter_cfg.get("keyword_column")
-    key_val = filter_cfg.get("keyword_value")
-    if key_col not in df.columns:
-        return None, f"ไม่พบคอลัมน์ {key_col} ในไฟล์ {file_label}"
-    filtered = df if key_val in (None, "",) else df[df[key_col] == key_val]
-    if filtered.empty:
-        return None, f"ไม่พบแถวที่ {key_col} = {key_val} ในไฟล์ {file_label}"
-    if value_column not in df.columns:
-        return None, f"ไม่พบ value column {value_column} ในไฟล์ {file_label}"
-    return filtered.iloc[0][value_column], None
-
-
-def to_number(value):
-    if value is None or pd.isna(value):
-        return None
-    try:
-        num = pd.to_numeric(value, errors="coerce")
-        if pd.isna(num):
-            return None
-        return float(num)
-    except Exception:
-        return None
-
-
-def evaluate_step(step: dict, dfs: dict) -> dict:
-    """ประเมิน step เดียวแล้วคืนผลลัพธ์ pass/fail/error"""
-    src_val, src_err = get_value_from_df(
-        dfs,
-        step["source"]["file_label"],
-        step["source"]["filter"],
-        step["source"]["value_column"],
-    )
-    if src_err:
-        return {"step_id": step["step_id"], "status": "error", "reason": src_err, "source_value": None, "target_value": None}
-
-    tgt_val, tgt_err = get_value_from_df(
-        dfs,
-        step["target"]["file_label"],
-        step["target"]["filter"],
-        step["target"]["value_column"],
-    )
-    if tgt_err:
-        return {"step_id": step["step_id"], "status": "error", "reason": tgt_err, "source_value": src_val, "target_value": None}
+# Ingestion is keyed by file hash + read options; "_file_bytes" is not hashed by Streamlit.
+@st.cache_data(max_entries=64, show_spinner=False)
+def ingest_format(file_hash: str, _file_bytes: bytes) -> tuple:
+    """(separator, encoding) sniffed once per file content"""
+    return sniff_format(_file_bytes)
+
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def ingest_columns(file_hash: str, sep: str, use_header: bool, encoding: str, _file_bytes: bytes) -> list:
+    return read_columns(_file_bytes, sep, use_header, encoding)
+
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def ingest_preview(file_hash: str, sep: str, use_header: bool, encoding: str, _file_bytes: bytes) -> pd.DataFrame:
+    return preview_frame(_file_bytes, sep, use_header, encoding=encoding)
+
+
+@st.cache_resource
+def get_run_history() -> RunHistory:
+    return RunHistory()
 
-    op = step["operator_block"]["operator_type"]
-    if op == "equal":
-        ok = src_val == tgt_val
-        reason = "ค่าเท่ากัน" if ok else "ค่าไม่เท่ากัน"
-    elif op == "not_equal":
-        ok = src_val != tgt_val
-        reason = "ค่าไม่เท่ากัน" if ok else "ค่าเท่ากัน"
-    elif op == "abs_diff_pct_max":
-        max_pct = step["operator_block"].get("max_pct")
-        src_num = to_number(src_val)
-        tgt_num = to_number(tgt_val)
-        if max_pct is None:
-            return {"step_id": step["step_id"], "status": "error", "reason": "ไม่ได้กำหนด max_pct", "source_value": src_val, "target_value": tgt_val}
-        if src_num is None or tgt_num is None:
-            return {"step_id": step["step_id"], "status": "error", "reason": "ค่าไม่สามารถแปลงเป็นตัวเลขได้", "source_value": src_val, "target_value": tgt_val}
-        denom = max(abs(tgt_num), 1e-9)
-        diff_pct = abs(src_num - tgt_num) / denom
-        ok = diff_pct <= max_pct
-        reason = f"diff {diff_pct*100:.2f}% (limit {max_pct*100:.2f}%)"
-    else:
-        return {"step_id": step["step_id"], "status": "error", "reason": f"ไม่รู้จัก operator {op}", "source_value": src_val, "target_value": tgt_val}
-
-    return {
-        "step_id": step["step_id"],
-        "status": "pass" if ok else "fail",
-        "reason": reason,
-        "source_value": src_val,
-        "target_value": tgt_val,
-    }
+
+@st.cache_resource(max_entries=16, show_spinner="กำลังอ่านไฟล์ ...")
+def ingest_frame(
+    file_hash: str, sep: str, use_header: bool, encoding: str, usecols: tuple, index_col, _file_bytes: bytes
+) -> pd.DataFrame:
+    """Only the columns the rule-set uses; cache_resource hands back the same frame (no copy) - do not mutate."""
+    return load_frame(_file_bytes, sep, use_header, usecols=list(usecols), index_col=index_col, encoding=encoding)
 
 
 st.set_page_config(page_title="Rule-based Mapping Builder", layout="wide")
@@ -159,23 +153,27 @@ uploaded_files = st.file_uploader(
     help="ลากหรือเลือกไฟล์ CSV ที่ต้องการใช้เปรียบเทียบ",
 )
 
-# เก็บ DataFrame ไว้ใน dict
+# เก็บ DataFrame ไว้ใน dict (เฉพาะคอลัมน์ที่ rule-set ใช้) และรายชื่อคอลัมน์ทั้งหมดของแต่ละไฟล์
 dfs: dict[str, pd.DataFrame] = {}
+file_columns: dict[str, list] = {}
 file_meta: dict[str, dict] = {}
 if "csv_options" not in st.session_state:
     st.session_state.csv_options = {}
-
-SEPARATOR_CHOICES = [",", ";", "\t", "|", ":"]
+if "key_index_cache" not in st.session_state:
+    # typed columns + keyword-column hash indexes, reused across steps and reruns
+    st.session_state.key_index_cache = KeyIndexCache()
 
 if uploaded_files:
     for f in uploaded_files:
         name = f.name
         file_bytes = f.getvalue()
-        detected_sep = detect_separator(file_bytes)
+        file_hash = hashlib.sha1(file_bytes).hexdigest()
+        detected_sep, detected_encoding = ingest_format(file_hash, file_bytes)
         opts = st.session_state.csv_options.setdefault(
             name,
             {
                 "sep": detected_sep,
+                "encoding": detected_encoding,
                 "header": True,
                 "set_index": False,
                 "index_col": None,
@@ -195,17 +193,28 @@ if uploaded_files:
             )
             opts["sep"] = sep_choice
 
+            encoding_options = list(dict.fromkeys([*ENCODING_CHOICES, detected_encoding]))
+            current_encoding = opts.get("encoding", detected_encoding)
+            encoding_choice = st.selectbox(
+                "Encoding",
+                options=encoding_options,
+                index=encoding_options.index(current_encoding) if current_encoding in encoding_options else 0,
+                key=f"encoding_{name}",
+                help=f"Auto-detected: {detected_encoding} (ไฟล์ภาษาไทยจาก Excel/ERP มักเป็น cp874 / TIS-620)",
+            )
+            opts["encoding"] = encoding_choice
+
             use_header = st.checkbox(
                 "Use first row as header",
                 value=opts["header"],
                 key=f"header_{name}",
             )
             opts["header"] = use_header
-            header_arg = 0 if use_header else None
 
-            # Read once with current sep/header to get columns
-            df_temp = pd.read_csv(BytesIO(file_bytes), sep=sep_choice, header=header_arg)
-            columns = list(df_temp.columns)
+            # Header + first rows only; the full file is read below, restricted to the rule-set's columns
+            columns = ingest_columns(file_hash, sep_choice, use_header, encoding_choice, file_bytes)
+            file_columns[name] = columns
+            preview = ingest_preview(file_hash, sep_choice, use_header, encoding_choice, file_bytes)
 
             set_index_flag = st.checkbox(
                 "Set index column",
@@ -226,22 +235,31 @@ if uploaded_files:
                     format_func=lambda x: str(x),
                 )
                 opts["index_col"] = index_col_val
-                df_temp = df_temp.set_index(index_col_val, drop=False)
+                preview = preview.set_index(index_col_val, drop=False)
             else:
                 opts["index_col"] = None
 
-            dfs[name] = df_temp
+            usecols = tuple(c for c in referenced_columns(st.session_state.get("steps", []), name) if c in columns)
+            if usecols:
+                df_temp = ingest_frame(
+                    file_hash, sep_choice, use_header, encoding_choice, usecols, opts["index_col"], file_bytes
+                )
+                df_temp = df_temp.copy(deep=False)  # own attrs, shared data
+                df_temp.attrs["fingerprint"] = (file_hash, sep_choice, use_header, encoding_choice, opts["index_col"])
+                dfs[name] = df_temp
             file_meta[name] = {
                 "separator": sep_choice,
                 "header": "with header" if use_header else "no header",
                 "index": opts["index_col"] if set_index_flag else None,
+                "sha1": file_hash,
             }
 
             st.caption(
                 f"Separator: {describe_separator(sep_choice)} | Header: {file_meta[name]['header']} | "
-                f"Index: {file_meta[name]['index'] if file_meta[name]['index'] is not None else '-'}"
+                f"Index: {file_meta[name]['index'] if file_meta[name]['index'] is not None else '-'} | "
+                f"Loaded columns: {len(usecols)}/{len(columns)}"
             )
-            st.dataframe(df_temp.head(), use_container_width=True)
+            st.dataframe(preview, use_container_width=True)
 
 # --------- Block 2: Create Rule-set with + Steps ---------
 st.markdown("---")
@@ -271,29 +289,35 @@ if st.session_state.steps:
 builder_col, flow_col = st.columns([1.3, 1])
 
 # Add Step Form
-if dfs:
+if file_columns:
     with builder_col:
         with st.expander("➕ Add Step", expanded=True):
             step_type = st.selectbox(
                 "Step type",
-                options=["compare_two_files"],  # เผื่ออนาคตเพิ่ม type อื่น
-                format_func=lambda x: "Compare between 2 files"
-                if x == "compare_two_files"
-                else x,
+                options=["compare_two_files", BULK_STEP_TYPE],
+                format_func=lambda x: {
+                    "compare_two_files": "Compare between 2 files",
+                    BULK_STEP_TYPE: "Compare all keys between 2 files (bulk)",
+                }.get(x, x),
             )
+            is_bulk = step_type == BULK_STEP_TYPE
+            if is_bulk:
+                st.caption("Bulk: เทียบทุก key ที่ตรงกันระหว่าง 2 ไฟล์ในครั้งเดียว ไม่ต้องกรอก keyword value")
 
-            file_names = list(dfs.keys())
+            file_names = list(file_columns.keys())
 
             # Source side
             st.markdown("**Source (ด้านซ้าย)**")
             src_file = st.selectbox("Source file", options=file_names, key="src_file")
-            src_cols = list(dfs[src_file].columns)
-            src_keyword_col = st.selectbox(
-                "Source keyword column", options=src_cols, key="src_keyword_col"
-            )
-            src_keyword_val = st.text_input(
-                "Source keyword value (e.g. RS001)", key="src_keyword_val"
+            src_cols = list(file_columns[src_file])
+            src_keyword_col = st.multiselect(
+                "Source keyword column(s)",
+                options=src_cols,
+                default=src_cols[:1],
+                key="src_keyword_col",
+                help="เลือกหลายคอลัมน์เมื่อ key ประกอบจากหลายค่า เช่น ชื่อลูกค้า + เลขที่ order",
             )
+            src_keyword_val = "" if is_bulk else keyword_value_inputs("src", "Source", src_keyword_col, "RS001")
             src_value_col = st.selectbox(
                 "Source value column", options=src_cols, key="src_value_col"
             )
@@ -303,17 +327,37 @@ if dfs:
             # Target side
             st.markdown("**Target (ด้านขวา)**")
             tgt_file = st.selectbox("Target file", options=file_names, key="tgt_file")
-            tgt_cols = list(dfs[tgt_file].columns)
-            tgt_keyword_col = st.selectbox(
-                "Target keyword column", options=tgt_cols, key="tgt_keyword_col"
-            )
-            tgt_keyword_val = st.text_input(
-                "Target keyword value (e.g. SW001)", key="tgt_keyword_val"
+            tgt_cols = list(file_columns[tgt_file])
+            tgt_keyword_col = st.multiselect(
+                "Target keyword column(s)",
+                options=tgt_cols,
+                default=tgt_cols[:1],
+                key="tgt_keyword_col",
+                help="เลือกหลายคอลัมน์เมื่อ key ประกอบจากหลายค่า เช่น ชื่อลูกค้า + เลขที่ order",
             )
+            tgt_keyword_val = "" if is_bulk else keyword_value_inputs("tgt", "Target", tgt_keyword_col, "SW001")
             tgt_value_col = st.selectbox(
                 "Target value column", options=tgt_cols, key="tgt_value_col"
             )
 
+            st.markdown("---")
+            st.markdown("**Key matching**")
+            match_mode = st.selectbox(
+                "Match mode",
+                options=MATCH_MODES,
+                format_func=lambda x: {
+                    "exact": "exact - ค่าต้องตรงกันทุกตัวอักษร",
+                    "normalized": "normalized - ไม่สนตัวพิมพ์เล็ก/ใหญ่ ช่องว่าง และเครื่องหมายวรรคตอน",
+                    "fuzzy": "fuzzy - ยอมให้สะกดต่างกันเล็กน้อย",
+                }.get(x, x),
+            )
+            min_similarity = None
+            if match_mode == "fuzzy":
+                min_similarity = st.slider(
+                    "Min similarity", min_value=0.5, max_value=1.0, value=DEFAULT_MIN_SIMILARITY, step=0.01
+                )
+                st.caption("คอลัมน์ตัวเลข/วันที่ใน key ยังต้องตรงกันพอดี และใช้จำกัดกลุ่มแถวที่นำมาเทียบ fuzzy")
+
             st.markdown("---")
             st.markdown("**Operator / Rule**")
             operator_type = st.selectbox(
@@ -326,14 +370,14 @@ if dfs:
                     "Max allowed difference (%)", min_value=0.0, value=1.0, step=0.1
                 )
 
-            if st.button("➕ Add this Step"):
+            if st.button("➕ Add this Step", disabled=not (src_keyword_col and tgt_keyword_col)):
                 step = {
                     "step_id": len(st.session_state.steps) + 1,
                     "step_type": step_type,
                     "source": {
                         "file_label": src_file,
                         "filter": {
-                            "keyword_column": src_keyword_col,
+                            "keyword_column": single_or_list(src_keyword_col),
                             "keyword_value": src_keyword_val,
                         },
                         "value_column": src_value_col,
@@ -341,7 +385,7 @@ if dfs:
                     "target": {
                         "file_label": tgt_file,
                         "filter": {
-                            "keyword_column": tgt_keyword_col,
+                            "keyword_column": single_or_list(tgt_keyword_col),
                             "keyword_value": tgt_keyword_val,
                         },
                         "value_column": tgt_value_col,
@@ -352,6 +396,11 @@ if dfs:
                 }
                 if max_pct is not None:
                     step["operator_block"]["max_pct"] = max_pct / 100.0  # เก็บเป็น 0.xx
+                if match_mode != "exact":
+                    for side in ("source", "target"):
+                        step[side]["filter"]["match"] = match_mode
+                        if min_similarity is not None:
+                            step[side]["filter"]["min_similarity"] = min_similarity
 
                 st.session_state.steps.append(step)
                 st.session_state.step_label_cache = []
@@ -399,8 +448,10 @@ with flow_col:
             summary_rows.append(
                 {
                     "Order": idx,
-                    "Source": f"{step['source']['file_label']} [{step['source']['filter']['keyword_value']}]",
-                    "Target": f"{step['target']['file_label']} [{step['target']['filter']['keyword_value']}]",
+                    "Source": f"{step['source']['file_label']} [{key_label(step['source']['filter']) if key_values(step['source']['filter']) else 'all keys'}]",
+                    "Target": f"{step['target']['file_label']} [{key_label(step['target']['filter']) if key_values(step['target']['filter']) else 'all keys'}]",
+                    "Key": " + ".join(map(str, key_columns(step["source"]["filter"]))),
+                    "Match": step["source"]["filter"].get("match", "exact"),
                     "Operator": step["operator_block"]["operator_type"],
                 }
             )
@@ -423,16 +474,88 @@ if st.session_state.steps:
 st.markdown("---")
 st.subheader("3. Run rule-set on uploaded data")
 
-if not dfs:
+if not file_columns:
     st.info("ต้องอัปโหลด CSV ก่อน ถึงจะรัน rule-set ได้")
 elif not st.session_state.steps:
     st.info("ยังไม่มี Step ให้รัน กด ➕ Add Step ก่อน")
 else:
-    run_col, _ = st.columns([1, 3])
+    run_col, workers_col, executor_col, history_col = st.columns([1, 1, 1, 1])
+    workers = workers_col.number_input(
+        "Workers",
+        min_value=1,
+        max_value=max(2, (os.cpu_count() or 1) * 2),
+        value=1,
+        step=1,
+        help="1 = รันทั้ง rule-set เป็น plan เดียว, มากกว่า 1 = รันกลุ่ม step ที่ไม่ขึ้นต่อกันแบบขนาน",
+    )
+    executor_kind = executor_col.selectbox(
+        "Executor",
+        options=["thread", "process"],
+        disabled=workers == 1,
+        help="process เหมาะกับ bulk step ขนาดใหญ่ (ใช้ CPU หลายคอร์ได้ แต่ต้องคัดลอกข้อมูลไปแต่ละ process)",
+    )
+    save_history = history_col.checkbox(
+        "Save run to history",
+        value=True,
+        help="เก็บผลทุกครั้งที่รันไว้ใน rule_history.sqlite เพื่อเทียบกับรอบก่อนหน้าได้ (ข้อ 5)",
+    )
     if run_col.button("▶️ Run rules now"):
-        st.session_state.last_run_results = [
-            evaluate_step(step, dfs) for step in st.session_state.steps
-        ]
+        steps = st.session_state.steps
+        plan = compile_plan(steps)
+        if workers == 1:
+            results, timings = run_plan(plan, dfs, st.session_state.key_index_cache)
+            st.session_state.last_run_results = results
+            st.session_state.last_run_plan = {"summary": plan.describe(), "timings": timings}
+        else:
+            # Unfinished steps stay "pending" if the run is cancelled
+            st.session_state.last_run_results = [
+                {"step_id": step["step_id"], "status": "pending", "reason": "ยังไม่ได้รัน / ถูกยกเลิก", "source_value": None, "target_value": None}
+                for step in steps
+            ]
+            st.button("⏹ Cancel run")  # clicking it reruns the page, which stops the loop below
+            progress = st.progress(0.0)
+            live_table = st.empty()
+            cancel = threading.Event()
+            timings: dict[str, float] = {}
+            done = 0
+            started = time.perf_counter()
+            try:
+                for positions, unit_results, unit_timings in iter_plan_results(
+                    steps,
+                    dfs,
+                    st.session_state.key_index_cache,
+                    workers=int(workers),
+                    use_processes=executor_kind == "process",
+                    cancel=cancel,
+                ):
+                    for pos, res in zip(positions, unit_results):
+                        st.session_state.last_run_results[pos] = res
+                    for stage, ms in unit_timings.items():
+                        timings[stage] = timings.get(stage, 0.0) + ms
+                    done += len(positions)
+                    progress.progress(done / len(steps), text=f"{done}/{len(steps)} steps")
+                    live_table.dataframe(
+                        pd.DataFrame(result_rows(steps, st.session_state.last_run_results)),
+                        use_container_width=True,
+                        hide_index=True,
+                    )
+            finally:
+                cancel.set()
+            timings["wall"] = (time.perf_counter() - started) * 1000
+            progress.empty()
+            live_table.empty()
+            st.session_state.last_run_plan = {
+                "summary": {**plan.describe(), "workers": int(workers), "units": len(partition_steps(steps))},
+                "timings": timings,
+            }
+        if save_history:
+            get_run_history().record_run(
+                steps,
+                st.session_state.last_run_results,
+                {name: meta["sha1"] for name, meta in file_meta.items()},
+                st.session_state.last_run_plan["timings"],
+                rule_set_name=rule_set_name,
+            )
         st.success("รันกติกาเสร็จแล้ว ✅")
 
     results = st.session_state.last_run_results
@@ -447,25 +570,52 @@ else:
         m2.metric("Fail", fail_count)
         m3.metric("Error", err_count)
         m4.metric("Total steps", total)
+        pending_count = total - pass_count - fail_count - err_count
+        if pending_count:
+            st.caption(f"⏹ รันไม่ครบ: ยังเหลือ {pending_count} step ที่ไม่ได้รัน (ถูกยกเลิก)")
+
+        plan_info = st.session_state.get("last_run_plan")
+        if plan_info:
+            with st.expander("⏱ Execution plan & timings"):
+                st.caption(
+                    " | ".join(f"{k.replace('_', ' ')}: {v}" for k, v in plan_info["summary"].items())
+                )
+                st.dataframe(
+                    pd.DataFrame(
+                        [{"Stage": k, "Time (ms)": round(v, 2)} for k, v in plan_info["timings"].items()]
+                    ),
+                    use_container_width=True,
+                    hide_index=True,
+                )
 
-        rows = []
-        for step, res in zip(st.session_state.steps, results):
-            rows.append(
-                {
-                    "Step": step["step_id"],
-                    "Status": res["status"],
-                    "Reason": res.get("reason", ""),
-                    "Source value": res.get("source_value"),
-                    "Target value": res.get("target_value"),
-                    "Operator": step["operator_block"]["operator_type"],
-                }
-            )
         st.dataframe(
-            pd.DataFrame(rows),
+            pd.DataFrame(result_rows(st.session_state.steps, results)),
             use_container_width=True,
             hide_index=True,
         )
 
+        for step, res in zip(st.session_state.steps, results):
+            details = res.get("details")
+            if details is None:
+                continue
+            with st.expander(f"🔎 Step {step['step_id']} — ผลราย key ({res['reason']})"):
+                show_status = st.multiselect(
+                    "Status",
+                    options=["pass", "fail", "error"],
+                    default=["fail", "error"],
+                    key=f"bulk_status_{step['step_id']}",
+                )
+                view = details[details["status"].isin(show_status)]
+                st.dataframe(view.head(5000), use_container_width=True, hide_index=True)
+                st.caption(f"แสดง {min(len(view), 5000):,} จาก {len(view):,} แถว")
+                st.download_button(
+                    "⬇️ Download per-key results (CSV)",
+                    data=view.to_csv(index=False).encode("utf-8"),
+                    file_name=f"step_{step['step_id']}_details.csv",
+                    mime="text/csv",
+                    key=f"bulk_download_{step['step_id']}",
+                )
+
 # --------- Block 4: Save Rule-set ---------
 st.markdown("---")
 st.subheader("4. Save Rule-set")
@@ -486,3 +636,45 @@ if st.session_state.steps:
     )
 else:
     st.info("ยังไม่มี Step ให้สร้าง Rule-set เลย กด ➕ Add Step ก่อนน้า")
+
+# --------- Block 5: Run history ---------
+st.markdown("---")
+st.subheader("5. Run history")
+
+history = get_run_history()
+only_current = st.checkbox(
+    "เฉพาะ rule-set ปัจจุบัน",
+    value=bool(st.session_state.steps),
+    disabled=not st.session_state.steps,
+)
+past_runs = history.runs(rule_set_hash(st.session_state.steps) if only_current and st.session_state.steps else None)
+if len(past_runs) < 2:
+    st.info("ต้องมีผลการรันที่บันทึกไว้อย่างน้อย 2 ครั้ง ถึงจะเทียบความเปลี่ยนแปลงได้")
+else:
+    run_labels = {
+        row.run_id: f"#{row.run_id} · {row.created_at} · {row.rule_set_name or '-'} · "
+        + " / ".join(f"{k} {v}" for k, v in row.summary.items())
+        for row in past_runs.itertuples()
+    }
+    run_ids = list(run_labels)
+    old_col, new_col = st.columns(2)
+    new_run = new_col.selectbox("Run (ใหม่)", options=run_ids, index=0, format_func=run_labels.get)
+    old_run = old_col.selectbox("เทียบกับ run (เก่า)", options=run_ids, index=1, format_func=run_labels.get)
+    old_files, new_files = (past_runs.set_index("run_id").at[r, "file_hashes"] for r in (old_run, new_run))
+    changed_files = sorted(name for name in set(old_files) | set(new_files) if old_files.get(name) != new_files.get(name))
+    st.caption("ไฟล์ที่เปลี่ยน: " + (", ".join(changed_files) if changed_files else "ไม่มี (ไฟล์เดิมทั้งหมด)"))
+
+    show_all = st.checkbox("แสดง step ที่ไม่เปลี่ยนด้วย", value=False)
+    diff = history.diff_runs(old_run, new_run, include_unchanged=show_all)
+    if diff.empty:
+        st.success("ผลลัพธ์ไม่เปลี่ยนจาก run ที่เลือก ✅")
+    else:
+        st.dataframe(diff.drop(columns=["step_key"]), use_container_width=True, hide_index=True)
+
+    bulk_keys = {step_key(s): s for s in st.session_state.steps if s.get("step_type") == BULK_STEP_TYPE}
+    for key in diff["step_key"]:
+        if key not in bulk_keys:
+            continue
+        key_diff = history.diff_bulk(old_run, new_run, key)
+        with st.expander(f"🔎 Step {bulk_keys[key]['step_id']} — key ที่เปลี่ยน ({len(key_diff):,})"):
+            st.dataframe(key_diff.head(5000), use_container_width=True, hide_index=True)
@@ -1,8 +1,42 @@
 # streamlit_app.py
 
+import os
+
 import pydeck as pdk
 import streamlit as st
-import pymongo
+from pymongo.errors import WriteError
+
+from mongo_client import ClientDiagnostics, backend_name, client_options, create_client
+from gazetteer import province_names
+from mongo_users import (
+    COUNT_LIMIT,
+    IMPORT_BATCH,
+    PAGE_SIZE,
+    UserConflict,
+    backfill_geo,
+    backfill_search_fields,
+    build_filter,
+    choice_label,
+    count_users,
+    delete_user,
+    ensure_indexes,
+    ensure_schema,
+    errors_csv,
+    export_to_file,
+    fetch_page,
+    find_choices,
+    geo_points,
+    get_user,
+    import_users,
+    parse_import,
+    search_tiers,
+    summary_stats,
+    table_rows,
+    update_user,
+    user_doc,
+    validate_user,
+)
+from user_feed import LiveSummary
 
 st.set_page_config(page_title="MongoDB CRUD Demo", layout="wide")
 
@@ -17,18 +51,61 @@ def init_connection():
     # port = 27017
     # username = "..."
     # password = "..."
-    return pymongo.MongoClient(**st.secrets["mongo"])
+    # maxPoolSize = 50             # (ไม่บังคับ) ค่าอื่นๆ ของ pool / timeout / readPreference
+    # waitQueueTimeoutMS = 2000    # ดูค่า default ใน mongo_client.DEFAULT_CLIENT_OPTIONS
+    # backend = "mongomock"        # (ไม่บังคับ) ทดลองแบบไม่มี server หรือตั้ง env MONGO_BACKEND=mongomock
+    try:
+        secrets = st.secrets["mongo"]
+    except (KeyError, FileNotFoundError):  # ไม่มี secrets.toml / ไม่มีส่วน [mongo]: ใช้ค่า default (localhost)
+        secrets = {}
+    diagnostics = ClientDiagnostics()
+    options = client_options(secrets)
+    return create_client(options, diagnostics), diagnostics, {**options, "backend": backend_name(options)}
 
-client = init_connection()
+client, client_diagnostics, client_settings = init_connection()
 db = client["test_db"]            # ปรับชื่อ DB ตามจริง
 collection = db["users"]   # ปรับชื่อ collection ตามจริง
 
+
+@st.cache_resource
+def prepare_collection(_collection, name: str):
+    # สร้าง index ครั้งเดียวต่อ process (filter / sort / ค้นหาของหน้านี้ใช้ index ทั้งหมด)
+    ensure_indexes(_collection)
+    # validator ฝั่ง server (กฎเดียวกับฟอร์ม); ถ้าไม่มีสิทธิ์ collMod ก็ทำงานต่อได้
+    ensure_schema(_collection)
+    # เอกสารเก่าที่ยังไม่มี field สำหรับค้นหา / พิกัดจังหวัด
+    return backfill_search_fields(_collection) + backfill_geo(_collection)
+
+
+prepare_collection(collection, collection.full_name)
+
 # -------------------------
 # 2) Helper: load data
 # -------------------------
-def get_data():
-    items = list(collection.find())
-    return items
+@st.cache_resource
+def get_live_summary(name: str, _collection):
+    # สรุปจำนวนผู้ใช้ต่อเมือง ใช้ร่วมกันทุก session; อัปเดตทีละ event จาก change stream (หรือ polling)
+    return LiveSummary(_collection).start()
+
+
+live_summary = get_live_summary(collection.full_name, collection)
+
+
+def after_write():
+    # รอให้ summary เห็นการเขียนของเราก่อน rerun (ไม่ต้องโหลดข้อมูลใหม่ทั้งหมด)
+    live_summary.catch_up()
+    trigger_rerun()
+
+
+def reset_browse_cursor():
+    st.session_state.browse_cursors = [None]
+
+
+def forget_edit(user_id):
+    # ลืมค่าที่แก้ค้างไว้ + version ตั้งต้น ให้ฟอร์มโหลดค่าล่าสุดจากฐานข้อมูลรอบหน้า
+    for prefix in ("edit_name_", "edit_age_", "edit_city_", "edit_base_"):
+        st.session_state.pop(f"{prefix}{user_id}", None)
+    st.session_state.pop("edit_conflict", None)
 
 
 def trigger_rerun():
@@ -41,199 +118,33 @@ def trigger_rerun():
 
 @st.cache_data(show_spinner=False)
 def load_thai_cities():
-    """Return a static list of Thai provinces for selection."""
-    provinces = [
-        "Bangkok",
-        "Krabi",
-        "Kanchanaburi",
-        "Kalasin",
-        "Kamphaeng Phet",
-        "Khon Kaen",
-        "Chanthaburi",
-        "Chachoengsao",
-        "Chai Nat",
-        "Chaiyaphum",
-        "Chumphon",
-        "Chiang Rai",
-        "Chiang Mai",
-        "Trang",
-        "Trat",
-        "Tak",
-        "Nakhon Nayok",
-        "Nakhon Pathom",
-        "Nakhon Phanom",
-        "Nakhon Ratchasima",
-        "Nakhon Si Thammarat",
-        "Nan",
-        "Nonthaburi",
-        "Buriram",
-        "Pathum Thani",
-        "Prachuap Khiri Khan",
-        "Prachin Buri",
-        "Pattani",
-        "Phra Nakhon Si Ayutthaya",
-        "Phang Nga",
-        "Phatthalung",
-        "Phichit",
-        "Phitsanulok",
-        "Phetchaburi",
-        "Phetchabun",
-        "Phuket",
-        "Maha Sarakham",
-        "Mukdahan",
-        "Mae Hong Son",
-        "Yasothon",
-        "Yala",
-        "Roi Et",
-        "Ranong",
-        "Rayong",
-        "Ratchaburi",
-        "Lopburi",
-        "Lampang",
-        "Lamphun",
-        "Loei",
-        "Si Sa Ket",
-        "Sakon Nakhon",
-        "Songkhla",
-        "Satun",
-        "Samut Prakan",
-        "Samut Songkhram",
-        "Samut Sakhon",
-        "Sa Kaeo",
-        "Saraburi",
-        "Sing Buri",
-        "Sukhothai",
-        "Suphan Buri",
-        "Surat Thani",
-        "Surin",
-        "Nong Khai",
-        "Nong Bua Lamphu",
-        "Ang Thong",
-        "Udon Thani",
-        "Uttaradit",
-        "Uthai Thani",
-        "Ubon Ratchathani",
-        "Amnat Charoen",
-    ]
-    return ["Select a city"] + provinces
+    """Return the Thai provinces (gazetteer) for selection."""
+    return ["Select a city"] + province_names()
 
 
 city_options = load_thai_cities()
 
-# Approximate lat/lon for Thai provinces (used for geo visualization)
-THAI_CITY_COORDS = {
-    "Bangkok": (13.7563, 100.5018),
-    "Krabi": (8.0863, 98.9063),
-    "Kanchanaburi": (14.0228, 99.5328),
-    "Kalasin": (16.4380, 103.5060),
-    "Kamphaeng Phet": (16.4827, 99.5228),
-    "Khon Kaen": (16.4419, 102.8350),
-    "Chanthaburi": (12.6114, 102.1038),
-    "Chachoengsao": (13.6904, 101.0779),
-    "Chai Nat": (15.1859, 100.1250),
-    "Chaiyaphum": (15.8106, 102.0280),
-    "Chumphon": (10.4930, 99.1800),
-    "Chiang Rai": (19.9105, 99.8406),
-    "Chiang Mai": (18.7883, 98.9853),
-    "Trang": (7.5590, 99.6110),
-    "Trat": (12.2420, 102.5170),
-    "Tak": (16.8840, 99.1250),
-    "Nakhon Nayok": (14.2030, 101.2130),
-    "Nakhon Pathom": (13.8196, 100.0622),
-    "Nakhon Phanom": (17.4100, 104.7830),
-    "Nakhon Ratchasima": (14.9799, 102.0977),
-    "Nakhon Si Thammarat": (8.4304, 99.9631),
-    "Nan": (18.7750, 100.7730),
-    "Nonthaburi": (13.8621, 100.5144),
-    "Buriram": (14.9940, 103.1039),
-    "Pathum Thani": (14.0208, 100.5250),
-    "Prachuap Khiri Khan": (11.8110, 99.7970),
-    "Prachin Buri": (14.0490, 101.3700),
-    "Pattani": (6.8697, 101.2510),
-    "Phra Nakhon Si Ayutthaya": (14.3692, 100.5877),
-    "Phang Nga": (8.4510, 98.5252),
-    "Phatthalung": (7.6167, 100.0734),
-    "Phichit": (16.4419, 100.3488),
-    "Phitsanulok": (16.8210, 100.2627),
-    "Phetchaburi": (13.1110, 99.9380),
-    "Phetchabun": (16.4180, 101.1540),
-    "Phuket": (7.8804, 98.3923),
-    "Maha Sarakham": (16.1846, 103.3007),
-    "Mukdahan": (16.5453, 104.7236),
-    "Mae Hong Son": (19.3013, 97.9654),
-    "Yasothon": (15.7927, 104.1453),
-    "Yala": (6.5410, 101.2800),
-    "Roi Et": (16.0538, 103.6520),
-    "Ranong": (9.9529, 98.6085),
-    "Rayong": (12.6814, 101.2780),
-    "Ratchaburi": (13.5283, 99.8134),
-    "Lopburi": (14.7995, 100.6534),
-    "Lampang": (18.2888, 99.4928),
-    "Lamphun": (18.5745, 99.0087),
-    "Loei": (17.4860, 101.7223),
-    "Si Sa Ket": (15.1143, 104.3290),
-    "Sakon Nakhon": (17.1546, 104.1476),
-    "Songkhla": (7.1898, 100.5951),
-    "Satun": (6.6238, 100.0674),
-    "Samut Prakan": (13.5991, 100.5990),
-    "Samut Songkhram": (13.4094, 100.0020),
-    "Samut Sakhon": (13.5475, 100.2744),
-    "Sa Kaeo": (13.8176, 102.0680),
-    "Saraburi": (14.5289, 100.9106),
-    "Sing Buri": (14.8920, 100.3960),
-    "Sukhothai": (17.0050, 99.8260),
-    "Suphan Buri": (14.4730, 100.1220),
-    "Surat Thani": (9.1382, 99.3215),
-    "Surin": (14.8818, 103.4937),
-    "Nong Khai": (17.8783, 102.7413),
-    "Nong Bua Lamphu": (17.2040, 102.4390),
-    "Ang Thong": (14.5913, 100.4550),
-    "Udon Thani": (17.3647, 102.8150),
-    "Uttaradit": (17.6233, 100.0993),
-    "Uthai Thani": (15.3794, 100.0245),
-    "Ubon Ratchathani": (15.2287, 104.8560),
-    "Amnat Charoen": (15.8581, 104.6288),
-}
-
-
-def compute_stats(users):
-    total = len(users)
-    ages = [u.get("age") for u in users if isinstance(u.get("age"), (int, float))]
-    avg_age = round(sum(ages) / len(ages), 1) if ages else 0
-    unique_cities = len({(u.get("city") or "").strip().lower() for u in users if u.get("city")})
-    return total, avg_age, unique_cities
-
-
-def build_geo_points(users):
-    """Aggregate users by city and attach lat/lon for mapping."""
-    by_city = {}
-    for user in users:
-        city = (user.get("city") or "").split(",")[0].strip()
-        if not city:
-            continue
-        coords = THAI_CITY_COORDS.get(city)
-        if not coords:
-            continue
-        entry = by_city.setdefault(city, {"city": city, "lat": coords[0], "lon": coords[1], "count": 0})
-        entry["count"] += 1
-    return list(by_city.values())
-
 # -------------------------
 # 3) หน้า UI หลัก
 # -------------------------
 st.title("👥 MongoDB + Streamlit")
 st.caption("จัดการ users ได้ไวขึ้น: ฟอร์มด้านซ้าย, ตารางค้นหา, และส่วนแก้ไข/ลบแบบแยกชัดเจน")
 
-items = get_data()
-total_users, avg_age, unique_cities = compute_stats(items)
+def render_metrics():
+    total_users, avg_age, unique_cities = summary_stats(live_summary.rows())
+    col_m1, col_m2, col_m3 = st.columns(3)
+    col_m1.metric("Users", total_users)
+    col_m2.metric("Avg. age", avg_age)
+    col_m3.metric("Unique city", unique_cities)
+    st.caption(f"อัปเดตสด ({live_summary.mode}) · revision {live_summary.revision}")
+
 
-col_m1, col_m2, col_m3 = st.columns(3)
-col_m1.metric("Users", total_users)
-col_m2.metric("Avg. age", avg_age)
-col_m3.metric("Unique city", unique_cities)
+# ถ้ามี st.fragment ให้ metrics รีเฟรชเองทุกไม่กี่วินาที เพื่อเห็นการแก้ไขจาก session อื่น
+fragment = getattr(st, "fragment", None)
+(fragment(run_every=5)(render_metrics) if fragment else render_metrics)()
 
-tab_create, tab_browse, tab_map, tab_manage = st.tabs(
-    ["➕ เพิ่มผู้ใช้", "📖 ดู/ค้นหา", "🗺️ แผนที่", "✏️ แก้ไข / 🗑 ลบ"]
+tab_create, tab_browse, tab_map, tab_manage, tab_bulk = st.tabs(
+    ["➕ เพิ่มผู้ใช้", "📖 ดู/ค้นหา", "🗺️ แผนที่", "✏️ แก้ไข / 🗑 ลบ", "📦 นำเข้า / ส่งออก"]
 )
 
 with tab_create:
@@ -249,38 +160,55 @@ with tab_create:
             if new_name.strip() == "" or new_city == "Select a city":
                 st.error("กรุณากรอกชื่อและเลือกเมืองก่อนน้า 🥺")
             else:
-                doc = {"name": new_name.strip(), "age": int(new_age), "city": new_city}
+                doc = user_doc(new_name.strip(), int(new_age), new_city)
                 collection.insert_one(doc)
                 st.success(f"เพิ่ม {new_name} เรียบร้อยแล้ว ✅")
-                trigger_rerun()
+                after_write()
 
 with tab_browse:
-    search_term = st.text_input("ค้นหาชื่อหรือเมือง", placeholder="เช่น 'Bangkok' หรือ 'สมชาย'", label_visibility="collapsed")
-    if search_term:
-        lowered = search_term.lower()
-        filtered = [
-            u for u in items
-            if lowered in (u.get("name") or "").lower() or lowered in (u.get("city") or "").lower()
-        ]
-    else:
-        filtered = items
+    f1, f2 = st.columns((3, 2))
+    search_term = f1.text_input(
+        "ค้นหาชื่อหรือเมือง",
+        placeholder="เช่น 'Bangkok' หรือ 'สมชาย'",
+        label_visibility="collapsed",
+        on_change=reset_browse_cursor,
+    )
+    city_filter = f2.selectbox(
+        "City filter",
+        options=city_options,
+        index=0,
+        label_visibility="collapsed",
+        on_change=reset_browse_cursor,
+    )
+    # กรองด้วยจังหวัดที่ resolve ไว้ตอนบันทึก ("Korat" / "โคราช" อยู่ใน Nakhon Ratchasima)
+    province_value = None if city_filter == "Select a city" else city_filter
+    query = build_filter(search_term, province_value)
+
+    # cursor ของแต่ละหน้า (_id ตัวสุดท้ายของหน้าก่อน) เก็บเป็น stack ไว้กดย้อนกลับได้
+    if "browse_cursors" not in st.session_state:
+        reset_browse_cursor()
+    cursors = st.session_state.browse_cursors
+    # เรียงตามความตรง: ชื่อตรงทั้งหมด > ชื่อขึ้นต้นด้วยคำค้น > คำอื่นๆ (ชื่อ/เมือง) ขึ้นต้นด้วยคำค้น
+    page_docs, next_id = fetch_page(collection, search_tiers(search_term, province_value), after=cursors[-1], limit=PAGE_SIZE)
 
-    if not filtered:
-        st.info("ยังไม่มีข้อมูลใน collection เลย ลองเพิ่มด้านบนก่อน 👆")
+    if not page_docs:
+        st.info("ยังไม่มีข้อมูลใน collection เลย ลองเพิ่มด้านบนก่อน 👆" if not query else "ไม่พบผู้ใช้ที่ตรงกับเงื่อนไข")
     else:
-        for item in filtered:
-            item["_id_str"] = str(item["_id"])
-        st.dataframe(
-            [
-                {"id": i["_id_str"], "name": i.get("name"), "age": i.get("age"), "city": i.get("city")}
-                for i in filtered
-            ],
-            use_container_width=True,
-            height=360,
-        )
+        st.dataframe(table_rows(page_docs), use_container_width=True, height=360)
+        nav_prev, nav_info, nav_next = st.columns((1, 3, 1))
+        if nav_prev.button("◀ ก่อนหน้า", disabled=len(cursors) == 1):
+            cursors.pop()
+            trigger_rerun()
+        # นับแบบมีเพดาน (count_documents limit) ไม่ต้องไล่นับผลค้นหาทั้งหมดทุก rerun
+        matched = count_users(collection, query, limit=COUNT_LIMIT)
+        total_label = f"{matched:,}+" if query and matched >= COUNT_LIMIT else f"{matched:,}"
+        nav_info.caption(f"หน้า {len(cursors)} · {total_label} users")
+        if nav_next.button("ถัดไป ▶", disabled=next_id is None):
+            cursors.append(next_id)
+            trigger_rerun()
 
 with tab_map:
-    points = build_geo_points(items)
+    points = geo_points(live_summary.rows())
     if not points:
         st.info("ยังไม่มีข้อมูลเมืองที่จับคู่พิกัดได้")
     else:
@@ -316,49 +244,176 @@ with tab_map:
         )
 
 with tab_manage:
-    if not items:
-        st.info("ยังไม่มี user ให้แก้ไขหรือลบน้า")
+    manage_search = st.text_input("ค้นหา user ที่ต้องการแก้ไข / ลบ", placeholder="ชื่อหรือเมือง")
+    # ดึงแค่ไม่กี่รายการ (name, city, _id) แล้วค่อยโหลดเอกสารเต็มของคนที่เลือก
+    choices = {choice_label(doc): doc["_id"] for doc in find_choices(collection, manage_search)}
+    selected_user = None
+    if choices:
+        selected_label = st.selectbox("เลือก user ที่ต้องการแก้ไข / ลบ", list(choices.keys()))
+        selected_user = get_user(collection, choices[selected_label])
+    if selected_user is None:
+        st.info("ยังไม่มี user ให้แก้ไขหรือลบน้า" if not manage_search else "ไม่พบ user ที่ค้นหา")
     else:
-        options = {
-            f"{item.get('name', 'Unknown')} ({item.get('city', '-')}) - {str(item['_id'])}": item
-            for item in items
-        }
-        selected_label = st.selectbox("เลือก user ที่ต้องการแก้ไข / ลบ", list(options.keys()))
-        selected_user = options[selected_label]
-
+        user_id = selected_user["_id"]
         col1, col2, col3 = st.columns((2, 1, 2))
-        edit_name = col1.text_input("Name", value=selected_user.get("name", ""), key=f"edit_name_{selected_user['_id']}")
+        edit_name = col1.text_input("Name", value=selected_user.get("name", ""), key=f"edit_name_{user_id}")
         edit_age = col2.number_input(
             "Age",
             min_value=0,
             max_value=120,
             step=1,
             value=int(selected_user.get("age", 0)),
-            key=f"edit_age_{selected_user['_id']}",
+            key=f"edit_age_{user_id}",
         )
-        try:
-            city_index = city_options.index(selected_user.get("city", ""))
-        except ValueError:
-            city_index = 0
+        # เมืองที่บันทึกไว้แต่ไม่อยู่ในรายการจังหวัด (เช่น "Korat" จากการ import) ให้เลือกค่าเดิมได้ ไม่ตกไปที่ "Select a city"
+        stored_city = selected_user.get("city") or ""
+        edit_city_options = city_options if not stored_city or stored_city in city_options else city_options + [stored_city]
+        city_index = edit_city_options.index(stored_city) if stored_city else 0
         edit_city = col3.selectbox(
             "City (จังหวัด)",
-            options=city_options,
+            options=edit_city_options,
             index=city_index,
-            key=f"edit_city_{selected_user['_id']}",
+            key=f"edit_city_{user_id}",
         )
 
+        # version ตอนที่เริ่มแก้ (ไม่ใช่ค่าที่โหลดใหม่ทุก rerun) ใช้ตรวจว่ามีคนอื่นบันทึกไปก่อนหรือยัง
+        base_key = f"edit_base_{user_id}"
+        st.session_state.setdefault(base_key, selected_user.get("version", 0))
+
+        def save(version):
+            # กฎเดียวกับฟอร์มเพิ่มผู้ใช้ / import ก่อนส่งไป server
+            fields, error = validate_user({"name": edit_name, "age": edit_age, "city": edit_city})
+            if edit_city == "Select a city":
+                error = "กรุณาเลือกเมือง"
+            if error:
+                st.error(f"บันทึกไม่ได้: {error}")
+                return
+            try:
+                updated = update_user(collection, user_id, version, fields["name"], fields["age"], fields["city"])
+            except UserConflict as exc:
+                st.session_state.edit_conflict = {"user_id": user_id, "current": exc.current}
+                trigger_rerun()
+            except WriteError as exc:  # $jsonSchema ของ collection ไม่ผ่าน
+                st.error(f"บันทึกไม่ได้ (server ปฏิเสธ): {exc}")
+            else:
+                st.session_state[base_key] = updated["version"]
+                st.session_state.pop("edit_conflict", None)
+                st.success("อัปเดตข้อมูลเรียบร้อยแล้ว ✅")
+                after_write()
+
+        conflict = st.session_state.get("edit_conflict")
+        if conflict and conflict["user_id"] == user_id:
+            current = conflict["current"]
+            if current is None:
+                st.error("user นี้ถูกลบโดยคนอื่นไปแล้ว")
+                if st.button("🔄 โหลดใหม่"):
+                    forget_edit(user_id)
+                    trigger_rerun()
+            else:
+                st.error("มีคนแก้ไข user นี้ไปก่อนแล้ว - ตรวจค่าล่าสุดก่อนบันทึก")
+                st.dataframe(
+                    [
+                        {"field": field, "ค่าของคุณ": mine, "ค่าล่าสุดในฐานข้อมูล": current.get(field)}
+                        for field, mine in (("name", edit_name.strip()), ("age", int(edit_age)), ("city", edit_city))
+                    ],
+                    use_container_width=True,
+                    hide_index=True,
+                )
+                col_reload, col_overwrite = st.columns(2)
+                if col_reload.button("🔄 ใช้ค่าล่าสุด"):
+                    forget_edit(user_id)
+                    trigger_rerun()
+                if col_overwrite.button("⚠️ บันทึกทับด้วยค่าของฉัน"):
+                    save(current.get("version", 0))
+
         col_update, col_delete = st.columns(2)
         with col_update:
             if st.button("💾 Save changes", type="primary"):
-                collection.update_one(
-                    {"_id": selected_user["_id"]},
-                    {"$set": {"name": edit_name.strip(), "age": int(edit_age), "city": edit_city}},
-                )
-                st.success("อัปเดตข้อมูลเรียบร้อยแล้ว ✅")
-                trigger_rerun()
+                save(st.session_state[base_key])
 
         with col_delete:
             if st.button("🗑 Delete this user"):
-                collection.delete_one({"_id": selected_user["_id"]})
-                st.warning("ลบผู้ใช้คนนี้แล้ว ⚠️")
-                trigger_rerun()
+                try:
+                    delete_user(collection, user_id, st.session_state[base_key])
+                except UserConflict as exc:
+                    st.session_state.edit_conflict = {"user_id": user_id, "current": exc.current}
+                    trigger_rerun()
+                else:
+                    forget_edit(user_id)
+                    st.warning("ลบผู้ใช้คนนี้แล้ว ⚠️")
+                    after_write()
+
+with tab_bulk:
+    st.markdown("#### นำเข้าผู้ใช้จากไฟล์")
+    st.caption("CSV (มี header: name, age, city) หรือ JSON array / JSON lines ที่มี field เดียวกัน")
+    import_file = st.file_uploader("ไฟล์ผู้ใช้", type=["csv", "json", "jsonl", "ndjson"], key="import_file")
+    batch_size = st.number_input("Batch size (insert_many)", min_value=100, max_value=50_000, value=IMPORT_BATCH, step=100)
+    if import_file is not None and st.button("📥 Import", type="primary"):
+        progress = st.progress(0.0, text="กำลังนำเข้า ...")
+        total_rows = max(import_file.getvalue().count(b"\n"), 1)  # ประมาณจำนวนแถว ไว้แสดง progress
+
+        def show_progress(done, inserted):
+            progress.progress(min(done / total_rows, 1.0), text=f"อ่านแล้ว {done:,} แถว · เพิ่มแล้ว {inserted:,}")
+
+        try:
+            report = import_users(
+                collection,
+                parse_import(import_file.getvalue(), import_file.name),
+                batch_size=int(batch_size),
+                on_progress=show_progress,
+            )
+        except (ValueError, UnicodeDecodeError) as exc:
+            st.error(f"อ่านไฟล์ไม่ได้: {exc}")
+        else:
+            progress.progress(1.0, text="เสร็จแล้ว")
+            live_summary.catch_up()
+            st.session_state.import_report = report
+
+    report = st.session_state.get("import_report")
+    if report:
+        st.success(f"เพิ่ม {report['inserted']:,} จาก {report['rows']:,} แถว")
+        if report["errors"]:
+            st.warning(f"มี {len(report['errors']):,} แถวที่ไม่ถูกเพิ่ม")
+            st.dataframe(report["errors"], use_container_width=True, height=240)
+            st.download_button("⬇️ ดาวน์โหลดรายการ error", errors_csv(report["errors"]), file_name="import_errors.csv")
+
+    st.markdown("---")
+    st.markdown("#### ส่งออกผู้ใช้ทั้งหมด")
+    export_fmt = st.radio("รูปแบบไฟล์", options=["csv", "jsonl"], horizontal=True)
+    if st.button("📤 เตรียมไฟล์ export"):
+        # เขียนจาก cursor ทีละ batch ลงไฟล์ชั่วคราวบนดิสก์ ไม่ต้องโหลดทั้ง collection
+        with st.spinner("กำลังส่งออก ..."):
+            export_path, exported = export_to_file(collection, export_fmt)
+        # download_button รับ file object แบบ BufferedReader (open "rb") แล้วอ่านเก็บไว้ทันที จึงลบไฟล์ได้เลย
+        try:
+            with open(export_path, "rb") as export_file:
+                st.download_button(
+                    f"⬇️ ดาวน์โหลด users.{export_fmt} ({exported:,} แถว)",
+                    data=export_file,
+                    file_name=f"users.{export_fmt}",
+                    mime="text/csv" if export_fmt == "csv" else "application/x-ndjson",
+                )
+        finally:
+            os.remove(export_path)
+
+# -------------------------
+# 4) Connection diagnostics
+# -------------------------
+with st.sidebar.expander("🩺 Connection diagnostics"):
+    pool_stats = client_diagnostics.pool()
+    max_pool = client_settings.get("maxPoolSize")
+    d1, d2 = st.columns(2)
+    d1.metric("In use", f"{pool_stats['checked_out']} / {max_pool}")
+    d2.metric("Peak", pool_stats["peak_checked_out"])
+    d1.metric("Pool wait p95", f"{pool_stats['wait_p95_ms'] or 0:.1f} ms")
+    d2.metric("Checkout failures", sum(pool_stats["checkout_failures"].values()))
+    if max_pool and pool_stats["peak_checked_out"] >= max_pool:
+        st.warning("pool เคยเต็ม - ลองเพิ่ม maxPoolSize หรือดู query ที่ช้าในตารางด้านล่าง")
+    st.dataframe(client_diagnostics.operations(), use_container_width=True, hide_index=True)
+    st.caption(
+        f"connections created {pool_stats['connections_created']} · closed {pool_stats['connections_closed']} · "
+        f"pool clears {pool_stats['pool_clears']} · readPreference {client_settings.get('readPreference')} · "
+        f"retryWrites {client_settings.get('retryWrites')} · backend {client_settings['backend']}"
+    )
+    if st.button("Reset counters"):
+        client_diagnostics.reset()
@@ -0,0 +1,419 @@
+"""Retrieval helpers for the AI assistant page (no Streamlit dependency).
+
+Kept outside ``pages/`` so the benchmark harness in ``benchmarks/`` can replay
+the same cleaning, corpus building and ranking the page uses.
+"""
+
+import re
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+PROJECT_WORKFLOW = (
+    "Project workflow sequence: "
+    "1) Prepare document Focus, 2) Procurement Focus, 3) Fabrication Focus, "
+    "4) Final inspection, 5) Shipping, 6) Final Document (no delay considered), "
+    "7) Completed (no delay considered)."
+)
+
+
+# -----------------------------
+# Cleaning (same rules as the dashboards)
+# -----------------------------
+def clean_project(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.copy()
+    df.columns = [str(c).strip() for c in df.columns]
+    df.rename(columns={"Q'ty": "Qty"}, inplace=True)
+    df = df.dropna(how="all")
+
+    date_cols = [
+        "PO Date",
+        "Original Delivery Date",
+        "Estimated shipdate",
+        "Actual shipdate",
+        "Waranty end",
+    ]
+    numeric_cols = [
+        "Project year",
+        "Order number",
+        "Project Value",
+        "Balance",
+        "Progress",
+        "Number of Status",
+        "Max LD",
+        "Max LD Amount",
+        "Extra cost",
+        "Change order amount",
+        "Storage fee amount",
+        "Days late",
+        "Qty",
+    ]
+    for col in date_cols:
+        if col in df.columns:
+            df[col] = pd.to_datetime(df[col], errors="coerce")
+    for col in numeric_cols:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors="coerce")
+    if "Progress" in df.columns:
+        df["Progress"] = df["Progress"].clip(lower=0, upper=1)
+    return df
+
+
+def clean_invoice(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.copy()
+    df.columns = [str(c).strip() for c in df.columns]
+    df.rename(columns={"Currency unit ": "Currency unit"}, inplace=True)
+    df = df.dropna(how="all")
+    numeric_cols = [
+        "Project year",
+        "SEQ",
+        "Total amount",
+        "Percentage of amount",
+        "Invoice value",
+        "Plan Delayed",
+        "Actual Delayed",
+        "Claim Plan 2025",
+    ]
+    for col in numeric_cols:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors="coerce")
+    date_cols = [
+        "Invoice plan date",
+        "Issued Date",
+        "Invoice due date",
+        "Plan payment date",
+        "Expected Payment date",
+        "Actual Payment received date",
+    ]
+    for col in date_cols:
+        if col in df.columns:
+            df[col] = pd.to_datetime(df[col], errors="coerce")
+    return df
+
+
+# -----------------------------
+# Simple RAG helpers
+# -----------------------------
+SNIPPET_COL = "_snippet"
+
+SNIPPET_FIELDS = {
+    "project": [
+        ("Project", "Project"),
+        ("Customer", "Customer"),
+        ("Engineer", "Project Engineer"),
+        ("Order", "Order number"),
+        ("Status", "Status"),
+        ("Progress", "Progress"),
+        ("Value", "Project Value"),
+        ("Balance", "Balance"),
+        ("Phrase", "Project Phrase"),
+    ],
+    "invoice": [
+        ("Customer", "Customer"),
+        ("Engineer", "Project Engineer"),
+        ("Order", "Sale order No."),
+        ("Invoice value", "Invoice value"),
+        ("Payment status", "Payment Status"),
+        ("Plan date", "Invoice plan date"),
+        ("Issued", "Issued Date"),
+    ],
+}
+
+
+def _text_column(df: pd.DataFrame, col: str) -> pd.Series:
+    """Render one column as display text without touching rows one by one."""
+    if col not in df.columns:
+        return pd.Series("", index=df.index, dtype=object)
+    values = df[col]
+    if col == "Progress":
+        pct = pd.to_numeric(values, errors="coerce").mul(100).round()
+        return (pct.astype("Int64").astype(str) + "%").where(pct.notna(), "n/a").astype(object)
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values.dt.strftime("%Y-%m-%d").astype(object).where(values.notna(), "n/a")
+    return values.astype(object).where(values.notna(), "n/a").astype(str).astype(object)
+
+
+def snippet_series(df: pd.DataFrame, kind: str) -> pd.Series:
+    """Build the retrieval snippet for every row with column-wise string concatenation."""
+    out = pd.Series("", index=df.index, dtype=object)
+    for pos, (label, col) in enumerate(SNIPPET_FIELDS[kind]):
+        prefix = f"{label}: " if pos == 0 else f" | {label}: "
+        out = out + prefix + _text_column(df, col)
+    return out
+
+
+def add_snippets(df: pd.DataFrame, kind: str) -> pd.DataFrame:
+    """Attach the snippet column once, when the cached data snapshot is built."""
+    return df.assign(**{SNIPPET_COL: snippet_series(df, kind)})
+
+
+def build_corpus(
+    project_df: pd.DataFrame,
+    invoice_df: pd.DataFrame,
+    domain: str,
+    include_pmbok: bool,
+    pmbok_chunks: List[str],
+    include_workflow: bool = True,
+    limit: int = 200,
+):
+    docs = []
+    for kind, df in (("project", project_df), ("invoice", invoice_df)):
+        if domain not in {kind, "both"}:
+            continue
+        sample = df.head(limit)
+        texts = sample[SNIPPET_COL] if SNIPPET_COL in sample.columns else snippet_series(sample, kind)
+        docs.extend({"source": kind, "row": idx, "text": text} for idx, text in zip(sample.index, texts.tolist()))
+    if include_pmbok and pmbok_chunks:
+        for chunk in pmbok_chunks[:50]:  # cap chunks for efficiency
+            docs.append({"source": "pmbok", "text": chunk})
+    if include_workflow:
+        docs.append({"source": "workflow", "text": PROJECT_WORKFLOW})
+    return docs
+
+
+# Max docs per source in the final context, so one source cannot crowd out the rest
+DEFAULT_QUOTAS = {"project": 4, "invoice": 4, "pmbok": 2, "workflow": 1}
+
+TOKEN_RE = re.compile(r"[^\s|:,;()?!\"'/]+")
+DENSE_DIM = 256  # power of two, buckets are taken with a bit mask
+NGRAM = 3
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_RE.findall(text.lower())
+
+
+def _char_ngram_vectors(texts: List[str], dim: int = DENSE_DIM, n: int = NGRAM) -> np.ndarray:
+    """Hashed character n-gram vectors for all texts at once (works for Thai without word breaks)."""
+    out = np.zeros((len(texts), dim), dtype=np.float32)
+    if not texts:
+        return out
+    lowered = [t.lower() for t in texts]
+    lengths = np.fromiter((len(t) for t in lowered), dtype=np.int64, count=len(lowered))
+    codes = np.frombuffer("".join(lowered).encode("utf-32-le"), dtype=np.uint32)
+    if codes.size < n:
+        return out
+    doc_ids = np.repeat(np.arange(len(lowered)), lengths)
+    hashed = np.zeros(codes.size - n + 1, dtype=np.uint32)
+    for offset in range(n):
+        hashed *= np.uint32(1000003)  # wraps around, which is fine for hashing
+        hashed += codes[offset : codes.size - n + 1 + offset]
+    hashed ^= hashed >> np.uint32(13)
+    # keep only n-grams that start and end inside the same text
+    valid = doc_ids[: hashed.size] == doc_ids[n - 1 :]
+    flat = doc_ids[: hashed.size][valid] * dim + (hashed[valid] & np.uint32(dim - 1))
+    out += np.bincount(flat, minlength=out.size).reshape(out.shape).astype(np.float32)
+    norms = np.linalg.norm(out, axis=1, keepdims=True)
+    return out / np.maximum(norms, 1e-9)
+
+
+class HybridIndex:
+    """BM25 (sparse) + hashed n-gram vectors (dense), re-ranked by a cheap cross-scorer.
+
+    Build once per corpus snapshot and reuse it for every question.
+    """
+
+    def __init__(self, docs: List[Dict[str, Any]], k1: float = 1.2, b: float = 0.75):
+        self.docs = docs
+        self.k1 = k1
+        self.b = b
+        self.doc_tokens = [tokenize(d["text"]) for d in docs]
+        self.doc_token_sets = [set(toks) for toks in self.doc_tokens]
+        self.doc_len = np.array([len(toks) for toks in self.doc_tokens], dtype=np.float32)
+        self.avg_len = float(self.doc_len.mean()) if len(docs) else 0.0
+        postings: Dict[str, Dict[int, int]] = {}
+        for doc_id, toks in enumerate(self.doc_tokens):
+            for tok in toks:
+                bucket = postings.setdefault(tok, {})
+                bucket[doc_id] = bucket.get(doc_id, 0) + 1
+        self.postings = {
+            tok: (np.fromiter(hits.keys(), dtype=np.int64), np.fromiter(hits.values(), dtype=np.float32))
+            for tok, hits in postings.items()
+        }
+        self.vectors = _char_ngram_vectors([d["text"] for d in docs])
+
+    def bm25(self, q_tokens: List[str]) -> np.ndarray:
+        scores = np.zeros(len(self.docs), dtype=np.float32)
+        n_docs = len(self.docs)
+        norm = self.k1 * (1 - self.b + self.b * self.doc_len / max(self.avg_len, 1e-9))
+        for tok in set(q_tokens):
+            hit = self.postings.get(tok)
+            if hit is None:
+                continue
+            ids, tf = hit
+            idf = np.log(1 + (n_docs - ids.size + 0.5) / (ids.size + 0.5))
+            scores[ids] += idf * tf * (self.k1 + 1) / (tf + norm[ids])
+        return scores
+
+    def dense(self, query: str) -> np.ndarray:
+        if not len(self.docs):
+            return np.zeros(0, dtype=np.float32)
+        return self.vectors @ _char_ngram_vectors([query])[0]
+
+    def cross_score(self, q_tokens: List[str], doc_id: int, bm25_norm: float, dense_score: float) -> float:
+        """Pairwise re-rank score: lexical + vector similarity, token coverage and exact id hits."""
+        doc_set = self.doc_token_sets[doc_id]
+        q_set = set(q_tokens)
+        coverage = len(q_set & doc_set) / len(q_set) if q_set else 0.0
+        ids = {t for t in q_set if any(ch.isdigit() for ch in t)}
+        id_match = len(ids & doc_set) / len(ids) if ids else 0.0
+        return 0.35 * bm25_norm + 0.25 * dense_score + 0.15 * coverage + 0.25 * id_match
+
+    def search(
+        self,
+        query: str,
+        top_k: int = 8,
+        quotas: Optional[Dict[str, int]] = None,
+        candidates: int = 40,
+    ) -> List[Dict[str, Any]]:
+        if not self.docs:
+            return []
+        quotas = DEFAULT_QUOTAS if quotas is None else quotas
+        q_tokens = tokenize(query)
+        bm25 = self.bm25(q_tokens)
+        dense = self.dense(query)
+        pool = set(np.argsort(-bm25)[:candidates].tolist()) | set(np.argsort(-dense)[:candidates].tolist())
+        bm25_max = float(bm25.max()) or 1.0
+
+        reranked = []
+        for doc_id in pool:
+            bm25_norm = float(bm25[doc_id]) / bm25_max
+            score = self.cross_score(q_tokens, doc_id, bm25_norm, float(dense[doc_id]))
+            reranked.append((score, bm25_norm, float(dense[doc_id]), doc_id))
+        reranked.sort(key=lambda x: x[0], reverse=True)
+
+        picked: List[Dict[str, Any]] = []
+        used: Dict[str, int] = {}
+        for score, bm25_norm, dense_score, doc_id in reranked:
+            if len(picked) >= top_k:
+                break
+            doc = self.docs[doc_id]
+            source = doc["source"]
+            if bm25_norm <= 0 and dense_score < 0.2:
+                continue
+            if used.get(source, 0) >= quotas.get(source, top_k):
+                continue
+            used[source] = used.get(source, 0) + 1
+            picked.append({**doc, "score": round(score, 4), "scores": {"bm25": round(bm25_norm, 4), "dense": round(dense_score, 4)}})
+        if not picked:
+            # nothing relevant: fall back to a few docs with the closest vectors
+            picked = [
+                {**self.docs[doc_id], "score": round(score, 4), "scores": {"bm25": round(b, 4), "dense": round(d, 4)}}
+                for score, b, d, doc_id in reranked[: max(1, top_k // 3)]
+            ]
+        return picked
+
+
+def rank_docs(
+    query: str,
+    docs: List[Dict[str, Any]],
+    top_k: int = 10,
+    quotas: Optional[Dict[str, int]] = None,
+):
+    return HybridIndex(docs).search(query, top_k=top_k, quotas=quotas)
+
+
+def chunk_text(full_text: str, chunk_size: int = 1200) -> List[str]:
+    chunks: List[str] = []
+    for i in range(0, len(full_text), chunk_size):
+        chunk = full_text[i : i + chunk_size].strip()
+        if chunk:
+            chunks.append(chunk)
+    return chunks
+
+
+SYSTEM_PROMPT = (
+    "You are an expert in project management (PMP/PMBOK) and an assistant for project/invoice data. "
+    "Ground answers in the provided context and PMBOK best practices: prioritize project value, timelines, risk, and invoice status. "
+    f"Always consider this project workflow: {PROJECT_WORKFLOW} "
+    "Answer with enough detail (3-5 sentences) using only the provided context; include key numbers/status when available. "
+    "If unsure, say you do not have that information. "
+    "ตอบเป็นภาษาไทยถ้าคำถามเป็นภาษาไทย และตอบเป็นอังกฤษถ้าคำถามเป็นอังกฤษ."
+)
+
+
+def build_messages(
+    question: str,
+    context: List[Dict[str, Any]],
+    history: Optional[List[Dict[str, str]]] = None,
+    summary: str = "",
+) -> List[Dict[str, str]]:
+    ctx_block = "\n".join([f"- ({d['source']}) {d['text']}" for d in context])
+    system_prompt = SYSTEM_PROMPT
+    if summary:
+        system_prompt += f"\n\nEarlier conversation (summary):\n{summary}"
+    user_prompt = f"Context:\n{ctx_block}\n\nQuestion: {question}"
+    return [
+        {"role": "system", "content": system_prompt},
+        *(history or []),
+        {"role": "user", "content": user_prompt},
+    ]
+
+
+# -----------------------------
+# Multi-turn chat helpers
+# -----------------------------
+def estimate_tokens(text: str) -> int:
+    # rough: ~3 characters per token across English and Thai
+    return max(1, len(text) // 3)
+
+
+def context_covers(question: str, context: List[Dict[str, Any]], index: HybridIndex, min_coverage: float = 0.6) -> bool:
+    """True when the context kept from earlier turns already answers a follow-up.
+
+    Only tokens the index knows about count; a new order number or customer
+    that is missing from the kept context always triggers a fresh retrieval, and so
+    does a question with no searchable token at all (Thai, vague follow-ups), since
+    nothing shows that the kept context is the right one.
+    """
+    if not context:
+        return False
+    searchable = {t for t in tokenize(question) if t in index.postings}
+    if not searchable:
+        return False
+    ctx_tokens = set()
+    for doc in context:
+        ctx_tokens.update(tokenize(doc["text"]))
+    ids = {t for t in searchable if any(ch.isdigit() for ch in t)}
+    if ids - ctx_tokens:
+        return False
+    return len(searchable & ctx_tokens) / len(searchable) >= min_coverage
+
+
+def merge_context(
+    previous: List[Dict[str, Any]],
+    fresh: List[Dict[str, Any]],
+    max_docs: int = 12,
+) -> List[Dict[str, Any]]:
+    """Newest docs first, drop duplicates, cap the total sent to the model."""
+    merged: List[Dict[str, Any]] = []
+    seen = set()
+    for doc in list(fresh) + list(previous):
+        key = (doc["source"], doc.get("row"), doc["text"][:80])
+        if key in seen:
+            continue
+        seen.add(key)
+        merged.append(doc)
+    return merged[:max_docs]
+
+
+def compact_history(
+    history: List[Dict[str, str]],
+    summary: str,
+    budget_tokens: int = 1500,
+    keep_last: int = 4,
+    max_summary_lines: int = 10,
+):
+    """Fold the oldest question/answer pairs into a short summary once history passes the budget."""
+    history = list(history)
+    lines = [line for line in summary.splitlines() if line]
+    while len(history) > keep_last and sum(estimate_tokens(m["content"]) for m in history) > budget_tokens:
+        if history[0]["role"] not in ("user", "assistant"):
+            history.pop(0)  # system / tool notes: dropped, never summarised (and the loop always shrinks)
+            continue
+        question = history.pop(0)["content"] if history[0]["role"] == "user" else ""
+        answer = history.pop(0)["content"] if history and history[0]["role"] == "assistant" else ""
+        first_sentence = re.split(r"(?<=[.!?])\s", answer.strip(), maxsplit=1)[0]
+        lines.append(f"- Q: {question[:150]} -> A: {first_sentence[:200]}")
+    return history, "\n".join(lines[-max_summary_lines:])
@@ -0,0 +1,909 @@
+"""Rule evaluation for the Analytics page (no Streamlit dependency).
+
+Steps use the JSON shape produced by "💾 Download Rule-set JSON" in
+``pages/Analytics.py``.
+"""
+
+import difflib
+import hashlib
+import string
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from typing import Any, Dict, Hashable, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+# -----------------------------
+# Typed columns: every referenced column is converted once per file
+# -----------------------------
+NUMERIC, DATE, TEXT = "numeric", "date", "text"
+
+_THOUSANDS = r"[-+]?\d{1,3}(?:,\d{3})+(?:\.\d+)?"
+_ISO_DATE = r"\d{4}-\d{2}-\d{2}(?:[ T]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?)?"
+_DMY_DATE = r"\d{1,2}/\d{1,2}/\d{4}"
+
+
+def normalize_text(series: pd.Series) -> pd.Series:
+    """Trim and collapse whitespace; non-text cells are written out as text, missing stay missing."""
+    if not isinstance(series.dtype, pd.StringDtype):
+        series = series.map(lambda v: v if isinstance(v, str) else (None if pd.isna(v) else _scalar_text(v))).astype(object)
+    text = series.str.strip()
+    if text.str.contains(r"\s\s|[\t\r\n]", regex=True, na=False).any():
+        text = text.str.replace(r"\s+", " ", regex=True)
+    return text
+
+
+def _text_array(text: pd.Series) -> np.ndarray:
+    keep = text.notna() & (text != "")
+    return text.astype(object).where(keep, None).to_numpy(dtype=object)
+
+
+def _scalar_text(value: Any) -> str:
+    if isinstance(value, (float, np.floating)) and float(value).is_integer():
+        return str(int(value))  # 1234.0 -> "1234", as typed in the other file
+    return str(value)
+
+
+def _parse_numbers(text: pd.Series) -> pd.Series:
+    commas = text.str.fullmatch(_THOUSANDS, na=False)
+    if commas.any():
+        text = text.where(~commas, text.str.replace(",", "", regex=False))
+    return pd.to_numeric(text, errors="coerce")
+
+
+def _all_match(text: pd.Series, pattern: str) -> bool:
+    return bool(text.str.fullmatch(pattern, na=False).all())
+
+
+class TypedColumn:
+    """A column converted once: ``kind`` plus NumPy ``values``.
+
+    numeric -> float64 (NaN = missing), date -> datetime64[ns] (NaT = missing),
+    text -> object array of normalized strings (None = missing).  A text column is
+    numeric/date only if every non-empty cell parses, so mixed codes stay text.
+    """
+
+    __slots__ = ("kind", "values")
+
+    def __init__(self, kind: str, values: np.ndarray):
+        self.kind = kind
+        self.values = values
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    @classmethod
+    def from_series(cls, series: pd.Series, sample: int = 1000) -> "TypedColumn":
+        if pd.api.types.is_bool_dtype(series.dtype) or pd.api.types.is_numeric_dtype(series.dtype):
+            return cls(NUMERIC, series.to_numpy(dtype=float, na_value=np.nan))
+        if pd.api.types.is_datetime64_any_dtype(series.dtype):
+            return cls(DATE, pd.to_datetime(series).dt.tz_localize(None).to_numpy(dtype="datetime64[ns]"))
+        text = normalize_text(series)
+        present = text[text.notna() & (text != "")]
+        head = present.head(sample)
+        if len(present):
+            # cheap look at a sample before converting the whole column
+            if pd.to_numeric(head.str.replace(",", "", regex=False), errors="coerce").notna().all():
+                numbers = _parse_numbers(text)
+                if numbers[present.index].notna().all():
+                    return cls(NUMERIC, numbers.to_numpy(dtype=float, na_value=np.nan))
+            for pattern, dayfirst in ((_ISO_DATE, False), (_DMY_DATE, True)):
+                if _all_match(head, pattern) and _all_match(present, pattern):
+                    dates = pd.to_datetime(text.where(text != ""), errors="coerce", dayfirst=dayfirst, format="ISO8601" if not dayfirst else "%d/%m/%Y")
+                    return cls(DATE, dates.to_numpy(dtype="datetime64[ns]"))
+        return cls(TEXT, _text_array(text))
+
+
+def convert_values(kind: str, values: pd.Series) -> np.ndarray:
+    """Loose values (cells from another kind, keyword values) as ``kind`` arrays."""
+    text = normalize_text(values)
+    if kind == NUMERIC:
+        return _parse_numbers(text).to_numpy(dtype=float, na_value=np.nan)
+    if kind == DATE:
+        return pd.to_datetime(text, errors="coerce", format="mixed", dayfirst=not _all_match(text.dropna(), _ISO_DATE)).to_numpy(dtype="datetime64[ns]")
+    return _text_array(text)
+
+
+def common_kind(left: str, right: str) -> str:
+    """Kind both sides are compared in: same kind as-is, text vs numeric/date parses the text side."""
+    if left == right:
+        return left
+    if TEXT in (left, right):
+        return right if left == TEXT else left
+    return TEXT
+
+
+def as_kind(kind: str, from_kind: str, values: np.ndarray) -> np.ndarray:
+    if kind == from_kind:
+        return values
+    if from_kind == NUMERIC:
+        # to text: 1234.0 -> "1234"
+        return np.array([None if np.isnan(v) else _scalar_text(v) for v in values], dtype=object)
+    if from_kind == DATE:
+        source = pd.Series(pd.DatetimeIndex(values).strftime("%Y-%m-%d %H:%M:%S").str.removesuffix(" 00:00:00"), dtype=object)
+        return convert_values(kind, source)
+    return convert_values(kind, pd.Series(values, dtype=object))
+
+
+def _object_series(items: list) -> pd.Series:
+    # keep raw cell values as-is (no dtype inference), so == behaves like the scalar path
+    arr = np.empty(len(items), dtype=object)
+    arr[:] = items
+    return pd.Series(arr, dtype=object)
+
+
+class KeyIndex:
+    """Row positions grouped by key: one factorize + stable sort, lookups via a hash table."""
+
+    def __init__(self, keys):
+        codes, uniques = pd.factorize(keys, sort=False)  # missing keys get -1, like ``==`` never matching
+        self._build(codes, pd.Index(uniques))
+
+    @classmethod
+    def from_codes(cls, codes: np.ndarray, n_keys: int) -> "KeyIndex":
+        """Index over precomputed group codes ``0..n_keys-1`` (-1 = no key)."""
+        index = cls.__new__(cls)
+        index._build(codes, pd.RangeIndex(n_keys))
+        return index
+
+    def _build(self, codes: np.ndarray, uniques: pd.Index) -> None:
+        self.uniques = uniques
+        self.order = np.argsort(codes, kind="stable")
+        self.bounds = np.searchsorted(codes[self.order], np.arange(len(uniques) + 1), side="left")
+
+    def __len__(self) -> int:
+        return len(self.uniques)
+
+    def rows(self, code: int) -> np.ndarray:
+        if code < 0:
+            return np.empty(0, dtype=np.intp)
+        return self.order[self.bounds[code] : self.bounds[code + 1]]
+
+    def first_positions(self, keys: list) -> np.ndarray:
+        """First row position for each key, -1 where the key is absent."""
+        out = np.full(len(keys), -1, dtype=np.intp)
+        if not keys or not len(self.uniques):
+            return out
+        try:
+            locs = self.uniques.get_indexer(pd.Index(keys, dtype=object))
+        except (TypeError, ValueError):
+            return np.array([pos[0] if len(pos) else -1 for pos in map(self.get, keys)], dtype=np.intp)
+        hit = locs >= 0
+        out[hit] = self.order[self.bounds[locs[hit]]]
+        return out
+
+    def get(self, key: Any) -> np.ndarray:
+        try:
+            loc = self.uniques.get_loc(key)
+        except (KeyError, TypeError, pd.errors.InvalidIndexError):
+            return np.empty(0, dtype=np.intp)
+        if not isinstance(loc, (int, np.integer)):
+            return np.empty(0, dtype=np.intp)
+        return self.rows(loc)
+
+
+# -----------------------------
+# Composite / normalized / fuzzy keys
+# -----------------------------
+MATCH_MODES = ["exact", "normalized", "fuzzy"]
+DEFAULT_MIN_SIMILARITY = 0.85
+FUZZY_TIE_MARGIN = 0.02  # candidates this close to the best score count as the same match
+FUZZY_CANDIDATES = 10  # trigram-blocked candidates scored per lookup
+FUZZY_POSTINGS_BUDGET = 5_000  # trigram postings scanned per lookup, rarest grams first
+
+_PUNCTUATION = str.maketrans({c: " " for c in string.punctuation})
+
+
+def fold_text(values: np.ndarray) -> np.ndarray:
+    """Case- and punctuation-insensitive form of normalized text (Thai vowel/tone marks are kept).
+
+    NFKC also unifies look-alike encodings such as "ำ" vs "ํา" from different Thai keyboards.
+    """
+    codes, uniques = pd.factorize(np.asarray(values, dtype=object))  # fold each distinct value once
+    text = pd.Series(uniques, dtype=object).str.normalize("NFKC").str.casefold().str.translate(_PUNCTUATION).str.split().str.join(" ")
+    folded = np.append(_text_array(text), None)
+    return folded[codes]
+
+
+def key_columns(filter_cfg: dict) -> Tuple[Any, ...]:
+    cols = filter_cfg.get("keyword_column")
+    return tuple(cols) if isinstance(cols, (list, tuple)) else (cols,)
+
+
+def key_values(filter_cfg: dict) -> Optional[Tuple[Any, ...]]:
+    """Keyword value(s) as a tuple, or None when empty (= first row of the table)."""
+    vals = filter_cfg.get("keyword_value")
+    vals = tuple(vals) if isinstance(vals, (list, tuple)) else (vals,)
+    return None if all(v in (None, "") for v in vals) else vals
+
+
+def key_spec(filter_cfg: dict) -> Tuple[Tuple[Any, ...], str, float]:
+    mode = filter_cfg.get("match") or "exact"
+    return key_columns(filter_cfg), mode, float(filter_cfg.get("min_similarity") or DEFAULT_MIN_SIMILARITY)
+
+
+def key_label(filter_cfg: dict) -> str:
+    """Short text for labels: keyword value(s), or the keyword column(s) when there is no value."""
+    return " + ".join(str(v) for v in (key_values(filter_cfg) or key_columns(filter_cfg)))
+
+
+def _trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class KeyMatcher:
+    """Rows of one file by a (possibly composite) key.
+
+    ``exact`` matches typed values, ``normalized`` also folds case and punctuation in text
+    columns.  ``fuzzy`` matches numeric/date columns exactly and uses them as the blocking
+    key; text columns are joined and scored with difflib only against rows of the same
+    block, or against trigram-sharing candidates when every key column is text.  Either
+    way no lookup compares against the whole file.
+    """
+
+    def __init__(self, columns: List[TypedColumn], mode: str = "exact"):
+        if mode not in MATCH_MODES:
+            raise ValueError(f"unknown match mode {mode!r}")
+        self.mode = mode
+        self.kinds = [c.kind for c in columns]
+        self.text_cols = [i for i, k in enumerate(self.kinds) if mode == "fuzzy" and k == TEXT]
+        self.exact_cols = [i for i in range(len(columns)) if i not in self.text_cols]
+        self.values: Dict[int, np.ndarray] = {}
+        self._levels: List[Tuple[pd.Index, pd.Index]] = []
+        n = len(columns[0])
+        codes = np.zeros(n, dtype=np.int64)
+        n_blocks = 1
+        for i in self.exact_cols:
+            self.values[i] = self._prepare(i, columns[i].values)
+            col_codes, uniques = pd.factorize(self.values[i])
+            uniques = pd.Index(uniques)
+            raw = np.where((codes < 0) | (col_codes < 0), np.nan, codes * max(len(uniques), 1) + col_codes)
+            codes, combos = pd.factorize(raw)
+            self._levels.append((uniques, pd.Index(combos)))
+            n_blocks = len(combos)
+        self.codes = codes
+        self.blocks = KeyIndex.from_codes(codes, n_blocks)
+
+        self.text: Optional[np.ndarray] = None
+        if self.text_cols:
+            for i in self.text_cols:
+                self.values[i] = self._prepare(i, columns[i].values)
+            self.text = self._join_text([self.values[i] for i in self.text_cols])
+            self.codes = np.where(pd.isna(self.text), -1, self.codes)
+            if not self.exact_cols:
+                text_codes, uniques = pd.factorize(self.text)
+                self.text_uniques = np.asarray(uniques, dtype=object)
+                self.text_index = pd.Index(self.text_uniques, dtype=object)
+                self.text_groups = KeyIndex.from_codes(text_codes, len(uniques))
+                postings: Dict[str, List[int]] = {}
+                for uid, text in enumerate(self.text_uniques):
+                    for gram in _trigrams(text):
+                        postings.setdefault(gram, []).append(uid)
+                self.postings = {gram: np.asarray(ids, dtype=np.int64) for gram, ids in postings.items()}
+
+    def _prepare(self, i: int, values: np.ndarray) -> np.ndarray:
+        return fold_text(values) if self.mode != "exact" and self.kinds[i] == TEXT else values
+
+    @staticmethod
+    def _join_text(parts: List[np.ndarray]) -> np.ndarray:
+        if len(parts) == 1:
+            return parts[0]
+        joined = pd.Series(parts[0], dtype=object).str.cat([pd.Series(p, dtype=object) for p in parts[1:]], sep=" ", na_rep="")
+        return _text_array(joined.str.strip())
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def key_parts(self, parts: List[Tuple[str, np.ndarray]]) -> List[np.ndarray]:
+        """Convert (kind, values) per key column to this file's kinds and folding."""
+        return [self._prepare(i, as_kind(self.kinds[i], kind, np.asarray(values))) for i, (kind, values) in enumerate(parts)]
+
+    def encode(self, parts: List[np.ndarray]) -> np.ndarray:
+        """Block code per key (-1 when an exact part does not occur in this file)."""
+        n = len(parts[0]) if parts else 0
+        codes = np.zeros(n, dtype=np.int64)
+        for (uniques, combos), i in zip(self._levels, self.exact_cols):
+            col_codes = _indexer(uniques, parts[i])
+            raw = np.where((codes < 0) | (col_codes < 0), np.nan, codes * max(len(uniques), 1) + col_codes)
+            codes = combos.get_indexer(raw)
+        return codes
+
+    def locate(self, parts: List[Tuple[str, np.ndarray]], min_similarity: float = DEFAULT_MIN_SIMILARITY):
+        """All matching rows per key (callers decide what several rows mean) and the fuzzy score (None if exact)."""
+        prepared = self.key_parts(parts)
+        codes = self.encode(prepared)
+        if not self.text_cols:
+            return [(self.blocks.rows(code), None) for code in codes]
+        queries = self._join_text([prepared[i] for i in self.text_cols])
+        return [self._fuzzy(code, query, min_similarity) for code, query in zip(codes, queries)]
+
+    def _fuzzy(self, code: int, query: Optional[str], min_similarity: float):
+        empty = (np.empty(0, dtype=np.intp), None)
+        if query is None or code < 0:
+            return empty
+        if self.exact_cols:
+            rows = self.blocks.rows(code)
+            rows = rows[self.codes[rows] >= 0]
+            texts, inverse = np.unique(self.text[rows].astype(str), return_inverse=True)
+            candidates = [(text, rows[inverse == j]) for j, text in enumerate(texts)]
+        else:
+            exact = self.text_index.get_indexer([query])[0]
+            if exact >= 0:  # identical after folding: nothing can score higher
+                return self.text_groups.rows(exact), 1.0
+            hits = sorted((self.postings[g] for g in _trigrams(query) if g in self.postings), key=len)
+            if not hits:
+                return empty
+            # rare trigrams first; grams shared by most of the file ("บริ", "Co ") only add cost
+            budget = np.cumsum([len(h) for h in hits])
+            hits = hits[: max(1, int(np.searchsorted(budget, FUZZY_POSTINGS_BUDGET, side="right")))]
+            ids, shared = np.unique(np.concatenate(hits), return_counts=True)
+            top = ids[np.argsort(-shared, kind="stable")[:FUZZY_CANDIDATES]]
+            candidates = [(self.text_uniques[uid], self.text_groups.rows(uid)) for uid in top]
+        matcher = difflib.SequenceMatcher(autojunk=False)
+        matcher.set_seq2(query)
+        scored = []
+        for text, rows in candidates:
+            matcher.set_seq1(text)
+            if matcher.real_quick_ratio() >= min_similarity and matcher.quick_ratio() >= min_similarity:
+                scored.append((matcher.ratio(), rows))
+        scored = [item for item in scored if item[0] >= min_similarity]
+        if not scored:
+            return empty
+        best = max(score for score, _ in scored)
+        rows = np.sort(np.concatenate([r for score, r in scored if score >= best - FUZZY_TIE_MARGIN]))
+        return rows, best
+
+    def distinct_keys(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(first row, row count) of every distinct key in first-occurrence order, and the key id of each row (-1 = none)."""
+        if self.text is None:
+            codes, groups = self.codes, self.blocks
+        else:
+            pair = np.where(self.codes < 0, np.nan, self.codes * (len(self.text) + 1) + pd.factorize(self.text)[0])
+            codes, uniques = pd.factorize(pair)
+            groups = KeyIndex.from_codes(codes, len(uniques))
+        # factorize numbers keys by first appearance, so first rows come out ascending
+        return groups.order[groups.bounds[:-1]], np.diff(groups.bounds), codes
+
+    def key_arrays(self, rows: np.ndarray) -> List[Tuple[str, np.ndarray]]:
+        """Prepared key values of ``rows`` as (kind, values) per key column, for matching in another file."""
+        return [(kind, self.values[i][rows]) for i, kind in enumerate(self.kinds)]
+
+
+def _indexer(uniques: pd.Index, values: np.ndarray) -> np.ndarray:
+    try:
+        return uniques.get_indexer(pd.Index(values, dtype=object))
+    except (TypeError, ValueError):
+        lookup = {v: j for j, v in enumerate(uniques)}
+        return np.array([lookup.get(v, -1) for v in values], dtype=np.intp)
+
+
+class KeyIndexCache:
+    """Lazily built typed columns and key matchers (keyword value -> rows) per file.
+
+    Files are identified by ``df.attrs["fingerprint"]`` (content hash + read options,
+    set by the page), so both survive Streamlit reruns that re-create the frames.  Frames
+    without one are identified by a hash of their content, computed once per frame object;
+    ``id(df)`` alone is unsafe because CPython reuses the ids of freed frames.
+    """
+
+    def __init__(self, max_entries: int = 64):
+        self.max_entries = max_entries
+        self._maps: "OrderedDict[Tuple[Hashable, Any, str], Any]" = OrderedDict()
+        self._lock = threading.Lock()  # shared by parallel rule workers
+        self._building: Dict[Tuple[Hashable, Any, str], threading.Lock] = {}
+        # id(df) -> (weakref to df, content hash); the weakref tells a live frame from a reused id
+        self._content: Dict[int, Tuple["weakref.ref", Optional[Hashable]]] = {}
+
+    def fingerprint(self, df: pd.DataFrame) -> Optional[Hashable]:
+        """Cache identity of ``df``; None when it has no fingerprint and cannot be hashed (not cached)."""
+        fingerprint = df.attrs.get("fingerprint")
+        if fingerprint is not None:
+            return fingerprint
+        with self._lock:
+            memo = self._content.get(id(df))
+        if memo is not None and memo[0]() is df:
+            return memo[1]
+        try:
+            row_hashes = pd.util.hash_pandas_object(df, index=True).to_numpy()
+            digest: Optional[Hashable] = ("content", tuple(map(str, df.columns)), hashlib.sha1(row_hashes.tobytes()).hexdigest())
+        except TypeError:  # unhashable cells (lists, dicts)
+            digest = None
+        with self._lock:
+            self._content = {k: v for k, v in self._content.items() if v[0]() is not None}
+            self._content[id(df)] = (weakref.ref(df), digest)
+        return digest
+
+    def _get_or_build(self, cache_key: Tuple[Hashable, Any, str], build):
+        if cache_key[0] is None:
+            return build()
+        with self._lock:
+            entry = self._maps.get(cache_key)
+            if entry is not None:
+                self._maps.move_to_end(cache_key)
+                return entry
+            build_lock = self._building.setdefault(cache_key, threading.Lock())
+        # one worker builds each entry; others asking for the same column wait for it
+        with build_lock:
+            with self._lock:
+                entry = self._maps.get(cache_key)
+            if entry is None:
+                entry = build()
+                with self._lock:
+                    self._maps[cache_key] = entry
+                    self._building.pop(cache_key, None)
+                    while len(self._maps) > self.max_entries:
+                        self._maps.popitem(last=False)
+        return entry
+
+    def typed(self, df: pd.DataFrame, col: Any) -> TypedColumn:
+        return self._get_or_build((self.fingerprint(df), col, "typed"), lambda: TypedColumn.from_series(df[col]))
+
+    def matcher(self, df: pd.DataFrame, key_cols: Tuple[Any, ...], mode: str = "exact") -> KeyMatcher:
+        return self._get_or_build(
+            (self.fingerprint(df), key_cols, f"match:{mode}"),
+            lambda: KeyMatcher([self.typed(df, col) for col in key_cols], mode),
+        )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._maps.clear()
+            self._building.clear()
+            self._content.clear()
+
+
+# -----------------------------
+# Bulk step: every key of two files in one join
+# -----------------------------
+BULK_STEP_TYPE = "bulk_compare_keys"
+
+
+def _side_frame(dfs: dict, side: dict, mode: str, indexes: KeyIndexCache):
+    """Distinct keys of one side with their first row (same first-row rule as single steps) and the typed value column."""
+    label = side["file_label"]
+    if label not in dfs:
+        return None, f"File '{label}' ยังไม่ถูกอัปโหลด"
+    df = dfs[label]
+    key_cols = key_columns(side["filter"])
+    value_col = side["value_column"]
+    missing = [str(c) for c in key_cols if c not in df.columns]
+    if missing:
+        return None, f"ไม่พบคอลัมน์ {', '.join(missing)} ในไฟล์ {label}"
+    if value_col not in df.columns:
+        return None, f"ไม่พบ value column {value_col} ในไฟล์ {label}"
+    matcher = indexes.matcher(df, key_cols, mode)
+    first_rows, counts, key_of_row = matcher.distinct_keys()
+    values = indexes.typed(df, value_col)
+    labels = df[key_cols[0]].to_numpy()[first_rows]
+    if len(key_cols) > 1:
+        parts = [map(str, df[c].to_numpy()[first_rows].tolist()) for c in key_cols]
+        labels = np.array([" | ".join(p) for p in zip(*parts)], dtype=object)
+    return {
+        "matcher": matcher,
+        "rows": first_rows,
+        "conflicts": _conflicting_keys(key_of_row, counts, values.values),
+        "values": values,
+        "labels": labels,
+    }, None
+
+
+def _conflicting_keys(key_of_row: np.ndarray, counts: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """Keys that occur on several rows whose values differ (taking the first row would be arbitrary)."""
+    conflict = np.zeros(len(counts), dtype=bool)
+    multi = np.flatnonzero(counts > 1)
+    if len(multi):
+        rows = np.flatnonzero(counts[key_of_row] > 1)
+        distinct = pd.DataFrame({"key": key_of_row[rows], "value": values[rows]}).groupby("key")["value"].nunique()
+        conflict[distinct.index[distinct.to_numpy() > 1]] = True
+    return conflict
+
+
+STATUSES = ["pass", "fail", "error"]
+
+
+def _missing(dtype: np.dtype) -> Any:
+    return None if dtype == object else (np.datetime64("NaT") if dtype.kind == "M" else np.nan)
+
+
+def _categorical(codes: np.ndarray, categories: list) -> pd.Categorical:
+    return pd.Categorical.from_codes(codes.astype(np.int8), categories=categories)
+
+
+def compare_typed(op: str, kind: str, src: np.ndarray, tgt: np.ndarray, max_pct: Optional[float] = None) -> pd.DataFrame:
+    """Vectorized operators on two arrays of the same ``kind``.
+
+    Returns ``status``/``reason`` (categoricals) and ``diff_pct``; missing values never compare equal.
+    """
+    n = len(src)
+    diff_pct = np.full(n, np.nan)
+    if op in ("equal", "not_equal"):
+        same = np.asarray(src == tgt, dtype=bool) & ~pd.isna(src) & ~pd.isna(tgt)
+        ok = same if op == "equal" else ~same
+        status = np.where(ok, 0, 1)
+        reason = _categorical(np.where(same, 0, 1), ["ค่าเท่ากัน", "ค่าไม่เท่ากัน"])
+    elif op == "abs_diff_pct_max" and max_pct is not None:
+        src_num = as_kind(NUMERIC, kind, src) if kind != DATE else np.full(n, np.nan)
+        tgt_num = as_kind(NUMERIC, kind, tgt) if kind != DATE else np.full(n, np.nan)
+        numeric = ~(np.isnan(src_num) | np.isnan(tgt_num))
+        with np.errstate(invalid="ignore"):
+            diff_pct = np.abs(src_num - tgt_num) / np.maximum(np.abs(tgt_num), 1e-9)
+        within = numeric & (diff_pct <= max_pct)
+        status = np.where(~numeric, 2, np.where(within, 0, 1))
+        reason = _categorical(
+            status,
+            [f"diff ไม่เกิน {max_pct*100:.2f}%", f"diff เกิน {max_pct*100:.2f}%", "ค่าไม่สามารถแปลงเป็นตัวเลขได้"],
+        )
+    else:
+        message = "ไม่ได้กำหนด max_pct" if op == "abs_diff_pct_max" else f"ไม่รู้จัก operator {op}"
+        status = np.full(n, 2)
+        reason = _categorical(np.zeros(n), [message])
+    return pd.DataFrame({"status": _categorical(status, STATUSES), "reason": reason, "diff_pct": diff_pct})
+
+
+def _key_index(parts: List[np.ndarray]) -> pd.Index:
+    if len(parts) == 1:
+        return pd.Index(parts[0], dtype=object if parts[0].dtype == object else None)
+    return pd.MultiIndex.from_arrays(parts)
+
+
+def evaluate_bulk_step(step: dict, dfs: dict, indexes: Optional[KeyIndexCache] = None) -> dict:
+    """เทียบทุก key ที่มีในทั้งสองไฟล์ด้วย join เดียว แล้วสรุปผลพร้อมตาราง per-key (``details``)"""
+    indexes = indexes if indexes is not None else KeyIndexCache()
+    # both sides use the source's matching rule so keys are folded the same way
+    _, mode, min_similarity = key_spec(step["source"]["filter"])
+    src, src_err = _side_frame(dfs, step["source"], mode, indexes)
+    if src_err:
+        return {"step_id": step["step_id"], "status": "error", "reason": src_err, "source_value": None, "target_value": None}
+    tgt, tgt_err = _side_frame(dfs, step["target"], mode, indexes)
+    if tgt_err:
+        return {"step_id": step["step_id"], "status": "error", "reason": tgt_err, "source_value": None, "target_value": None}
+    if len(src["matcher"].kinds) != len(tgt["matcher"].kinds):
+        reason = "จำนวน keyword column ของ source และ target ไม่เท่ากัน"
+        return {"step_id": step["step_id"], "status": "error", "reason": reason, "source_value": None, "target_value": None}
+
+    src_rows, tgt_rows = src["rows"], tgt["rows"]
+    src_values, tgt_values = src["values"], tgt["values"]
+    src_keys = src["matcher"].key_arrays(src_rows)
+    multi_match = np.zeros(len(src_rows), dtype=bool)
+    if src["matcher"].text_cols or tgt["matcher"].text_cols:
+        # fuzzy: each source key looks up its block in the target's index
+        _, _, tgt_key_of_row = tgt["matcher"].distinct_keys()
+        match = np.full(len(src_rows), -1, dtype=np.intp)
+        for j, (rows, _score) in enumerate(tgt["matcher"].locate(src_keys, min_similarity)):
+            hit = np.unique(tgt_key_of_row[rows])
+            hit = hit[hit >= 0]
+            if len(hit):
+                match[j] = hit[0]
+                multi_match[j] = len(hit) > 1
+    else:
+        tgt_keys = tgt["matcher"].key_arrays(tgt_rows)
+        src_parts, tgt_parts = [], []
+        for (src_kind, src_col), (tgt_kind, tgt_col) in zip(src_keys, tgt_keys):
+            if src_kind != tgt_kind:
+                # e.g. numeric order numbers on one side, codes on the other: join on the text form
+                src_col, tgt_col = as_kind(TEXT, src_kind, src_col), as_kind(TEXT, tgt_kind, tgt_col)
+            src_parts.append(src_col)
+            tgt_parts.append(tgt_col)
+        match = _key_index(tgt_parts).get_indexer(_key_index(src_parts))
+
+    # outer join through the key hash tables: source keys first, then keys only the target has
+    tgt_only = np.ones(len(tgt_rows), dtype=bool)
+    tgt_only[match[match >= 0]] = False
+    tgt_only_pos = np.flatnonzero(tgt_only)
+    only_src = np.concatenate([match < 0, np.zeros(len(tgt_only_pos), dtype=bool)])
+    only_tgt = np.concatenate([np.zeros(len(src_rows), dtype=bool), np.ones(len(tgt_only_pos), dtype=bool)])
+    ambiguous = np.concatenate(
+        [src["conflicts"] | multi_match | np.where(match >= 0, tgt["conflicts"][np.maximum(match, 0)], False), tgt["conflicts"][tgt_only_pos]]
+    )
+
+    kind = common_kind(src_values.kind, tgt_values.kind)
+    src_side = as_kind(kind, src_values.kind, src_values.values[src_rows])
+    tgt_side = as_kind(kind, tgt_values.kind, tgt_values.values[tgt_rows])
+    blank = np.full(len(tgt_only_pos), _missing(src_side.dtype), dtype=src_side.dtype)
+    source_value = np.concatenate([src_side, blank])
+    if len(tgt_side):
+        target_value = tgt_side.take(np.concatenate([match, tgt_only_pos]), mode="clip")
+        target_value[only_src] = _missing(tgt_side.dtype)
+    else:
+        target_value = np.full(len(src_side), _missing(tgt_side.dtype), dtype=tgt_side.dtype)
+    keys = np.concatenate([np.asarray(src["labels"], dtype=object), np.asarray(tgt["labels"], dtype=object)[tgt_only_pos]])
+
+    op_block = step["operator_block"]
+    checks = compare_typed(op_block["operator_type"], kind, source_value, target_value, op_block.get("max_pct"))
+    missing_src = f"ไม่พบ key ในไฟล์ {step['source']['file_label']}"
+    missing_tgt = f"ไม่พบ key ในไฟล์ {step['target']['file_label']}"
+    duplicated = "key ตรงกับหลายแถวที่ค่าไม่เหมือนกัน (ambiguous)"
+    checks["reason"] = checks["reason"].cat.add_categories(
+        [c for c in (missing_src, missing_tgt, duplicated) if c not in checks["reason"].cat.categories]
+    )
+    checks.loc[ambiguous, "reason"] = duplicated
+    checks.loc[only_src, "reason"] = missing_tgt
+    checks.loc[only_tgt, "reason"] = missing_src
+    checks.loc[only_src | only_tgt | ambiguous, "status"] = "error"
+    details = pd.concat(
+        [
+            pd.DataFrame({"key": pd.Series(keys, dtype=object), "source_value": source_value, "target_value": target_value}),
+            checks,
+        ],
+        axis=1,
+    )
+
+    counts = details["status"].value_counts()
+    n_pass, n_fail, n_err = (int(counts.get(k, 0)) for k in ("pass", "fail", "error"))
+    if details.empty:
+        status = "error"
+    elif n_fail:
+        status = "fail"
+    elif n_err:
+        status = "error"
+    else:
+        status = "pass"
+    return {
+        "step_id": step["step_id"],
+        "status": status,
+        "reason": f"{n_pass} pass / {n_fail} fail / {n_err} error จาก {len(details)} keys",
+        # per-key values are in ``details``; the step-level value fields stay empty like an
+        # error result, and the row counts get their own fields
+        "source_value": None,
+        "target_value": None,
+        "source_rows": len(src_rows),
+        "target_rows": len(tgt_rows),
+        "details": details,
+    }
+
+
+# -----------------------------
+# Compiled execution plan for a whole rule-set
+# -----------------------------
+class RulePlan:
+    """Steps grouped by (file, key spec) so each group is indexed and read once.
+
+    A key spec is (keyword columns, match mode, min similarity); ``lookups[i]`` holds the
+    (file, key spec, keyword values, value column) tuples for
+    the source and target of step ``i``; bulk steps are kept aside and run on their own.
+    """
+
+    def __init__(self, steps: List[dict]):
+        started = time.perf_counter()
+        self.steps = steps
+        self.lookups: Dict[int, Tuple[tuple, tuple]] = {}
+        self.bulk: List[int] = []
+        self.groups: Dict[Tuple[str, Any], set] = {}
+        for i, step in enumerate(steps):
+            if step.get("step_type") == BULK_STEP_TYPE:
+                self.bulk.append(i)
+                continue
+            pair = []
+            for side in ("source", "target"):
+                cfg = step[side]
+                lookup = (
+                    cfg["file_label"],
+                    key_spec(cfg["filter"]),
+                    key_values(cfg["filter"]),
+                    cfg["value_column"],
+                )
+                self.groups.setdefault(lookup[:2], set()).add(lookup[2:])
+                pair.append(lookup)
+            self.lookups[i] = (pair[0], pair[1])
+        self.compile_ms = (time.perf_counter() - started) * 1000
+
+    def describe(self) -> Dict[str, int]:
+        return {
+            "steps": len(self.steps),
+            "groups": len(self.groups),
+            "value_fetches": sum(len(v) for v in self.groups.values()),
+            "bulk_steps": len(self.bulk),
+        }
+
+
+def compile_plan(steps: List[dict]) -> RulePlan:
+    return RulePlan(steps)
+
+
+def _fetch_group(dfs: dict, file_label: str, spec: tuple, needed: set, indexes: Optional[KeyIndexCache]):
+    """Resolve every (keyword values, value column) of one group to ``(raw value, error, kind, typed value, score)``.
+
+    Keyword values are converted to the key columns' kinds first, so "1234" finds 1234.0.
+    Several matching rows are fine when they agree on the value; otherwise the lookup is
+    reported as ambiguous instead of silently taking the first row.
+    """
+    key_cols, mode, min_similarity = spec
+    if file_label not in dfs:
+        return {item: (None, f"File '{file_label}' ยังไม่ถูกอัปโหลด", None, None, None) for item in needed}
+    df = dfs[file_label]
+    missing = [str(c) for c in key_cols if c not in df.columns]
+    if missing:
+        return {item: (None, f"ไม่พบคอลัมน์ {', '.join(missing)} ในไฟล์ {file_label}", None, None, None) for item in needed}
+
+    indexes = indexes if indexes is not None else KeyIndexCache()
+    col_text = " + ".join(map(str, key_cols))
+    keys = sorted({key for key, _ in needed if key is not None and len(key) == len(key_cols)}, key=repr)
+    located: Dict[tuple, tuple] = {}
+    if keys:
+        parts = [(TEXT, convert_values(TEXT, _object_series([key[i] for key in keys]))) for i in range(len(key_cols))]
+        located = dict(zip(keys, indexes.matcher(df, key_cols, mode).locate(parts, min_similarity)))
+    columns: Dict[Any, Tuple[np.ndarray, TypedColumn]] = {}
+    out = {}
+    for key, value_col in needed:
+        key_text = " + ".join(map(str, key or ()))
+        if key is None:
+            rows, score = np.arange(min(len(df), 1)), None
+        elif key not in located:
+            out[(key, value_col)] = (None, f"ต้องกรอก keyword value ให้ครบ {len(key_cols)} คอลัมน์ ({col_text})", None, None, None)
+            continue
+        else:
+            rows, score = located[key]
+        if len(rows) == 0:
+            out[(key, value_col)] = (None, f"ไม่พบแถวที่ {col_text} = {key_text} ในไฟล์ {file_label}", None, None, None)
+            continue
+        if value_col not in df.columns:
+            out[(key, value_col)] = (None, f"ไม่พบ value column {value_col} ในไฟล์ {file_label}", None, None, None)
+            continue
+        if value_col not in columns:
+            columns[value_col] = (df[value_col].to_numpy(), indexes.typed(df, value_col))
+        raw, typed = columns[value_col]
+        pos = rows[0]
+        if len(rows) > 1:
+            # blanks don't make a key ambiguous, but the value returned must be the non-blank one
+            filled = rows[pd.notna(pd.Series(typed.values[rows])).to_numpy()]
+            distinct = pd.unique(pd.Series(typed.values[filled]))
+            if len(distinct) > 1:
+                reason = f"พบ {len(rows)} แถวที่ {col_text} = {key_text} ในไฟล์ {file_label} แต่ {value_col} มี {len(distinct)} ค่า (ambiguous)"
+                out[(key, value_col)] = (None, reason, None, None, None)
+                continue
+            if len(filled):
+                pos = filled[0]
+        out[(key, value_col)] = (raw[pos], None, typed.kind, typed.values[pos], score)
+    return out
+
+
+def run_plan(plan: RulePlan, dfs: dict, indexes: Optional[KeyIndexCache] = None):
+    """Run a compiled plan; returns (results in step order, timings in ms per plan stage).
+
+    Each result also carries ``ms``: a bulk step's own time, or for a lookup step its share
+    of the group fetches and the comparison batch it was part of.
+    """
+    timings = {"compile": plan.compile_ms}
+    results: List[Optional[dict]] = [None] * len(plan.steps)
+
+    started = time.perf_counter()
+    indexes = indexes if indexes is not None else KeyIndexCache()  # still convert each column once per run
+    fetched: Dict[tuple, tuple] = {}
+    fetch_share: Dict[tuple, float] = {}
+    for (file_label, spec), needed in plan.groups.items():
+        group_started = time.perf_counter()
+        for (key, value_col), value in _fetch_group(dfs, file_label, spec, needed, indexes).items():
+            fetched[(file_label, spec, key, value_col)] = value
+        fetch_share[(file_label, spec)] = (time.perf_counter() - group_started) * 1000 / max(1, len(needed))
+    timings["fetch"] = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    batches: Dict[tuple, List[int]] = {}
+    values: Dict[int, Tuple[tuple, tuple]] = {}
+    step_ms: Dict[int, float] = {}
+    for i, (src_lookup, tgt_lookup) in plan.lookups.items():
+        step = plan.steps[i]
+        src, tgt = fetched[src_lookup], fetched[tgt_lookup]
+        step_ms[i] = fetch_share[src_lookup[:2]] + fetch_share[tgt_lookup[:2]]
+        if src[1]:
+            results[i] = {"step_id": step["step_id"], "status": "error", "reason": src[1], "source_value": None, "target_value": None, "ms": step_ms[i]}
+            continue
+        if tgt[1]:
+            results[i] = {"step_id": step["step_id"], "status": "error", "reason": tgt[1], "source_value": src[0], "target_value": None, "ms": step_ms[i]}
+            continue
+        op_block = step["operator_block"]
+        max_pct = op_block.get("max_pct") if op_block["operator_type"] == "abs_diff_pct_max" else None
+        batches.setdefault((op_block["operator_type"], max_pct, src[2], tgt[2]), []).append(i)
+        values[i] = (src, tgt)
+
+    for (op, max_pct, src_kind, tgt_kind), members in batches.items():
+        batch_started = time.perf_counter()
+        kind = common_kind(src_kind, tgt_kind)
+        src = as_kind(kind, src_kind, _object_series([values[i][0][3] for i in members]).to_numpy())
+        tgt = as_kind(kind, tgt_kind, _object_series([values[i][1][3] for i in members]).to_numpy())
+        if kind == NUMERIC:
+            src, tgt = src.astype(float), tgt.astype(float)
+        elif kind == DATE:
+            src, tgt = src.astype("datetime64[ns]"), tgt.astype("datetime64[ns]")
+        checks = compare_typed(op, kind, src, tgt, max_pct)
+        statuses = checks["status"].astype(str).tolist()
+        reasons = checks["reason"].astype(str).tolist()
+        diffs = checks["diff_pct"].tolist()
+        batch_share = (time.perf_counter() - batch_started) * 1000 / len(members)
+        for j, i in enumerate(members):
+            reason = reasons[j]
+            if op == "abs_diff_pct_max" and statuses[j] != "error":
+                reason = f"diff {diffs[j]*100:.2f}% (limit {max_pct*100:.2f}%)"
+            scores = [side[4] for side in values[i] if side[4] is not None]
+            if scores:
+                reason += f" (fuzzy match {min(scores):.2f})"
+            results[i] = {
+                "step_id": plan.steps[i]["step_id"],
+                "status": statuses[j],
+                "reason": reason,
+                "source_value": values[i][0][0],
+                "target_value": values[i][1][0],
+                "ms": step_ms[i] + batch_share,
+            }
+    timings["evaluate"] = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    for i in plan.bulk:
+        step_started = time.perf_counter()
+        results[i] = evaluate_bulk_step(plan.steps[i], dfs, indexes)
+        results[i]["ms"] = (time.perf_counter() - step_started) * 1000
+    timings["bulk"] = (time.perf_counter() - started) * 1000
+    return results, timings
+
+
+# -----------------------------
+# Parallel execution of independent step groups
+# -----------------------------
+def partition_steps(steps: List[dict], max_unit: int = 200) -> List[List[int]]:
+    """Split step positions into independent units: one per source (file, keyword columns), one per bulk step."""
+    units: List[List[int]] = []
+    groups: Dict[Tuple[str, Any], List[int]] = {}
+    for i, step in enumerate(steps):
+        if step.get("step_type") == BULK_STEP_TYPE:
+            units.append([i])
+            continue
+        key = (step["source"]["file_label"], key_columns(step["source"]["filter"]))
+        groups.setdefault(key, []).append(i)
+    for members in groups.values():
+        units.extend(members[j : j + max_unit] for j in range(0, len(members), max_unit))
+    return units
+
+
+def _run_unit(steps: List[dict], dfs: dict, indexes: Optional[KeyIndexCache], cancel: Optional[threading.Event] = None):
+    """``run_plan`` on one unit; a unit that only starts after ``cancel`` is set returns None."""
+    if cancel is not None and cancel.is_set():
+        return None
+    return run_plan(RulePlan(steps), dfs, indexes)
+
+
+def iter_plan_results(
+    steps: List[dict],
+    dfs: dict,
+    indexes: Optional[KeyIndexCache] = None,
+    workers: int = 4,
+    use_processes: bool = False,
+    cancel: Optional[threading.Event] = None,
+) -> Iterator[Tuple[List[int], List[dict], Dict[str, float]]]:
+    """Run independent units on a pool and yield ``(step positions, results, timings)`` as each finishes.
+
+    Threads share ``dfs`` and the index cache; processes get only the frames a unit needs
+    (and build their own indexes). Setting ``cancel`` or closing the iterator drops queued
+    units: thread units check ``cancel`` before they start, and shutdown cancels the futures
+    that have not been picked up, without waiting for the ones already running.
+    """
+    units = partition_steps(steps)
+    executor_cls = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+    pool = executor_cls(max_workers=max(1, int(workers)))
+    try:
+        futures = {}
+        for unit in units:
+            if cancel is not None and cancel.is_set():
+                break
+            sub_steps = [steps[i] for i in unit]
+            if use_processes:
+                # an Event does not cross process boundaries; cancel_futures drops the queued ones
+                labels = {step[side]["file_label"] for step in sub_steps for side in ("source", "target")}
+                fut = pool.submit(_run_unit, sub_steps, {k: dfs[k] for k in labels if k in dfs}, None)
+            else:
+                fut = pool.submit(_run_unit, sub_steps, dfs, indexes, cancel)
+            futures[fut] = unit
+        for fut in as_completed(futures):
+            if cancel is not None and cancel.is_set():
+                break
+            outcome = fut.result()
+            if outcome is None:
+                break
+            results, timings = outcome
+            yield futures[fut], results, timings
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,265 @@
+"""Append-only history of Analytics rule-set runs (SQLite, no server needed).
+
+Every run stores the rule-set hash, the input file hashes, one row per step and the
+fail/error keys of bulk steps, so two runs of a recurring reconciliation can be diffed
+with a couple of indexed queries instead of re-reviewing every step.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from contextlib import closing
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+import pandas as pd
+
+from rule_engine import key_label
+
+DEFAULT_PATH = Path(os.environ.get("RULE_HISTORY_DB", "rule_history.sqlite"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at TEXT NOT NULL,
+    rule_set_name TEXT,
+    rule_set_hash TEXT NOT NULL,
+    file_hashes TEXT NOT NULL,
+    summary TEXT NOT NULL,
+    timings TEXT NOT NULL,
+    origin TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_by_rule_set ON runs (rule_set_hash, run_id);
+CREATE TABLE IF NOT EXISTS step_results (
+    run_id INTEGER NOT NULL REFERENCES runs (run_id),
+    position INTEGER NOT NULL,
+    step_id INTEGER,
+    step_key TEXT NOT NULL,
+    label TEXT,
+    status TEXT NOT NULL,
+    reason TEXT,
+    source_value TEXT,
+    target_value TEXT,
+    ms REAL,
+    PRIMARY KEY (run_id, position)
+);
+CREATE INDEX IF NOT EXISTS step_results_by_key ON step_results (run_id, step_key);
+CREATE TABLE IF NOT EXISTS bulk_issues (
+    run_id INTEGER NOT NULL REFERENCES runs (run_id),
+    step_key TEXT NOT NULL,
+    key TEXT NOT NULL,
+    status TEXT NOT NULL,
+    reason TEXT,
+    source_value TEXT,
+    target_value TEXT
+);
+CREATE INDEX IF NOT EXISTS bulk_issues_by_step ON bulk_issues (run_id, step_key, key);
+"""
+
+STEP_COLUMNS = ["step_key", "step_id", "label", "status", "reason", "source_value", "target_value", "ms"]
+
+
+def _canonical(obj: Any) -> str:
+    return json.dumps(obj, ensure_ascii=False, sort_keys=True, default=str)
+
+
+def step_key(step: dict) -> str:
+    """Identity of a step across runs: its definition without ``step_id`` (which changes on reorder)."""
+    body = {k: v for k, v in step.items() if k != "step_id"}
+    return hashlib.sha1(_canonical(body).encode("utf-8")).hexdigest()[:16]
+
+
+def rule_set_hash(steps: List[dict]) -> str:
+    return hashlib.sha1(_canonical([step_key(s) for s in steps]).encode("utf-8")).hexdigest()[:16]
+
+
+def file_sha1(path: Union[str, Path], block_size: int = 1 << 20) -> str:
+    digest = hashlib.sha1()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _text(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    if hasattr(value, "item"):
+        value = value.item()
+    if isinstance(value, float) and value != value:
+        return None
+    return str(value)
+
+
+def _step_label(step: dict) -> str:
+    src, tgt = step["source"], step["target"]
+    src_kw, tgt_kw = key_label(src["filter"]), key_label(tgt["filter"])
+    return f"{src['file_label']}[{src_kw}].{src['value_column']} -> {tgt['file_label']}[{tgt_kw}].{tgt['value_column']} | {step['operator_block']['operator_type']}"
+
+
+class RunHistory:
+    """SQLite-backed run log; only ever inserts, so past runs stay reproducible evidence."""
+
+    def __init__(self, path: Union[str, Path] = DEFAULT_PATH):
+        self.path = Path(path)
+        with closing(self._connect()) as conn, conn:
+            conn.executescript(SCHEMA)
+            # history files written before per-step timings existed
+            if "ms" not in {row[1] for row in conn.execute("PRAGMA table_info(step_results)")}:
+                conn.execute("ALTER TABLE step_results ADD COLUMN ms REAL")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")  # readers (other sessions) don't block the writer
+        return conn
+
+    # -----------------------------
+    # Writing
+    # -----------------------------
+    def record_run(
+        self,
+        steps: List[dict],
+        results: List[dict],
+        file_hashes: Dict[str, str],
+        timings: Optional[Dict[str, float]] = None,
+        rule_set_name: Optional[str] = None,
+        origin: str = "page",
+    ) -> int:
+        """Store one run; steps without a result (cancelled) are skipped. Returns the new ``run_id``.
+
+        ``timings`` are the run's stage totals; each step's own ``ms`` comes from its result.
+        """
+        done = [(pos, step, res) for pos, (step, res) in enumerate(zip(steps, results)) if res and res["status"] in ("pass", "fail", "error")]
+        summary = pd.Series([res["status"] for _, _, res in done], dtype=object).value_counts().to_dict()
+        with closing(self._connect()) as conn, conn:
+            cur = conn.execute(
+                "INSERT INTO runs (created_at, rule_set_name, rule_set_hash, file_hashes, summary, timings, origin) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    time.strftime("%Y-%m-%d %H:%M:%S"),
+                    rule_set_name,
+                    rule_set_hash(steps),
+                    _canonical(file_hashes),
+                    _canonical({k: int(v) for k, v in summary.items()}),
+                    _canonical({k: round(float(v), 3) for k, v in (timings or {}).items()}),
+                    origin,
+                ),
+            )
+            run_id = int(cur.lastrowid)
+            conn.executemany(
+                "INSERT INTO step_results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        run_id,
+                        pos,
+                        step.get("step_id"),
+                        step_key(step),
+                        _step_label(step),
+                        res["status"],
+                        res.get("reason"),
+                        _text(res.get("source_value")),
+                        _text(res.get("target_value")),
+                        round(float(res["ms"]), 3) if res.get("ms") is not None else None,
+                    )
+                    for pos, step, res in done
+                ],
+            )
+            for _, step, res in done:
+                details = res.get("details")
+                if details is None:
+                    continue
+                issues = details[details["status"].astype(str) != "pass"]
+                conn.executemany(
+                    "INSERT INTO bulk_issues VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    zip(
+                        [run_id] * len(issues),
+                        [step_key(step)] * len(issues),
+                        map(_text, issues["key"].tolist()),
+                        issues["status"].astype(str).tolist(),
+                        issues["reason"].astype(str).tolist(),
+                        map(_text, issues["source_value"].tolist()),
+                        map(_text, issues["target_value"].tolist()),
+                    ),
+                )
+        return run_id
+
+    # -----------------------------
+    # Reading
+    # -----------------------------
+    def runs(self, rule_set_hash_: Optional[str] = None, limit: int = 50) -> pd.DataFrame:
+        """Latest runs first (optionally only those of one rule-set)."""
+        query = "SELECT run_id, created_at, rule_set_name, rule_set_hash, file_hashes, summary, timings, origin FROM runs"
+        params: tuple = ()
+        if rule_set_hash_:
+            query += " WHERE rule_set_hash = ?"
+            params = (rule_set_hash_,)
+        query += " ORDER BY run_id DESC LIMIT ?"
+        with closing(self._connect()) as conn:
+            df = pd.read_sql_query(query, conn, params=params + (int(limit),))
+        for col in ("file_hashes", "summary", "timings"):
+            df[col] = df[col].map(json.loads)
+        return df
+
+    def step_results(self, run_id: int) -> pd.DataFrame:
+        with closing(self._connect()) as conn:
+            return pd.read_sql_query(
+                f"SELECT position, {', '.join(STEP_COLUMNS)} FROM step_results WHERE run_id = ? ORDER BY position",
+                conn,
+                params=(int(run_id),),
+            )
+
+    def diff_runs(self, old_run: int, new_run: int, include_unchanged: bool = False) -> pd.DataFrame:
+        """Steps matched by definition; ``change`` is added / removed / status / values / unchanged.
+
+        ``ms_old`` / ``ms`` are shown alongside but a timing change alone is not a change.
+        """
+        old = self.step_results(old_run).drop_duplicates("step_key")
+        new = self.step_results(new_run).drop_duplicates("step_key")
+        merged = new.merge(old, on="step_key", how="outer", suffixes=("", "_old"), indicator=True)
+        change = pd.Series("unchanged", index=merged.index, dtype=object)
+        values_moved = (
+            merged["reason"].fillna("").ne(merged["reason_old"].fillna(""))
+            | merged["source_value"].fillna("").ne(merged["source_value_old"].fillna(""))
+            | merged["target_value"].fillna("").ne(merged["target_value_old"].fillna(""))
+        )
+        change[values_moved] = "values"
+        change[merged["status"] != merged["status_old"]] = "status"
+        change[merged["_merge"] == "left_only"] = "added"
+        change[merged["_merge"] == "right_only"] = "removed"
+        merged["change"] = change
+        merged["label"] = merged["label"].fillna(merged["label_old"])
+        merged = merged.sort_values(["position", "position_old"], na_position="last")
+        if not include_unchanged:
+            merged = merged[merged["change"] != "unchanged"]
+        cols = ["change", "label", "status_old", "status", "reason_old", "reason", "source_value_old", "source_value", "target_value_old", "target_value", "ms_old", "ms", "step_key"]
+        return merged[cols].reset_index(drop=True)
+
+    def diff_bulk(self, old_run: int, new_run: int, step_key_: str) -> pd.DataFrame:
+        """Keys of one bulk step whose fail/error outcome changed.
+
+        ``change`` is ``new``, ``changed`` (status or reason), ``values`` (same outcome but
+        different source/target values) or ``resolved``.  Only non-pass keys are stored, so
+        "resolved" means the key no longer fails or errors.
+        """
+        query = """
+            SELECT CASE WHEN o.key IS NULL THEN 'new'
+                        WHEN o.status IS NOT n.status OR o.reason IS NOT n.reason THEN 'changed'
+                        ELSE 'values' END AS change,
+                   n.key, o.status AS status_old, n.status, o.reason AS reason_old, n.reason,
+                   o.source_value AS source_value_old, n.source_value,
+                   o.target_value AS target_value_old, n.target_value
+            FROM bulk_issues n LEFT JOIN bulk_issues o
+              ON o.run_id = :old AND o.step_key = n.step_key AND o.key = n.key
+            WHERE n.run_id = :new AND n.step_key = :step
+              AND (o.key IS NULL
+                   OR o.status IS NOT n.status OR o.reason IS NOT n.reason
+                   OR o.source_value IS NOT n.source_value OR o.target_value IS NOT n.target_value)
+            UNION ALL
+            SELECT 'resolved', o.key, o.status, NULL, o.reason, NULL, o.source_value, NULL, o.target_value, NULL
+            FROM bulk_issues o LEFT JOIN bulk_issues n
+              ON n.run_id = :new AND n.step_key = o.step_key AND n.key = o.key
+            WHERE o.run_id = :old AND o.step_key = :step AND n.key IS NULL
+        """
+        with closing(self._connect()) as conn:
+            return pd.read_sql_query(query, conn, params={"old": int(old_run), "new": int(new_run), "step": step_key_})
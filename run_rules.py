@@ -0,0 +1,163 @@
+"""Run a saved Analytics rule-set against CSV files, without the browser.
+
+    python run_rules.py My_Rule-set.json sales.csv stock.csv --report report.csv
+    python run_rules.py rules.json "sales.csv=/data/2024/sales_full.csv" --report out.json --workers 4
+
+Each CSV is registered under its file name (the ``file_label`` the rule-set was
+built with); use ``LABEL=PATH`` when the file on disk is named differently.
+``--history rule_history.sqlite`` appends the run to the store the page compares
+in "5. Run history".
+Exit code: 0 all steps pass, 1 any step fails or errors, 2 bad input.
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+from csv_ingest import ENCODING_CHOICES, SEPARATOR_CHOICES, read_csv_path, referenced_columns
+from rule_engine import compile_plan, iter_plan_results, key_label, run_plan
+from run_history import RunHistory, file_sha1
+
+
+def parse_file_args(items: List[str]) -> Dict[str, Path]:
+    files: Dict[str, Path] = {}
+    for item in items:
+        label, sep, path = item.partition("=")
+        if not sep:
+            path, label = item, Path(item).name
+        files[label] = Path(path)
+    return files
+
+
+def report_rows(steps: List[dict], results: List[dict]) -> List[dict]:
+    rows = []
+    for step, res in zip(steps, results):
+        src, tgt = step["source"], step["target"]
+        rows.append(
+            {
+                "step_id": step["step_id"],
+                "step_type": step.get("step_type", "compare_two_files"),
+                "source": f"{src['file_label']}[{key_label(src['filter'])}].{src['value_column']}",
+                "target": f"{tgt['file_label']}[{key_label(tgt['filter'])}].{tgt['value_column']}",
+                "operator": step["operator_block"]["operator_type"],
+                "status": res["status"],
+                "reason": res.get("reason", ""),
+                "source_value": res.get("source_value"),
+                "target_value": res.get("target_value"),
+                "source_rows": res.get("source_rows"),
+                "target_rows": res.get("target_rows"),
+            }
+        )
+    return rows
+
+
+def _json_default(value):
+    # numpy scalars -> plain numbers; anything else (timestamps, ...) as text
+    return value.item() if hasattr(value, "item") else str(value)
+
+
+def write_report(path: Path, rule_set: dict, rows: List[dict], timings: Dict[str, float]) -> None:
+    if path.suffix.lower() == ".json":
+        counts = pd.Series([r["status"] for r in rows], dtype=object).value_counts().to_dict()
+        payload = {
+            "rule_set_name": rule_set.get("rule_set_name"),
+            "generated_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "summary": {k: int(v) for k, v in counts.items()},
+            "timings_ms": {k: round(v, 3) for k, v in timings.items()},
+            "results": rows,
+        }
+        path.write_text(json.dumps(payload, ensure_ascii=False, indent=2, default=_json_default), encoding="utf-8")
+    else:
+        pd.DataFrame(rows).to_csv(path, index=False)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Run a saved Analytics rule-set over CSV files.")
+    parser.add_argument("rule_set", type=Path, help="rule-set JSON from '💾 Download Rule-set JSON'")
+    parser.add_argument("files", nargs="+", help="CSV paths, or LABEL=PATH to match the rule-set file labels")
+    parser.add_argument("--sep", choices=SEPARATOR_CHOICES, help="separator for every file (default: auto-detect)")
+    parser.add_argument("--encoding", choices=ENCODING_CHOICES, help="encoding for every file (default: auto-detect)")
+    parser.add_argument("--no-header", action="store_true", help="files have no header row")
+    parser.add_argument("--report", type=Path, help="write results to .csv or .json")
+    parser.add_argument("--details-dir", type=Path, help="write per-key results of bulk steps here as CSV")
+    parser.add_argument("--workers", type=int, default=1, help="run independent step groups in parallel")
+    parser.add_argument("--processes", action="store_true", help="use processes instead of threads for --workers")
+    parser.add_argument("--history", type=Path, help="append this run to a rule_history.sqlite store")
+    parser.add_argument("--ignore-errors", action="store_true", help="exit 0 when steps only error (no fails)")
+    args = parser.parse_args(argv)
+
+    try:
+        rule_set = json.loads(args.rule_set.read_text(encoding="utf-8"))
+        steps = rule_set["steps"]
+        # only the columns the rule-set reads are loaded; big files are streamed in chunks
+        files = parse_file_args(args.files)
+        dfs = {
+            label: read_csv_path(
+                path,
+                sep=args.sep,
+                header=not args.no_header,
+                usecols=referenced_columns(steps, label),
+                encoding=args.encoding,
+            )
+            for label, path in files.items()
+        }
+    except (OSError, ValueError, KeyError, pd.errors.ParserError) as exc:
+        print(f"error: {exc}", file=sys.stderr)
+        return 2
+
+    missing = sorted({step[side]["file_label"] for step in steps for side in ("source", "target")} - dfs.keys())
+    if missing:
+        print(f"warning: no CSV given for {', '.join(missing)} (steps using them will error)", file=sys.stderr)
+
+    started = time.perf_counter()
+    if args.workers > 1:
+        results: List[Optional[dict]] = [None] * len(steps)
+        timings: Dict[str, float] = {}
+        for positions, unit_results, unit_timings in iter_plan_results(
+            steps, dfs, workers=args.workers, use_processes=args.processes
+        ):
+            for pos, res in zip(positions, unit_results):
+                results[pos] = res
+            for stage, ms in unit_timings.items():
+                timings[stage] = timings.get(stage, 0.0) + ms
+    else:
+        results, timings = run_plan(compile_plan(steps), dfs)
+    timings["wall"] = (time.perf_counter() - started) * 1000
+
+    rows = report_rows(steps, results)
+    for row in rows:
+        print(f"[{row['status']:>5}] step {row['step_id']}: {row['source']} vs {row['target']} ({row['operator']}) - {row['reason']}")
+    statuses = [r["status"] for r in rows]
+    n_fail, n_err = statuses.count("fail"), statuses.count("error")
+    print(f"{statuses.count('pass')} pass, {n_fail} fail, {n_err} error in {timings['wall']:.0f} ms")
+
+    if args.report:
+        write_report(args.report, rule_set, rows, timings)
+    if args.history:
+        run_id = RunHistory(args.history).record_run(
+            steps,
+            results,
+            {label: file_sha1(path) for label, path in files.items()},
+            timings,
+            rule_set_name=rule_set.get("rule_set_name"),
+            origin="cli",
+        )
+        print(f"recorded run #{run_id} in {args.history}")
+    if args.details_dir:
+        args.details_dir.mkdir(parents=True, exist_ok=True)
+        for step, res in zip(steps, results):
+            if res.get("details") is not None:
+                res["details"].to_csv(args.details_dir / f"step_{step['step_id']}_details.csv", index=False)
+
+    if n_fail or (n_err and not args.ignore_errors):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# the app's modules live at the repo root (Streamlit runs from there)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,45 @@
+import io
+import os
+
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+
+from mongo_users import export_to_file, import_users, user_doc, validate_user  # noqa: E402
+
+
+@pytest.fixture
+def collection():
+    users = mongomock.MongoClient()["test_db"]["users"]
+    users.insert_many([user_doc("สมชาย", 30, "Bangkok"), user_doc("Suda", 41, "เชียงใหม่")])
+    return users
+
+
+@pytest.mark.parametrize("fmt", ["csv", "jsonl"])
+def test_export_file_is_what_download_button_accepts(collection, fmt):
+    path, rows = export_to_file(collection, fmt)
+    try:
+        # the page passes exactly this object to st.download_button
+        with open(path, "rb") as export_file:
+            assert isinstance(export_file, io.BufferedReader)
+            data = export_file.read()
+    finally:
+        os.remove(path)
+    assert rows == 2
+    text = data.decode("utf-8")
+    assert "สมชาย" in text and "Suda" in text
+    if fmt == "csv":
+        assert text.splitlines()[0] == "name,age,city"
+
+
+@pytest.mark.parametrize("age", ["inf", "-inf", "1e400", "nan", "abc", None])
+def test_validate_user_reports_bad_age_instead_of_raising(age):
+    doc, error = validate_user({"name": "a", "city": "Bangkok", "age": age})
+    assert doc is None and error
+
+
+def test_import_keeps_going_past_bad_rows(collection):
+    rows = [(2, {"name": "x", "city": "Bangkok", "age": "inf"}), (3, {"name": "y", "city": "Bangkok", "age": "20"})]
+    report = import_users(collection, rows, batch_size=1)
+    assert report["inserted"] == 1
+    assert [e["row"] for e in report["errors"]] == [2]
@@ -0,0 +1,149 @@
+import threading
+import time
+
+import pytest
+
+from ollama_pool import OllamaBusyError, OllamaCancelled, OllamaPool
+
+
+class FakeStreamingClient:
+    """``ollama.Client`` stand-in: streams the last message word by word.
+
+    A message whose content is ``"hold"`` blocks mid-stream until ``release`` is set,
+    ``"boom"`` fails before streaming and ``"boom-mid"`` fails after the first chunk.
+    """
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.calls = []
+        self.generated = 0
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def chat(self, model, messages, stream=True, **_):
+        content = messages[-1]["content"]
+        self.calls.append(content)
+        if content == "boom":
+            raise RuntimeError("server error")
+        return self._stream(content)
+
+    def _stream(self, content):
+        with self._lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            yield {"message": {"content": "first "}}
+            if content == "hold":
+                assert self.release.wait(5)
+            if content == "boom-mid":
+                raise RuntimeError("connection reset")
+            for word in content.split():
+                yield {"message": {"content": word + " "}}
+        finally:
+            with self._lock:
+                self.active -= 1
+
+    def generate(self, **_):
+        self.generated += 1
+
+
+def ask(pool, text, **kwargs):
+    return pool.stream_chat([{"role": "user", "content": text}], **kwargs)
+
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_rejects_when_queue_is_full():
+    client = FakeStreamingClient()
+    pool = OllamaPool(client=client, max_concurrent=1, max_queue=0)
+    holder = ask(pool, "hold")
+    assert next(holder) == "first "
+    with pytest.raises(OllamaBusyError):
+        next(ask(pool, "second"))
+    client.release.set()
+    list(holder)
+    assert pool.stats()["active"] == 0
+
+
+def test_waiting_requests_run_in_fifo_order():
+    client = FakeStreamingClient()
+    pool = OllamaPool(client=client, max_concurrent=1, max_queue=5)
+    holder = ask(pool, "hold")
+    next(holder)
+    threads = []
+    for i in range(3):
+        thread = threading.Thread(target=lambda i=i: list(ask(pool, f"q{i}")))
+        thread.start()
+        threads.append(thread)
+        wait_for(lambda i=i: pool.stats()["waiting"] == i + 1)
+    client.release.set()
+    list(holder)
+    for thread in threads:
+        thread.join(5)
+    assert client.calls == ["hold", "q0", "q1", "q2"]
+    assert client.peak == 1
+
+
+def test_cancel_while_queued_and_mid_stream():
+    client = FakeStreamingClient()
+    pool = OllamaPool(client=client, max_concurrent=1, max_queue=1)
+    holder = ask(pool, "hold")
+    next(holder)
+
+    queued_cancel = threading.Event()
+    outcome = []
+
+    def queued():
+        try:
+            list(ask(pool, "never", cancel=queued_cancel))
+        except OllamaCancelled:
+            outcome.append("cancelled")
+
+    thread = threading.Thread(target=queued)
+    thread.start()
+    wait_for(lambda: pool.stats()["waiting"] == 1)
+    queued_cancel.set()
+    thread.join(5)
+    assert outcome == ["cancelled"]
+    assert pool.stats() == {"active": 1, "waiting": 0, "max_concurrent": 1}
+
+    client.release.set()
+    list(holder)
+    stream_cancel = threading.Event()
+    chunks = []
+    for chunk in ask(pool, "a b c d", cancel=stream_cancel):
+        chunks.append(chunk)
+        stream_cancel.set()
+    assert chunks == ["first "]
+    assert "never" not in client.calls
+    assert pool.stats()["active"] == 0
+
+
+@pytest.mark.parametrize("text", ["boom", "boom-mid"])
+def test_slot_is_released_on_error(text):
+    client = FakeStreamingClient()
+    pool = OllamaPool(client=client, max_concurrent=1, max_queue=0)
+    with pytest.raises(RuntimeError):
+        list(ask(pool, text))
+    assert pool.stats()["active"] == 0
+    assert list(ask(pool, "ok")) == ["first ", "ok "]
+
+
+def test_warm_takes_a_slot():
+    client = FakeStreamingClient()
+    pool = OllamaPool(client=client, max_concurrent=1, max_queue=0)
+    holder = ask(pool, "hold")
+    next(holder)
+    assert pool.warm() is False
+    assert client.generated == 0
+    client.release.set()
+    list(holder)
+    assert pool.warm() is True
+    assert client.generated == 1
+    assert pool.stats()["active"] == 0
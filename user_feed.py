@@ -0,0 +1,201 @@
+"""Live per-city summary of the ``users`` collection, shared by every page session.
+
+One snapshot is aggregated at start (``mongo_users.city_summary``); after that a
+background thread follows a change stream and patches the counts per event, so writes
+from any session show up without re-reading the collection.  Where change streams are
+unavailable (standalone mongod, mongomock) it polls the indexed ``updated_at`` stamp
+and the collection's estimated count, and re-aggregates only when either moved.
+"""
+
+import logging
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+from mongo_users import city_summary
+
+log = logging.getLogger(__name__)
+
+POLL_INTERVAL_SECONDS = 5.0
+CATCH_UP_SECONDS = 0.5
+SUMMARY_FIELDS = ("city", "age", "province", "location")
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class LiveSummary:
+    """Thread-safe ``(city, province) -> [count, age_sum, age_n, coordinates]`` kept current from change events."""
+
+    def __init__(self, collection, poll_interval: float = POLL_INTERVAL_SECONDS, use_change_stream: bool = True):
+        self.collection = collection
+        self.poll_interval = poll_interval
+        self.use_change_stream = use_change_stream
+        self.mode = "starting"
+        self.revision = 0
+        self._cities: Dict[Tuple[Any, Any], List[Any]] = {}
+        self._changed = threading.Condition()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._resume_token = None
+        self._last_stamp: Optional[datetime] = None
+        self._last_count = -1
+
+    # -----------------------------
+    # Reading
+    # -----------------------------
+    def rows(self) -> List[dict]:
+        """Same shape as ``city_summary``."""
+        with self._changed:
+            return [
+                {"city": city, "province": province, "coordinates": coords, "count": int(c), "age_sum": s, "age_n": int(n)}
+                for (city, province), (c, s, n, coords) in self._cities.items()
+                if c > 0
+            ]
+
+    def catch_up(self, timeout: float = CATCH_UP_SECONDS) -> None:
+        """Make this session's own write visible before it reruns."""
+        if self.mode == "polling":
+            self.poll_once()
+            return
+        with self._changed:
+            seen = self.revision
+            self._changed.wait_for(lambda: self.revision != seen, timeout=timeout)
+
+    # -----------------------------
+    # Lifecycle
+    # -----------------------------
+    def start(self) -> "LiveSummary":
+        if self.use_change_stream:
+            self._enable_pre_images()
+        self._last_stamp, self._last_count = self._poll_marker()
+        self.resync()
+        self._thread = threading.Thread(target=self._run, name="users-live-summary", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def resync(self) -> None:
+        """Replace the counts with a fresh ``$group`` snapshot."""
+        rows = city_summary(self.collection)
+        with self._changed:
+            self._cities = {
+                (r.get("city"), r.get("province")): [r["count"], r["age_sum"], r["age_n"], r.get("coordinates")] for r in rows
+            }
+            self._bump()
+
+    def _bump(self) -> None:
+        # caller holds self._changed
+        self.revision += 1
+        self._changed.notify_all()
+
+    def _run(self) -> None:
+        if self.use_change_stream:
+            try:
+                self.mode = "change_stream"
+                self._follow_stream()
+                return
+            except (OperationFailure, NotImplementedError, TypeError) as exc:
+                # no replica set, or a stand-in such as mongomock that has no watch()
+                log.info("change streams unavailable (%s); polling every %.0fs", exc, self.poll_interval)
+        self.mode = "polling"
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.poll_once()
+            except PyMongoError as exc:  # keep serving the last snapshot
+                log.warning("users summary poll failed: %s", exc)
+
+    # -----------------------------
+    # Change stream
+    # -----------------------------
+    def _follow_stream(self) -> None:
+        while not self._stop.is_set():
+            try:
+                with self.collection.watch(
+                    full_document="updateLookup",
+                    full_document_before_change="whenAvailable",
+                    resume_after=self._resume_token,
+                    max_await_time_ms=1000,
+                ) as stream:
+                    while not self._stop.is_set():
+                        event = stream.try_next()
+                        if event is None:
+                            continue
+                        self._resume_token = stream.resume_token
+                        self.apply(event)
+            except OperationFailure:
+                if self._resume_token is None:
+                    raise
+                # resume point fell off the oplog: start over from a fresh snapshot
+                self._resume_token = None
+                self.resync()
+            except PyMongoError as exc:
+                log.warning("users change stream interrupted: %s", exc)
+                self._stop.wait(1.0)
+
+    def _enable_pre_images(self) -> None:
+        """Ask MongoDB 6+ to keep pre-images so updates/deletes patch instead of re-aggregating."""
+        try:
+            self.collection.database.command(
+                {"collMod": self.collection.name, "changeStreamPreAndPostImages": {"enabled": True}}
+            )
+        except (PyMongoError, NotImplementedError) as exc:  # older server, no privilege, stand-in
+            log.info("change stream pre-images not enabled: %s", exc)
+
+    def _add(self, doc: Optional[dict], sign: int) -> None:
+        location = doc.get("location") or {}
+        entry = self._cities.setdefault((doc.get("city"), doc.get("province")), [0, 0, 0, location.get("coordinates")])
+        entry[0] += sign
+        if _is_number(doc.get("age")):
+            entry[1] += sign * doc["age"]
+            entry[2] += sign
+
+    def apply(self, event: dict) -> None:
+        """Patch the counts from one change event; re-aggregate when the event lacks the old values."""
+        op = event.get("operationType")
+        before = event.get("fullDocumentBeforeChange")
+        after = event.get("fullDocument")
+        if op in ("update", "replace"):
+            desc = event.get("updateDescription") or {}
+            touched = set(desc.get("updatedFields", {})) | set(desc.get("removedFields", []))
+            if op == "update" and not touched & set(SUMMARY_FIELDS):
+                return
+        if op == "insert" and after is not None:
+            with self._changed:
+                self._add(after, +1)
+                self._bump()
+        elif op == "delete" and before is not None:
+            with self._changed:
+                self._add(before, -1)
+                self._bump()
+        elif op in ("update", "replace") and before is not None and after is not None:
+            with self._changed:
+                self._add(before, -1)
+                self._add(after, +1)
+                self._bump()
+        else:
+            # no pre-image (collection without changeStreamPreAndPostImages), drop, rename, invalidate
+            self.resync()
+
+    # -----------------------------
+    # Polling fallback
+    # -----------------------------
+    def _poll_marker(self):
+        """(newest ``updated_at``, estimated count): an index seek plus collection metadata."""
+        newest = self.collection.find_one({"updated_at": {"$ne": None}}, {"updated_at": 1}, sort=[("updated_at", -1)])
+        return (newest or {}).get("updated_at"), self.collection.estimated_document_count()
+
+    def poll_once(self) -> bool:
+        """Re-aggregate if anything was written since the last look; returns whether it did."""
+        marker = self._poll_marker()
+        if marker == (self._last_stamp, self._last_count):
+            return False
+        self._last_stamp, self._last_count = marker
+        self.resync()
+        return True
+